@@ -0,0 +1,7 @@
+'''
+Benchmarks of the resampling, filtering, velocity, onset detection and descriptor functions
+using synthetic reaching trajectories (no data needed).
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --output results.json
+'''
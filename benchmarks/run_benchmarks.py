@@ -0,0 +1,243 @@
+'''
+Time every processing stage and descriptor over trajectories of different lengths and save the results
+as JSON so that runs from different commits can be compared.
+
+    python -m benchmarks.run_benchmarks --sizes 100 1000 10000 --output new.json
+    python -m benchmarks.run_benchmarks --compare old.json new.json
+'''
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import scipy
+
+from resample import resample_splines, resample_splines_array
+from filter import butter_lowpass_filter, filter_session
+from derivative import calculate_velocity, calculate_velocity_session
+from movement_onset_detection import onset_detection
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+from total_curvature import total_curvature_2d, total_curvature_3d
+from maximal_log_ratio import maximal_log_ratio_2d, maximal_log_ratio_3d
+from trajectory_geometry import TrajectoryGeometry
+from deviation_index import DeviationIndex
+from length_buckets import LengthBuckets
+from ragged_trajectories import RaggedTrajectories, batch_maximum_deviation, batch_total_curvature, \
+    batch_maximal_log_ratio
+from benchmarks.synthetic import reaching_trajectory, reaching_session
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000, 1000000)
+FS = 90
+
+TARGET_1 = np.array([-0.25, 0.65, 1])
+TARGET_2 = np.array([0.25, 0.65, 1])
+
+
+def _trial(n, seed):
+    t, x, y, z, _ = reaching_trajectory(n, FS, seed=seed)
+    return t, x, y, z
+
+
+def _setup_resample(n, seed):
+    t, x, y, z, _ = reaching_trajectory(n, FS, jitter=0.2, seed=seed)
+    return lambda: resample_splines(t, x, y, z)
+
+
+def _setup_resample_array(n, seed):
+    t, x, y, z, _ = reaching_trajectory(n, FS, jitter=0.2, seed=seed)
+    out = np.empty((n, 3))
+    return lambda: resample_splines_array(t, x, y, z, out=out)
+
+
+def _setup_filter(n, seed):
+    _, x, _, _ = _trial(n, seed)
+    return lambda: butter_lowpass_filter(x, 10, FS, 2)
+
+
+def _setup_velocity(n, seed):
+    _, x, _, _ = _trial(n, seed)
+    return lambda: calculate_velocity(1 / FS, x)
+
+
+def _setup_onset(n, seed):
+    t, x, _, z = _trial(n, seed)
+    x = butter_lowpass_filter(x, 10, FS, 2)
+    z = butter_lowpass_filter(z, 10, FS, 2)
+    vx = calculate_velocity(1 / FS, x)
+    vz = calculate_velocity(1 / FS, z)
+    m = int(0.1 * FS) - 1
+    return lambda: onset_detection(m, x, z, t, vx, vz, vel_th=0.6)
+
+
+def _setup_descriptor(function, dimensions, targets=False):
+    def setup(n, seed):
+        _, x, y, z = _trial(n, seed)
+        args = (x, z) if dimensions == 2 else (x, z, y)
+        if targets:
+            args += (TARGET_1[:dimensions], TARGET_2[:dimensions])
+        return lambda: function(*args)
+    return setup
+
+
+def _setup_geometry(n, seed):
+    _, x, y, z = _trial(n, seed)
+    return lambda: TrajectoryGeometry(x, z, y).descriptors(TARGET_1, TARGET_2)
+
+
+def _setup_deviation_index(dimensions):
+    def setup(n, seed):
+        _, x, y, z = _trial(n, seed)
+        index = DeviationIndex(x, z) if dimensions == 2 else DeviationIndex(x, z, y)
+        # Slice starting at a moving onset
+        return lambda: index.maximum_deviation(n // 10)
+    return setup
+
+
+def _setup_batch(function, targets=False):
+    def setup(n, seed):
+        # n samples in total, split in trials of about 200 samples
+        trials = reaching_session(max(1, n // 200), min(n, 200), FS, seed=seed)
+        ragged = RaggedTrajectories.from_trials([np.column_stack((x, z, y)) for _, x, y, z, _ in trials])
+        if targets:
+            return lambda: function(ragged, TARGET_1, TARGET_2)
+        return lambda: function(ragged)
+    return setup
+
+
+def _setup_session_kernels(max_waste):
+    def setup(n, seed):
+        # Filter and velocity of n samples in total, split in trials of about 200 samples
+        trials = reaching_session(max(1, n // 200), min(n, 200), FS, seed=seed)
+        ragged = RaggedTrajectories.from_trials([np.column_stack((x, y, z)) for _, x, y, z, _ in trials])
+        buckets = LengthBuckets(ragged.lengths, max_waste)
+        return lambda: calculate_velocity_session(filter_session(ragged, 10, FS, 2, buckets=buckets), 1 / FS,
+                                                  buckets=buckets)
+    return setup
+
+
+BENCHMARKS = {
+    'resample_splines': _setup_resample,
+    'resample_splines_array': _setup_resample_array,
+    'butter_lowpass_filter': _setup_filter,
+    'calculate_velocity': _setup_velocity,
+    'onset_detection': _setup_onset,
+    'maximum_deviation_2d': _setup_descriptor(maximum_deviation_2d, 2),
+    'maximum_deviation_3d': _setup_descriptor(maximum_deviation_3d, 3),
+    'total_curvature_2d': _setup_descriptor(total_curvature_2d, 2),
+    'total_curvature_3d': _setup_descriptor(total_curvature_3d, 3),
+    'maximal_log_ratio_2d': _setup_descriptor(maximal_log_ratio_2d, 2, targets=True),
+    'maximal_log_ratio_3d': _setup_descriptor(maximal_log_ratio_3d, 3, targets=True),
+    'TrajectoryGeometry': _setup_geometry,
+    'DeviationIndex_2d': _setup_deviation_index(2),
+    'DeviationIndex_3d': _setup_deviation_index(3),
+    'batch_maximum_deviation': _setup_batch(batch_maximum_deviation),
+    'batch_total_curvature': _setup_batch(batch_total_curvature),
+    'batch_maximal_log_ratio': _setup_batch(batch_maximal_log_ratio, targets=True),
+    'session_kernels_equal_length': _setup_session_kernels(0),
+    'session_kernels_buckets': _setup_session_kernels(0.1),
+}
+
+
+def time_call(function, min_time: float = 0.2, max_repeats: int = 100) -> list:
+    '''
+    Call function until min_time seconds have elapsed or max_repeats calls have been made
+    :return: wall time of every call (s)
+    '''
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats and (not times or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, sizes=DEFAULT_SIZES, seed: int = 0, min_time: float = 0.2, max_repeats: int = 100,
+        budget: float = 10.0, verbose: bool = True) -> dict:
+    '''
+    Run the benchmarks
+    :param names: benchmarks to run (all if None)
+    :param sizes: number of samples
+    :param seed: seed of the synthetic trajectories
+    :param min_time: minimum time spent on each (benchmark, size)
+    :param max_repeats: maximum number of calls for each (benchmark, size)
+    :param budget: larger sizes of a benchmark are skipped once a single call takes longer than this (s)
+    :param verbose: print each result
+    :return: machine-readable results
+    '''
+    results = []
+    for name in names or BENCHMARKS:
+        skip = False
+        for n in sizes:
+            if skip:
+                results.append({'name': name, 'n': int(n), 'skipped': True})
+                continue
+            times = time_call(BENCHMARKS[name](int(n), seed), min_time, max_repeats)
+            result = {'name': name, 'n': int(n), 'repeats': len(times), 'best': min(times),
+                      'median': float(np.median(times)), 'mean': float(np.mean(times))}
+            results.append(result)
+            skip = min(times) > budget
+            if verbose:
+                print("{:<26} n={:<8d} best={:.3e} s  median={:.3e} s  ({} calls)".format(
+                    name, n, result['best'], result['median'], result['repeats']))
+
+    return {
+        'commit': _commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'seed': seed,
+        'results': results
+    }
+
+
+def compare(old: dict, new: dict):
+    '''
+    Print the speed-up of new with respect to old for every (benchmark, size) in both
+    '''
+    old_results = {(r['name'], r['n']): r for r in old['results'] if not r.get('skipped')}
+    print("{} -> {}".format(old.get('commit'), new.get('commit')))
+    for r in new['results']:
+        key = (r['name'], r['n'])
+        if r.get('skipped') or key not in old_results:
+            continue
+        ratio = old_results[key]['best'] / r['best']
+        print("{:<26} n={:<8d} {:8.2f}x {}".format(r['name'], r['n'], ratio, "REGRESSION" if ratio < 0.9 else ""))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks using synthetic reaching trajectories")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--max-repeats", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=10.0)
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            compare(json.load(f_old), json.load(f_new))
+    else:
+        output = run(args.only, args.sizes, args.seed, args.min_time, args.max_repeats, args.budget)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(output, file, indent=2)
@@ -0,0 +1,73 @@
+'''
+Deterministic generator of synthetic reaching trajectories: a static pre-movement phase followed by a
+minimum-jerk reach with lateral curvature, a short static phase at the end and measurement noise.
+Coordinates follow the test scripts: x (lateral), y (height) and z (forward).
+'''
+
+import numpy as np
+
+
+def minimum_jerk(tau):
+    '''
+    Minimum-jerk position profile (0 before the movement, 1 after)
+    :param tau: normalized time (t - onset) / duration
+    :return: normalized position
+    '''
+    tau = np.clip(tau, 0, 1)
+    return 10 * tau ** 3 - 15 * tau ** 4 + 6 * tau ** 5
+
+
+def reaching_trajectory(n: int, fs: float = 90.0, movement_time: float = 1.0, reach=(0.25, 0.0, 0.4),
+                        curvature: float = 0.05, noise: float = 2e-4, jitter: float = 0.0, seed: int = 0):
+    '''
+    One synthetic trial
+    :param n: number of samples
+    :param fs: sampling frequency
+    :param movement_time: duration of the reach (at most half of the trial)
+    :param reach: displacement along x, y, z
+    :param curvature: maximum lateral deviation from the straight reach (sign gives the side)
+    :param noise: standard deviation of the measurement noise
+    :param jitter: random deviation of the sampling times as a fraction of the period (< 0.5, 0 is uniform)
+    :param seed: seed of the random generator
+    :return:
+        - t: time
+        - x, y, z: position
+        - t_onset: true movement onset
+    '''
+    rng = np.random.default_rng(seed)
+    step = 1 / fs
+    t = np.arange(n) * step
+    if jitter:
+        t[1:-1] += rng.uniform(-jitter, jitter, n - 2) * step
+
+    duration_ = t[-1]
+    duration = min(movement_time, 0.5 * duration_)
+    t_onset = duration_ - duration - min(0.2, 0.1 * duration_)
+
+    s = minimum_jerk((t - t_onset) / duration)
+    bump = np.sin(np.pi * s)
+
+    x = reach[0] * s + curvature * bump
+    y = reach[1] * s + 0.2 * abs(curvature) * bump
+    z = reach[2] * s
+    x, y, z = (c + noise * rng.standard_normal(n) for c in (x, y, z))
+
+    return t, x, y, z, t_onset
+
+
+def reaching_session(n_trials: int, n: int, fs: float = 90.0, seed: int = 0, **kwargs) -> list:
+    '''
+    Several synthetic trials with different curvature sides and random lengths around n
+    :param n_trials: number of trials
+    :param n: mean number of samples per trial
+    :param fs: sampling frequency
+    :param seed: seed of the random generator
+    :param kwargs: other arguments of reaching_trajectory
+    :return: list of (t, x, y, z, t_onset)
+    '''
+    rng = np.random.default_rng(seed)
+    lengths = np.maximum(rng.integers(int(0.8 * n), int(1.2 * n) + 1, n_trials), 3)
+    sides = rng.choice([-1, 1], n_trials)
+    curvature = kwargs.pop('curvature', 0.05)
+    return [reaching_trajectory(int(n_i), fs, curvature=side * curvature, seed=seed + i + 1, **kwargs)
+            for i, (n_i, side) in enumerate(zip(lengths, sides))]
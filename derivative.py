@@ -2,12 +2,101 @@
 Calculate velocity using a Smooth Noise-Robust Differentiator
 Three points have been added before and after the actual trajectory
 to be able to reasonably calculate the derivative
+
+Wider kernels (N = 9, 11) of the same family are available,
+http://www.holoborodko.com/pavel/numerical-methods/numerical-derivative/smooth-low-noise-differentiators/
+the (N - 1) / 2 samples added before and after the trajectory repeat the first and last samples.
 '''
 
+from functools import lru_cache
+from math import comb
+
 import numpy as np
+from scipy.ndimage import correlate1d
+
+from ragged_trajectories import RaggedTrajectories
+from length_buckets import LengthBuckets
+from instrumentation import instrumented
+
+
+@lru_cache(maxsize=None)
+def _holoborodko_kernel(n: int, order: int = 1) -> np.array:
+    '''
+    Weights of the smooth noise-robust differentiator (central, exact on polynomials up to 2nd degree)
+    :param n: length of the filter (5, 7, 9 or 11)
+    :param order: order of the derivative (kernel convolved with itself), the length becomes order * (n - 1) + 1
+    :return: weights for a unit step, w[j] multiplies the sample j - (len(w) - 1) / 2 positions away
+    '''
+    if n not in (5, 7, 9, 11):
+        raise ValueError("n must be 5, 7, 9 or 11")
+    m = (n - 3) // 2
+    half = (n - 1) // 2
+    c = [(comb(2 * m, m - k + 1) - (comb(2 * m, m - k - 1) if m - k - 1 >= 0 else 0)) / 2 ** (2 * m + 1)
+         for k in range(1, half + 1)]
+    kernel = np.concatenate((-np.array(c[::-1]), [0], c))
+    weights = kernel
+    for _ in range(order - 1):
+        weights = np.convolve(weights, kernel)
+    return weights
+
+
+@instrumented
+def calculate_velocity(step, x, n=7, axis=0, out=None):
+    '''
+    Velocity using a Smooth Noise-Robust Differentiator
+    :param step: sampling period
+    :param x: positions, e.g. (n_samples,) or (n_samples, 3) along axis 0
+    :param n: length of the filter (5, 7, 9 or 11). 7 is the original differentiator
+    :param axis: time axis
+    :param out: buffer for the result (same shape as x)
+    :return: velocity
+    '''
+    if out is not None:
+        out = out[None]
+    return calculate_derivatives(step, x, n, order=1, axis=axis, out=out)[0]
+
+
+@instrumented
+def calculate_derivatives(step, x, n=7, order=2, axis=0, out=None):
+    '''
+    Velocity and higher derivatives (acceleration, jerk) from the same edge-padded data
+        The k-th derivative uses the differentiator applied k times (one combined kernel)
+    :param step: sampling period
+    :param x: positions, e.g. (n_samples,) or (n_samples, 3) along axis 0
+    :param n: length of the filter (5, 7, 9 or 11)
+    :param order: highest derivative (1: velocity, 2: acceleration, 3: jerk)
+    :param axis: time axis
+    :param out: buffer for the result (order,) + x.shape
+    :return: derivatives, out[k - 1] is the k-th derivative
+    '''
+    x = np.asarray(x, dtype=float)
+    if out is None:
+        out = np.empty((order,) + x.shape)
+    elif out.shape != (order,) + x.shape:
+        raise ValueError("out must have shape {}".format((order,) + x.shape))
+
+    for k in range(1, order + 1):
+        # 'nearest' repeats the first and last samples
+        correlate1d(x, _holoborodko_kernel(n, k), axis=axis, output=out[k - 1], mode='nearest')
+        out[k - 1] /= step ** k
+    return out
 
 
-def calculate_velocity(step, x):
-    x = np.append(x[0] * np.ones(3), np.append(x, x[-1] * np.ones(3)))
-    v = (-x[:-6] - 4 * x[1:-5] - 5 * x[2:-4] + 5 * x[4:-2] + 4 * x[5:-1] + x[6:]) / (32 * step)
-    return v
\ No newline at end of file
+@instrumented
+def calculate_velocity_session(ragged: RaggedTrajectories, step, n=7, order=1,
+                               buckets: LengthBuckets = None) -> list:
+    '''
+    Derivatives of every trial of a session, trials are differentiated together by blocks of similar length
+        (the padding repeats the last sample like mode 'nearest', so it does not change the derivatives)
+    :param ragged: trajectories
+    :param step: sampling period
+    :param n: length of the filter (5, 7, 9 or 11)
+    :param order: highest derivative (1: velocity, 2: acceleration, 3: jerk)
+    :param buckets: blocks of trials (see length_buckets). Trials of equal length if None
+    :return: one RaggedTrajectories per derivative (same offsets)
+    '''
+    if buckets is None:
+        buckets = LengthBuckets(ragged.lengths, max_waste=0)
+    derivatives = buckets.map(lambda block, lengths: calculate_derivatives(step, block, n, order, axis=1), ragged,
+                              out=np.zeros((order,) + ragged.positions.shape))
+    return [RaggedTrajectories(d, ragged.offsets) for d in derivatives]
@@ -0,0 +1,229 @@
+'''
+Index of a trajectory for repeated maximum deviation queries on slices [start:stop]
+(e.g. when the onset index, or the end of the movement, changes).
+
+The sample with the maximum perpendicular distance to the line between the first and the last sample
+of a slice is on the boundary of the convex hull of the samples in between. The samples are split in blocks
+organised as a segment tree and the convex hull of every node is precomputed, so a slice is covered
+by O(log n) hulls plus at most two partial blocks at its ends:
+    - 2D: hulls by monotone chain. The extreme vertices of a hull in the directions normal to the line
+      are found by binary search on the angles of its edges, O(log^2 n) per query.
+    - 3D: hulls by scipy.spatial.ConvexHull (qhull). The distance is evaluated on every vertex of the
+      covering hulls, so a query is sub-linear only when the hulls have fewer vertices than samples
+      (which is not the case of a perfectly convex space curve).
+Several samples are at the maximum distance when they are repeated or on an edge parallel to the line,
+so the hulls keep the samples on their boundary that are not vertices (on an edge, or on a face in 3D)
+and all of them are candidates. The distances of the candidates are calculated with the same functions as
+maximum_deviation_2d/3d and the first maximum is taken in the order of the samples, so the results are the
+same as maximum_deviation_*(x_tr[start:stop], ...). The exception is a NaN of maximum_deviation_3d (a sample
+equal to the first one, or on the line with the argument of arccos rounded out of range), which is only
+returned if that sample is a candidate, otherwise the result is the farthest sample.
+'''
+
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+from maximum_deviation import _get_angle_2d, _get_angle_3d, _get_sign_3d
+
+_TWO_PI = 2 * np.pi
+
+
+def _monotone_chain(points: np.array, indexes: np.array) -> np.array:
+    '''
+    Boundary of the convex hull of two-dimensional points (Andrew's monotone chain)
+    :param points: all samples (n, 2)
+    :param indexes: samples of the hull (distinct points)
+    :return: indexes of the samples on the boundary in counterclockwise order (vertices and collinear samples),
+        from the lowest sample in lexicographic order (which is a vertex)
+    '''
+    order = indexes[np.lexsort((points[indexes, 1], points[indexes, 0]))]
+    if order.size < 3:
+        return order
+    xy = points[order].tolist()
+
+    def chain(sequence):
+        hull = []
+        for k in sequence:
+            # Pop while the last two samples and k turn clockwise (the collinear samples are kept)
+            while len(hull) >= 2 and ((xy[hull[-1]][0] - xy[hull[-2]][0]) * (xy[k][1] - xy[hull[-2]][1]) -
+                                      (xy[hull[-1]][1] - xy[hull[-2]][1]) * (xy[k][0] - xy[hull[-2]][0])) < 0:
+                hull.pop()
+            hull.append(k)
+        return hull
+
+    lower = chain(range(order.size))
+    upper = chain(reversed(range(order.size)))
+    return order[lower[:-1] + upper[:-1]]
+
+
+class _Hull2D:
+    '''
+    Convex polygon with the angles of its edges for extreme vertex queries
+    '''
+
+    def __init__(self, points: np.array, indexes: np.array):
+        # One sample per distinct point, the repeated samples are on the boundary with it
+        order = indexes[np.lexsort((points[indexes, 1], points[indexes, 0]))]
+        new = np.ones(order.size, dtype=bool)
+        new[1:] = np.any(points[order[1:]] != points[order[:-1]], axis=1)
+        repeats = {}
+        if not new.all():
+            starts = np.flatnonzero(new)
+            repeats = {int(group[0]): group.tolist() for group in np.split(order, starts[1:]) if group.size > 1}
+
+        boundary = _monotone_chain(points, order[new])
+        p = points[boundary]
+        i = np.arange(boundary.size)
+        u, w = p - p[i - 1], p[(i + 1) % boundary.size] - p
+        # Vertices: the boundary turns counterclockwise (none if all the samples are on one line)
+        corners = np.flatnonzero(u[:, 0] * w[:, 1] - u[:, 1] * w[:, 0] > 0)
+        if corners.size > 2:
+            if corners[0]:
+                # Start at a vertex
+                boundary, corners = np.roll(boundary, -corners[0]), corners - corners[0]
+            vertices = boundary[corners]
+            edges = points[vertices[(np.arange(corners.size) + 1) % corners.size]] - points[vertices]
+            # Counterclockwise: the angles increase by less than pi from one edge to the next
+            self.angles = np.unwrap(np.arctan2(edges[:, 1], edges[:, 0]))
+            # Samples of every edge, ends included
+            closed = np.append(boundary, boundary[0])
+            bounds = np.append(corners, boundary.size).tolist()
+            self.edges = [closed[a:b + 1] for a, b in zip(bounds[:-1], bounds[1:])]
+            self.vertices = boundary
+            if repeats:
+                def expand(samples):
+                    return np.array([r for sample in samples.tolist() for r in repeats.get(sample, (sample,))])
+                self.edges = [expand(edge) for edge in self.edges]
+                self.vertices = expand(boundary)
+        else:
+            # Collinear samples, all of them are on the boundary
+            self.angles = None
+            self.vertices = indexes
+
+    def extreme(self, direction: np.array) -> np.array:
+        '''
+        :param direction: (2,)
+        :return: samples that can maximize the projection on direction (the extreme vertex and the samples
+            of its two edges)
+        '''
+        if self.angles is None:
+            return self.vertices
+        h = len(self.edges)
+        # The extreme vertex is where the edges turn past the tangent direction
+        tangent = np.arctan2(direction[1], direction[0]) + np.pi / 2
+        tangent = self.angles[0] + np.mod(tangent - self.angles[0], _TWO_PI)
+        k = np.searchsorted(self.angles, tangent)
+        return np.concatenate((self.edges[(k - 1) % h], self.edges[k % h]))
+
+
+class _Hull3D:
+
+    def __init__(self, points: np.array, indexes: np.array):
+        try:
+            # Qc: samples on the facets that are not vertices
+            hull = ConvexHull(points[indexes], qhull_options='Qc')
+            self.vertices = np.unique(indexes[np.concatenate((hull.vertices, hull.coplanar[:, 0]))])
+        except (QhullError, ValueError):
+            # Too few or coplanar samples
+            self.vertices = indexes
+
+    def extreme(self, direction=None) -> np.array:
+        return self.vertices
+
+
+class DeviationIndex:
+    '''
+    Maximum deviation of any slice of a trajectory (see maximum_deviation_2d and maximum_deviation_3d)
+    '''
+
+    def __init__(self, x_tr, y_tr, z_tr=None, leaf_size: int = 32):
+        '''
+        :param x_tr: trajectory data along a first dimension (e.g. x)
+        :param y_tr: trajectory data along a second dimension (e.g. z)
+        :param z_tr: trajectory data along a third dimension (e.g. y). None for 2D
+        :param leaf_size: number of samples of the smallest blocks (scanned directly at the ends of a slice)
+        '''
+        if z_tr is None:
+            self.xy = np.column_stack((x_tr, y_tr))
+            hull = _Hull2D
+        else:
+            self.xy = np.column_stack((x_tr, y_tr, z_tr))
+            hull = _Hull3D
+        self.leaf_size = leaf_size
+
+        # levels[l][b]: hull of the samples [b * leaf_size * 2**l, (b + 1) * leaf_size * 2**l)
+        n = self.xy.shape[0]
+        self.levels = [[hull(self.xy, np.arange(start, min(start + leaf_size, n)))
+                        for start in range(0, n - leaf_size + 1, leaf_size)]]
+        while len(self.levels[-1]) > 1:
+            children = self.levels[-1]
+            self.levels.append([
+                hull(self.xy, np.concatenate([c.vertices for c in children[b:b + 2]]))
+                if b + 1 < len(children) else children[b]
+                for b in range(0, len(children), 2)
+            ])
+
+    @property
+    def dimensions(self) -> int:
+        return self.xy.shape[1]
+
+    def _candidates(self, start: int, stop: int, directions: list) -> np.array:
+        '''
+        Samples of [start, stop) that can be the farthest along one of the directions
+        '''
+        leaf = self.leaf_size
+        first, last = -(-start // leaf), stop // leaf
+        if first >= last:
+            return np.arange(start, stop)
+
+        # Partial blocks at the ends are scanned directly
+        candidates = [np.arange(start, first * leaf), np.arange(last * leaf, stop)]
+        level = 0
+        while first < last:
+            nodes = []
+            if first % 2:
+                nodes.append(self.levels[level][first])
+                first += 1
+            if last % 2:
+                last -= 1
+                nodes.append(self.levels[level][last])
+            for node in nodes:
+                candidates.extend(node.extreme(d) for d in directions)
+            first //= 2
+            last //= 2
+            level += 1
+        return np.unique(np.concatenate(candidates))
+
+    def maximum_deviation(self, start: int = 0, stop: int = None):
+        '''
+        Maximum deviation of the slice [start:stop], same as maximum_deviation_2d/3d(x_tr[start:stop], ...)
+        :param start: first sample of the slice (e.g. onset index)
+        :param stop: end of the slice (None for the end of the trajectory)
+        :return:
+            - Maximum Perpendicular Deviation (MPD)
+            - Coordinates corresponding to MPD (one per dimension)
+        '''
+        start, stop, _ = slice(start, stop).indices(self.xy.shape[0])
+        if stop - start < 3:
+            raise ValueError("the slice must have at least 3 samples")
+        pi = self.xy[start]
+        pf = self.xy[stop - 1]
+
+        if self.dimensions == 2:
+            normal = np.array([pi[1] - pf[1], pf[0] - pi[0]])
+            candidates = self._candidates(start + 1, stop - 1, [normal, -normal])
+            p_tr = self.xy[candidates]
+            ang = _get_angle_2d(pi, p_tr, pf)
+            dis = np.linalg.norm(p_tr - pi, axis=1) * np.sin(np.abs(ang))
+            idx = np.argmax(dis)
+            return (np.sign(ang[idx]) * dis[idx], *p_tr[idx])
+
+        candidates = self._candidates(start + 1, stop - 1, [None])
+        p_tr = self.xy[candidates]
+        # Normal Vector
+        p2 = np.array([pf[0], pf[1], pi[2]])
+        theta = _get_angle_3d(pi, p_tr, pf)
+        dis = np.linalg.norm(p_tr - pi, axis=1) * np.sin(theta)
+        idx = np.argmax(dis)
+        sign = _get_sign_3d(pi, p2, pf, p_tr[idx])
+        return (sign * dis[idx], *p_tr[idx])
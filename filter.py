@@ -1,9 +1,17 @@
 '''
 Simple filter to improve movement onset detection ?
 '''
-from scipy.signal import butter, filtfilt
+from functools import lru_cache
 
+import numpy as np
+from scipy.signal import butter, filtfilt, sosfiltfilt, lfilter, lfilter_zi, sosfilt, sosfilt_zi
 
+from ragged_trajectories import RaggedTrajectories
+from length_buckets import LengthBuckets
+from instrumentation import instrumented
+
+
+@lru_cache(maxsize=None)
 def _butter_lowpass(cutoff, fs, order):
     nyq = 0.5 * fs
     normalized_cutoff = cutoff / nyq
@@ -11,7 +19,114 @@ def _butter_lowpass(cutoff, fs, order):
     return b, a
 
 
-def butter_lowpass_filter(data, cutoff, fs, order):
+@lru_cache(maxsize=None)
+def _butter_lowpass_sos(cutoff, fs, order):
+    nyq = 0.5 * fs
+    normalized_cutoff = cutoff / nyq
+    return butter(order, normalized_cutoff, btype="low", output="sos")
+
+
+@instrumented
+def butter_lowpass_filter(data, cutoff, fs, order, axis=-1):
     b, a = _butter_lowpass(cutoff, fs, order)
-    filtered_data = filtfilt(b, a, data)
+    filtered_data = filtfilt(b, a, data, axis=axis)
     return filtered_data
+
+
+@instrumented
+def butter_lowpass_filter_sos(data, cutoff, fs, order, axis=-1):
+    '''
+    Same as butter_lowpass_filter using second-order sections (numerically more robust for high orders)
+        NOTE: for some orders the default padding of sosfiltfilt differs from the one of filtfilt,
+        so the first and last samples can differ slightly from butter_lowpass_filter
+    :param data: data to filter, e.g. (n,), (n, 3) with axis=0 or (trials, n, 3) with axis=1
+    :param cutoff: cutoff frequency
+    :param fs: sampling frequency
+    :param order: order of the filter
+    :param axis: time axis
+    :return: filtered data
+    '''
+    sos = _butter_lowpass_sos(cutoff, fs, order)
+    return sosfiltfilt(sos, data, axis=axis)
+
+
+def _padded_filtfilt(block: np.array, lengths: np.array, edge: int, forward) -> np.array:
+    '''
+    Forward-backward filter of every trial of a padded block (see length_buckets), same operations as
+        filtfilt / sosfiltfilt with their default odd extension of edge samples at both ends of each trial
+    :param block: trials padded with their last sample (trials, n, d)
+    :param lengths: number of real samples of every trial (trials,)
+    :param edge: length of the odd extension
+    :param forward: forward(x, x0) filters x along axis 1 starting from the steady state for x0 (trials, 1, d)
+    :return: filtered block (trials, n, d), padded with the last filtered sample
+    '''
+    if np.any(lengths <= edge):
+        raise ValueError("The length of the input vector x must be greater than padlen, which is {}.".format(edge))
+    trials = np.arange(block.shape[0])[:, None]
+    n = lengths[:, None]
+    # Length of every extended trial, the extended block is padded with the last extended sample
+    extended = n + 2 * edge
+    e = np.minimum(np.arange(block.shape[1] + 2 * edge), extended - 1)
+
+    # Odd extension: 2 x[0] - x[edge - e] before and 2 x[n - 1] - x[2 n + edge - 2 - e] after the trial
+    before = (e < edge)[..., None]
+    after = (e >= n + edge)[..., None]
+    x = block[trials, np.where(e < edge, edge - e, np.where(e >= n + edge, 2 * n + edge - 2 - e, e - edge))]
+    ext = np.where(before, 2 * block[:, :1] - x, np.where(after, 2 * block[trials, n - 1] - x, x))
+
+    y = forward(ext, ext[:, :1])
+    # Backward: every extended trial reversed from its own last sample
+    reverse = extended - 1 - e
+    y = y[trials, reverse]
+    y = forward(y, y[:, :1])
+
+    # Sample k of a trial is at extended - 1 - edge - k once reversed
+    k = np.minimum(np.arange(block.shape[1]), n - 1)
+    return y[trials, extended - 1 - edge - k]
+
+
+@instrumented
+def butter_lowpass_filter_padded(block: np.array, lengths: np.array, cutoff, fs, order, sos=False) -> np.array:
+    '''
+    Same as butter_lowpass_filter (butter_lowpass_filter_sos if sos) on every trial of a padded block
+        (see length_buckets), the padding does not change the filtered samples
+    :param block: trials padded with their last sample (trials, n, d)
+    :param lengths: number of real samples of every trial (trials,)
+    :param cutoff: cutoff frequency
+    :param fs: sampling frequency
+    :param order: order of the filter
+    :param sos: use second-order sections (see butter_lowpass_filter_sos)
+    :return: filtered block (trials, n, d)
+    '''
+    if sos:
+        sections = _butter_lowpass_sos(cutoff, fs, order)
+        zi = sosfilt_zi(sections).reshape(sections.shape[0], 1, 2, 1)
+        # Same number of taps as sosfiltfilt
+        taps = 2 * sections.shape[0] + 1 - min((sections[:, 2] == 0).sum(), (sections[:, 5] == 0).sum())
+        return _padded_filtfilt(block, lengths, 3 * taps,
+                                lambda x, x0: sosfilt(sections, x, axis=1, zi=zi * x0)[0])
+
+    b, a = _butter_lowpass(cutoff, fs, order)
+    zi = lfilter_zi(b, a).reshape(1, -1, 1)
+    return _padded_filtfilt(block, lengths, 3 * max(len(a), len(b)),
+                            lambda x, x0: lfilter(b, a, x, axis=1, zi=zi * x0)[0])
+
+
+@instrumented
+def filter_session(ragged: RaggedTrajectories, cutoff, fs, order, sos=False,
+                   buckets: LengthBuckets = None) -> RaggedTrajectories:
+    '''
+    Filter every trial of a session. Trials are filtered together by blocks of similar length
+    :param ragged: trajectories
+    :param cutoff: cutoff frequency
+    :param fs: sampling frequency
+    :param order: order of the filter
+    :param sos: use second-order sections (see butter_lowpass_filter_sos)
+    :param buckets: blocks of trials (see length_buckets). Trials of equal length if None
+    :return: filtered trajectories (same offsets)
+    '''
+    if buckets is None:
+        buckets = LengthBuckets(ragged.lengths, max_waste=0)
+    filtered = buckets.map(butter_lowpass_filter_padded, ragged, cutoff, fs, order, sos,
+                           out=np.zeros_like(ragged.positions))
+    return RaggedTrajectories(filtered, ragged.offsets)
@@ -0,0 +1,163 @@
+'''
+Lightweight instrumentation of the public functions and of the inner stages of the onset detection.
+Records call counts, cumulative/maximum wall time and array sizes (number of samples) per name.
+
+Disabled by default: an instrumented function only checks a flag and a stage returns a shared no-op
+context manager. Enable with enable() or with the environment variable CURVATURE_INSTRUMENTATION=1.
+
+    import instrumentation
+    instrumentation.enable()
+    ...
+    instrumentation.to_json("profile.json")
+'''
+
+import functools
+import json
+import os
+import time
+
+import numpy as np
+
+_enabled = os.environ.get("CURVATURE_INSTRUMENTATION", "0") not in ("", "0")
+_records = {}
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    _records.clear()
+
+
+def _size(args) -> int:
+    '''
+    Number of samples of the first array argument (-1 if there is none)
+    '''
+    for arg in args:
+        if isinstance(arg, np.ndarray) and arg.ndim > 0:
+            return arg.shape[0]
+        if hasattr(arg, 'positions'):
+            return arg.positions.shape[0]
+    return -1
+
+
+def record(name: str, elapsed: float = 0.0, size: int = -1):
+    '''
+    Add one call to the statistics of name
+    :param name: function or stage
+    :param elapsed: wall time (s)
+    :param size: number of samples, windows, ... (-1 if not applicable)
+    '''
+    r = _records.get(name)
+    if r is None:
+        r = _records[name] = {'calls': 0, 'total_time': 0.0, 'max_time': 0.0,
+                              'total_size': 0, 'max_size': -1}
+    r['calls'] += 1
+    r['total_time'] += elapsed
+    r['max_time'] = max(r['max_time'], elapsed)
+    if size >= 0:
+        r['total_size'] += size
+        r['max_size'] = max(r['max_size'], size)
+
+
+def instrumented(function=None, name: str = None):
+    '''
+    Decorator recording every call of a function while the instrumentation is enabled
+    '''
+    if function is None:
+        return functools.partial(instrumented, name=name)
+    key = name or function.__module__ + "." + function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(key, time.perf_counter() - t0, _size(args))
+
+    return wrapper
+
+
+class _NoStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage:
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.t0, self.size)
+        return False
+
+
+def stage(name: str, size: int = -1):
+    '''
+    Context manager recording the wall time of an inner stage while the instrumentation is enabled
+    :param name: stage
+    :param size: number of samples, windows, ... (-1 if not applicable)
+    '''
+    if not _enabled:
+        return _NO_STAGE
+    return _Stage(name, size)
+
+
+def report() -> dict:
+    '''
+    :return: statistics per name (calls, total_time, max_time, mean_time, total_size, max_size)
+    '''
+    return {name: {**r, 'mean_time': r['total_time'] / r['calls']} for name, r in sorted(_records.items())}
+
+
+def merge(other: dict):
+    '''
+    Add the statistics of another process (a report) to this one
+    '''
+    for name, o in other.items():
+        r = _records.setdefault(name, {'calls': 0, 'total_time': 0.0, 'max_time': 0.0,
+                                       'total_size': 0, 'max_size': -1})
+        r['calls'] += o['calls']
+        r['total_time'] += o['total_time']
+        r['max_time'] = max(r['max_time'], o['max_time'])
+        r['total_size'] += o['total_size']
+        r['max_size'] = max(r['max_size'], o['max_size'])
+
+
+def to_json(path: str = None) -> str:
+    '''
+    :param path: file to write (optional)
+    :return: report as JSON
+    '''
+    text = json.dumps(report(), indent=2)
+    if path is not None:
+        with open(path, "w") as file:
+            file.write(text)
+    return text
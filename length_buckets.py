@@ -0,0 +1,122 @@
+'''
+Groups of trials of similar length for the batch kernels (filter_session, calculate_velocity_session).
+Trials of different lengths cannot be stacked in one (trials, n, d) block, so the trials are sorted by length
+and split in buckets. Every trial of a bucket is padded to the longest one by repeating its last sample,
+a mask marks the real samples, the kernel runs once per bucket and the real samples are scattered back
+to the order of the trials.
+
+A bucket is closed when adding the next trial would exceed max_waste (padded samples / real samples - 1),
+so max_waste=0 gives one bucket per distinct length (no padding) and larger values give fewer, larger blocks.
+
+    buckets = LengthBuckets(ragged.lengths, max_waste=0.1)
+    filtered = filter_session(ragged, cutoff, fs, order, buckets=buckets)
+    velocity, = calculate_velocity_session(filtered, step, buckets=buckets)
+    buckets.report()
+'''
+
+import numpy as np
+
+from ragged_trajectories import RaggedTrajectories
+
+
+class LengthBuckets:
+    '''
+    Trials grouped in buckets of similar length
+    '''
+
+    def __init__(self, lengths, max_waste: float = 0.1):
+        '''
+        :param lengths: number of samples of every trial (n_trials,)
+        :param max_waste: padding allowed in a bucket, as a fraction of its real samples
+        '''
+        if max_waste < 0:
+            raise ValueError("max_waste must be non-negative")
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_waste = max_waste
+
+        # Longest first, a bucket is padded to its first trial (empty trials are not scheduled)
+        order = np.argsort(-self.lengths, kind='stable')
+        order = order[self.lengths[order] > 0]
+        self.buckets = []
+        start = 0
+        total = 0
+        for k, trial in enumerate(order):
+            n = self.lengths[trial]
+            padded = (k + 1 - start) * self.lengths[order[start]]
+            if k > start and padded > (1 + max_waste) * (total + n):
+                self.buckets.append(order[start:k])
+                start, total = k, 0
+            total += n
+        if order.size:
+            self.buckets.append(order[start:])
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def padded_length(self, b: int) -> int:
+        return int(self.lengths[self.buckets[b][0]])
+
+    @property
+    def samples(self) -> int:
+        return int(self.lengths.sum())
+
+    @property
+    def padded_samples(self) -> int:
+        return sum(bucket.size * self.padded_length(b) for b, bucket in enumerate(self.buckets))
+
+    @property
+    def overhead(self) -> float:
+        '''
+        Padded samples processed for nothing, as a fraction of the real samples
+        '''
+        return self.padded_samples / self.samples - 1 if self.samples else 0.0
+
+    def report(self) -> dict:
+        '''
+        :return: number of buckets, real and padded samples, achieved overhead and the limit
+        '''
+        return {
+            'trials': int(np.count_nonzero(self.lengths)),
+            'buckets': len(self),
+            'samples': self.samples,
+            'padded_samples': self.padded_samples,
+            'overhead': self.overhead,
+            'max_waste': self.max_waste
+        }
+
+    def pad(self, ragged: RaggedTrajectories, b: int) -> tuple:
+        '''
+        Padded block of one bucket (the last sample of every trial is repeated)
+        :param ragged: trajectories (lengths as given to the constructor)
+        :param b: bucket
+        :return:
+            - block (trials, n, d) with n the longest length of the bucket
+            - lengths of the trials of the bucket (trials,)
+            - mask of the real samples (trials, n)
+        '''
+        bucket = self.buckets[b]
+        lengths = self.lengths[bucket]
+        samples = np.arange(self.padded_length(b))
+        mask = samples < lengths[:, None]
+        rows = ragged.offsets[bucket][:, None] + np.minimum(samples, lengths[:, None] - 1)
+        return ragged.positions[rows], lengths, mask
+
+    def map(self, kernel, ragged: RaggedTrajectories, *args, out: np.array = None, **kwargs) -> np.array:
+        '''
+        Run a kernel bucket by bucket and scatter the real samples back to the order of the trials
+        :param kernel: kernel(block, lengths, *args, **kwargs) -> (..., trials, n, d') of a padded block
+            (see pad), the values of the padded samples are discarded
+        :param ragged: trajectories (lengths as given to the constructor)
+        :param out: buffer for the results (..., N_total, d'). Zeros with the shape of the first result if None
+        :return: results of every sample (..., N_total, d')
+        '''
+        for b in range(len(self)):
+            block, lengths, mask = self.pad(ragged, b)
+            result = np.asarray(kernel(block, lengths, *args, **kwargs))
+            if out is None:
+                out = np.zeros(result.shape[:-3] + (ragged.positions.shape[0],) + result.shape[-1:])
+            rows = ragged.offsets[self.buckets[b]][:, None] + np.arange(block.shape[1])
+            out[..., rows[mask], :] = result[..., mask, :]
+        if out is None:
+            out = np.zeros_like(ragged.positions)
+        return out
@@ -10,7 +10,10 @@ NOTE: t2 is always the correct target, t1 is the alternative target
 
 import numpy as np
 
+from instrumentation import instrumented
 
+
+@instrumented
 def maximal_log_ratio_2d(x_tr, y_tr, t1, t2):
     '''
     Max log ratio in 2D (See the document Geometric Descriptors of Curvature for more details)
@@ -40,6 +43,7 @@ def maximal_log_ratio_2d(x_tr, y_tr, t1, t2):
     return max_log_ratio, x_tr[idx], y_tr[idx]
 
 
+@instrumented
 def maximal_log_ratio_3d(x_tr, y_tr, z_tr, t1, t2):
     '''
     Max log ratio in 3D (See the document Geometric Descriptors of Curvature for more details)
@@ -3,13 +3,59 @@ Change the return values of the functions according to the requirements of the G
 '''
 
 import numpy as np
-from scipy.optimize import leastsq
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.signal import find_peaks
 
+from instrumentation import instrumented, stage
 
+# Settings of scipy.optimize.leastsq (lmdif of MINPACK) reproduced by _solve_onsets
+_FTOL = _XTOL = 1.49012e-08
+_FACTOR = 100.0
+_MAXFEV = 400
+_EPSMCH = np.finfo(float).eps
+_EPS_JACOBIAN = np.sqrt(_EPSMCH)
+_DWARF = np.finfo(float).tiny
+
+
+class OnsetResult:
+    """
+    Compact result of onset_detection (lean=True). Index ranges (start, stop) refer to the input arrays.
+        - t_onset, converged, adjusted_t, min_error, max_vel: as in the default result
+        - samples: samples before the velocity threshold used for the search (indexes of the default result)
+        - window: selected window position
+        - segment_1, segment_2: samples of the two winning segments (x1/y1/t1 and x2/y2/t2 of the default result)
+        - Um (k, d), errors (k,), times (k,): series of every window position, None unless series=True
+        - search: coarse-to-fine search report (see _coarse_to_fine), None for the exhaustive search
+    """
+    __slots__ = ('t_onset', 'converged', 'adjusted_t', 'min_error', 'max_vel', 'samples', 'window',
+                 'segment_1', 'segment_2', 'Um', 'errors', 'times', 'search')
+
+    def __init__(self, m: int, t_onset: float, converged: bool, adjusted_t: bool, min_error: float,
+                 max_vel: float, samples: tuple, window: int, Um=None, errors=None, times=None, search=None):
+        self.t_onset = t_onset
+        self.converged = converged
+        self.adjusted_t = adjusted_t
+        self.min_error = min_error
+        self.max_vel = max_vel
+        self.samples = samples
+        self.window = int(window)
+        start = samples[0] + window
+        self.segment_1 = (start, start + m)
+        self.segment_2 = (start + m - 1, start + 2 * m - 1)
+        self.Um = Um
+        self.errors = errors
+        self.times = times
+        self.search = search
+
+    def __repr__(self):
+        return "OnsetResult(t_onset={}, converged={}, adjusted_t={}, window={})".format(
+            self.t_onset, self.converged, self.adjusted_t, self.window)
+
+
+@instrumented
 def onset_detection(m: int, position_x: np.array, position_y: np.array,
                     time: np.array, velocity_x: np.array, velocity_y: np.array,
-                    t_th=np.inf, vel_th=0.80) -> tuple[float, dict, bool, bool]:
+                    t_th=np.inf, vel_th=0.80, lean=False, series=False, coarse=None) -> tuple[float, dict, bool, bool]:
     """
     Two-dimensional movement onset time detection method. The function finds the maximum velocity
         before calling the function that finds initiation time.
@@ -17,6 +63,7 @@ def onset_detection(m: int, position_x: np.array, position_y: np.array,
         the time corresponding to a percentage (vel_th) of the maximum velocity.
         This function has a temporal condition (t_th): if the minimum was found after the time in which
         the controller left the starting sphere, the previous minimum is selected if exists.
+        See onset_detection_nd for any number of dimensions.
     :param m: length of one segment (m samples)
     :param position_x: trajectory data along a first dimension (e.g. x)
     :param position_y: trajectory data along a second dimension (e.g. z)
@@ -25,39 +72,139 @@ def onset_detection(m: int, position_x: np.array, position_y: np.array,
     :param velocity_y: first derivative of position_y
     :param t_th: temporal threshold (e.g. time corresponding to the moment in which the controller left the starting sphere)
     :param vel_th: percentage of max velocity (vel_th < 1)
+    :param lean: return an OnsetResult (scalars and index ranges) instead of dict_results
+    :param series: with lean, keep the Um, errors and times series as arrays
+    :param coarse: stride of the coarse-to-fine search of the window (see _coarse_to_fine), None for the
+        exhaustive search. The errors and Um series are NaN at the window positions that were not fitted
     :return:
         - t_onset: Initiation time
-        - dict_results: Different values that can be used for validation and analysis
+        - dict_results: Different values that can be used for validation and analysis (OnsetResult if lean)
         - converged: True is the default value. False if minimum was not found
         - adjusted_t: False is the default value. True if the minimum was adjusted based on the time-threshold condition.
     """
+    t_onset, results, converged, adjusted_t = onset_detection_nd(
+        m, np.column_stack((position_x, position_y)), time, np.column_stack((velocity_x, velocity_y)),
+        t_th=t_th, vel_th=vel_th, lean=lean, series=series, coarse=coarse)
+    if lean:
+        return t_onset, results, converged, adjusted_t
 
-    # Find max velocity (Naive approach, this can be easily improved)
+    dict_results = {
+        'Um': results['Um'],
+        'min_error': results['min_error'],
+        'errors': results['errors'],
+        'times': results['times'],
+        'x1': results['p1'][:, 0],
+        'y1': results['p1'][:, 1],
+        't1': results['t1'],
+        'x2': results['p2'][:, 0],
+        'y2': results['p2'][:, 1],
+        't2': results['t2'],
+        'max_vel': results['max_vel'],
+        'indexes': results['indexes']
+    }
+    if coarse is not None:
+        dict_results['search'] = results['search']
 
-    peaks_x_a, _ = find_peaks(velocity_x)
-    peaks_x_b, _ = find_peaks(-velocity_x)
+    return t_onset, dict_results, converged, adjusted_t
 
-    peaks_y_a, _ = find_peaks(velocity_y)
-    peaks_y_b, _ = find_peaks(-velocity_y)
 
-    peaks_x = np.sort(np.concatenate([peaks_x_a, peaks_x_b]))
-    peaks_y = np.sort(np.concatenate([peaks_y_a, peaks_y_b]))
+@instrumented
+def onset_detection_nd(m: int, positions: np.array, time: np.array, velocities: np.array,
+                       t_th=np.inf, vel_th=0.80, lean=False, series=False,
+                       coarse=None) -> tuple[float, dict, bool, bool]:
+    """
+    Movement onset time detection for any number of dimensions (e.g. x, y, z of the controller).
+        Same method as onset_detection, all the dimensions are fitted at once for each window.
+        The velocity threshold is taken on the dimension chosen as in onset_detection
+        (the one with the lowest maximum velocity, the last one on ties).
+    :param m: length of one segment (m samples)
+    :param positions: trajectory data (n, d)
+    :param time: time corresponding to trajectory data (n,)
+    :param velocities: first derivative of positions (n, d)
+    :param t_th: temporal threshold (e.g. time corresponding to the moment in which the controller left the starting sphere)
+    :param vel_th: percentage of max velocity (vel_th < 1)
+    :param lean: return an OnsetResult (scalars and index ranges) instead of dict_results
+    :param series: with lean, keep the Um, errors and times series as arrays
+    :param coarse: stride of the coarse-to-fine search of the window (see _coarse_to_fine), None for the
+        exhaustive search. The errors and Um series are NaN at the window positions that were not fitted
+    :return:
+        - t_onset: Initiation time
+        - dict_results: as in onset_detection with the segments as arrays p1, p2 (m, d) (OnsetResult if lean)
+        - converged: True is the default value. False if minimum was not found
+        - adjusted_t: False is the default value. True if the minimum was adjusted based on the time-threshold condition.
+    """
+    positions = np.asarray(positions)
+    velocities = np.asarray(velocities)
+
+    with stage('onset_detection.find_peaks', velocities.shape[0]):
+        indexes, max_v = _search_samples(velocities, vel_th)
+
+    if lean:
+        # The samples before the threshold are consecutive, slices avoid the copies
+        samples = (int(indexes[0]), int(indexes[-1]) + 1) if indexes.size else (0, 0)
+        s = slice(*samples)
+        (times, errors, onsets, jerks_mean), (index, min_error, converged, adjusted_t), search = _find_onset(
+            m, np.ascontiguousarray(positions[s].T), time[s], t_th, coarse)
+        t_onset = onsets[index]
+        result = OnsetResult(m, t_onset, converged, adjusted_t, min_error, max_v, samples, index,
+                             *((np.ascontiguousarray(jerks_mean), errors, times) if series else (None,) * 3),
+                             search=search)
+        return t_onset, result, converged, adjusted_t
+
+    positions = positions[indexes]
+    time = time[indexes]
 
-    max_vx = np.sort(np.abs(velocity_x[peaks_x]))[-1]
-    max_vy = np.sort(np.abs(velocity_y[peaks_y]))[-1]
+    t_onset, dict_results, converged, adjusted_t = _movement_onset(m, positions, time, t_th, coarse)
+    dict_results['max_vel'] = max_v
+    dict_results['indexes'] = indexes
 
-    if max_vx < max_vy:
-        max_v = max_vx
-        peaks = peaks_x
-        vel = velocity_x
-    else:
-        max_v = max_vy
-        peaks = peaks_y
-        vel = velocity_y
+    return t_onset, dict_results, converged, adjusted_t
+
+
+def _search_samples(velocities: np.array, vel_th: float):
+    """
+    Samples where the onset is searched: the first consecutive samples whose velocity is below
+        vel_th times the maximum velocity
+    :param velocities: first derivative of the trajectory data (n, d)
+    :param vel_th: percentage of max velocity (vel_th < 1)
+    :return:
+        - indexes: consecutive samples
+        - max_v: maximum velocity (signed) of the dimension used for the threshold
+    """
+    return _threshold_samples(*_velocity_peaks(velocities), vel_th)
+
+
+def _velocity_peaks(velocities: np.array):
+    """
+    Maximum velocity of the dimension used for the threshold (independent of vel_th)
+    :param velocities: first derivative of the trajectory data (n, d)
+    :return:
+        - vel: velocity of the dimension with the lowest maximum velocity (the last one on ties)
+        - peaks: extrema of vel
+        - max_v: maximum velocity (signed)
+    """
+    # Find max velocity (Naive approach, this can be easily improved)
+    peaks, max_vs = [], []
+    for v in velocities.T:
+        peaks_a, _ = find_peaks(v)
+        peaks_b, _ = find_peaks(-v)
+        peaks.append(np.sort(np.concatenate([peaks_a, peaks_b])))
+        max_vs.append(np.sort(np.abs(v[peaks[-1]]))[-1])
+
+    # Lowest maximum velocity, the last dimension on ties
+    axis = len(max_vs) - 1 - int(np.argmin(max_vs[::-1]))
+    max_v = max_vs[axis]
+    vel = velocities[:, axis]
 
     idx = np.argwhere(np.abs(vel) == max_v)[0][0]
-    max_v = vel[idx]
+    return vel, peaks[axis], vel[idx]
 
+
+def _threshold_samples(vel: np.array, peaks: np.array, max_v: float, vel_th: float):
+    """
+    First consecutive samples below vel_th times the maximum velocity (see _velocity_peaks)
+    :return: indexes, max_v
+    """
     if max_v < 0:
         indexes = np.argwhere(vel[0:peaks[-1]] >= vel_th * max_v).T[0]
     else:
@@ -67,30 +214,18 @@ def onset_detection(m: int, position_x: np.array, position_y: np.array,
     diffs = np.diff(indexes) != 1
     idx = np.nonzero(diffs)[0] + 1
     groups = np.split(indexes, idx)
-    indexes = groups[0]
-
-    position_x = position_x[indexes]
-    position_y = position_y[indexes]
-    time = time[indexes]
-
-    t_onset, dict_results, converged, adjusted_t = _movement_onset(m, position_x, position_y, time, t_th)
-    dict_results['max_vel'] = max_v
-    dict_results['indexes'] = indexes
-
-    return t_onset, dict_results, converged, adjusted_t
+    return groups[0], max_v
 
 
-def _movement_onset(m: int, position_x: np.array, position_y: np.array, time: np.array, t_th: float):
+def _movement_onset(m: int, positions: np.array, time: np.array, t_th: float, coarse: int = None):
     """
-    A two-dimensional  extension of the method found here
+    A multidimensional extension of the method found here
         https://www.frontiersin.org/articles/10.3389/neuro.20.002.2009/full
     :param m: length of one segment (m samples)
-    :param position_x: trajectory data along a first dimension (e.g. x)
-    :param position_y: trajectory data along a second dimension (e.g. z)
+    :param positions: trajectory data (n, d)
     :param time: time corresponding to trajectory data
-    :param velocity_x: first derivative of position_x
-    :param velocity_y: first derivative of position_y
     :param t_th: temporal threshold (e.g. time corresponding to the moment in which the controller left the starting sphere)
+    :param coarse: stride of the coarse-to-fine search (None for the exhaustive search)
     :return:
         - t_onset: Initiation time
         - dict_results: Different values that can be used for validation and analysis
@@ -100,116 +235,145 @@ def _movement_onset(m: int, position_x: np.array, position_y: np.array, time: np
     # Check time series are the same length
     # Time series should never be of different length but just in case
     try:
-        assert position_x.size == time.size, "Time series are of different size"
+        assert positions.shape[0] == time.size, "Time series are of different size"
     except AssertionError as msg:
         print(msg)
 
-    try:
-        assert position_y.size == time.size, "Time series are of different size"
-    except AssertionError as msg:
-        print(msg)
-
-    adjusted_t = False
-
-    jerks = []
-    errors = np.array([])
-    times = np.array([])
-    onsets = np.array([])
-    jerks_mean = []
-
-    x_s1 = []
-    y_s1 = []
-    t_s1 = []
-
-    x_s2 = []
-    y_s2 = []
-    t_s2 = []
-
-    for i in range(time.size - 2*m + 1):
-        # First Segment
-        xl_1 = position_x[i:m+i]
-        yl_1 = position_y[i:m+i]
-        tl_1 = time[i:m+i]
-
-        x_s1.append(xl_1)
-        y_s1.append(yl_1)
-        t_s1.append(tl_1)
-
-        # Second Segment
-        xl_2 = position_x[m+i-1:2*m+i-1]
-        yl_2 = position_y[m+i-1:2*m+i-1]
-        tl_2 = time[m+i-1:2*m+i-1]
-
-        x_s2.append(xl_2)
-        y_s2.append(yl_2)
-        t_s2.append(tl_2)
-
-        hat_t_q = tl_1[-1]
-        times = np.append(times, hat_t_q)
-
-        # Static phase
-        hat_x_q = np.mean(xl_1)
-
-        # Movement phase
-        def minimum_jerk(Um, x2, t2):
-            f = x2 - (hat_x_q + Um * (t2 - hat_t_q) ** 3)
-            return (1 / m ** 0.5) * f
-
-        U_i = np.asarray([0])  # Initial value for optimization
-        result = leastsq(minimum_jerk, U_i, (xl_2, tl_2))
-        Um_x = result[0][0]
-
-        # Static phase
-        hat_y_q = np.mean(yl_1)
-
-        # Movement phase
-        def minimum_jerk(Um, y2, t2):
-            f = y2 - (hat_y_q + Um * (t2 - hat_t_q) ** 3)
-            return (1 / m ** 0.5) * f
-
-        U_i = np.asarray([0])  # Initial value for optimization
-        result = leastsq(minimum_jerk, U_i, (yl_2, tl_2))
-        Um_y = result[0][0]
-
-        jerks.append(np.array([Um_x, Um_y]))
+    (times, errors, onsets, jerks_mean), (index, min_error, converged, adjusted_t), search = _find_onset(
+        m, np.ascontiguousarray(positions.T), time, t_th, coarse)
+    t_onset = onsets[index]
 
-        # ERROR
-        error_x = np.power(xl_1 - hat_x_q, 2).sum() + np.power(xl_2 - hat_x_q - Um_x * (tl_2 - hat_t_q) ** 3, 2).sum()
-        error_y = np.power(yl_1 - hat_y_q, 2).sum() + np.power(yl_2 - hat_y_q - Um_y * (tl_2 - hat_t_q) ** 3, 2).sum()
-        error = error_x + error_y
-        error = (1 / ((2 * m) - 1)) * error**0.5
-        errors = np.append(errors, error)
+    # Winning segments
+    s1 = slice(index, m + index)
+    s2 = slice(m + index - 1, 2 * m + index - 1)
 
-        def rms_error(t_onset, x1, x2, y1, y2, t2):
-            f_x = np.power(x1 - hat_x_q, 2).sum() + np.power(x2 - hat_x_q - Um_x * (t2 - t_onset) ** 3, 2).sum()
-            f_y = np.power(y1 - hat_y_q, 2).sum() + np.power(y2 - hat_y_q - Um_y * (t2 - t_onset) ** 3, 2).sum()
-            f = f_x + f_y
-            return (1 / (2 * m - 1)) * f**0.5
+    dict_results = {
+        'Um': list(jerks_mean),
+        'min_error': min_error,
+        'errors': errors,
+        'times': times,
+        'p1': positions[s1],
+        't1': time[s1],
+        'p2': positions[s2],
+        't2': time[s2]
+    }
+    if coarse is not None:
+        dict_results['search'] = search
 
-        to = np.asarray([0])  # Initial value for optimization
-        result = leastsq(rms_error, to, (xl_1, xl_2, yl_1, yl_2, tl_2))
-        t_mo = result[0][0]
-        onsets = np.append(onsets, t_mo)
+    return t_onset, dict_results, converged, adjusted_t
 
-        def mean_jerk(Um, x2, t2):
-            f = x2 - (hat_x_q + Um * (t2 - t_mo) ** 3)
-            return (1 / m ** 0.5) * f
 
-        U_i = np.asarray([0])  # Initial value for optimization
-        result = leastsq(mean_jerk, U_i, (xl_2, tl_2))
-        U_mean_x = result[0][0]
+def _find_onset(m: int, positions: np.array, time: np.array, t_th: float, coarse: int = None):
+    """
+    Fit the windows (all of them, or coarse-to-fine) and select the onset window
+    :param m: length of one segment (m samples)
+    :param positions: trajectory data, one row per dimension (d, n)
+    :param time: time corresponding to trajectory data (n,)
+    :param t_th: temporal threshold
+    :param coarse: stride of the coarse-to-fine search (None for the exhaustive search)
+    :return:
+        - times, errors, onsets, jerks_mean (see _fit_windows)
+        - index, min_error, converged, adjusted_t (see _select_onset)
+        - search: report of the coarse-to-fine search (None for the exhaustive search)
+    """
+    search = None
+    if coarse is not None:
+        fit, selection, search = _coarse_to_fine(m, positions, time, t_th, coarse)
+        if fit is not None:
+            return fit, selection, search
 
-        def mean_jerk(Um, y2, t2):
-            f = y2 - (hat_y_q + Um * (t2 - t_mo) ** 3)
-            return (1 / m ** 0.5) * f
+    with stage('_movement_onset.fit_windows', max(time.size - 2 * m + 1, 0)):
+        fit = _fit_windows(m, positions, time)
+    times, errors, onsets, _ = fit
+    with stage('_movement_onset.select_onset', errors.size):
+        selection = _select_onset(errors, onsets, t_th)
+    return fit, selection, search
 
-        U_i = np.asarray([0])  # Initial value for optimization
-        result = leastsq(mean_jerk, U_i, (yl_2, tl_2))
-        U_mean_y = result[0][0]
 
-        jerks_mean.append(np.array([U_mean_x, U_mean_y]))
+def _coarse_to_fine(m: int, positions: np.array, time: np.array, t_th: float, stride: int):
+    """
+    Multi-resolution search of the onset window.
+        Only the error (no onset time) is evaluated every stride window positions (plus the last one).
+        The windows from the grid position before the last minimum of this coarse curve to the end are then
+        fitted at full resolution. The last minimum of the exhaustive search is in this suffix, which is
+        extended backwards (to the previous coarse minimum, or to the first window) only while the
+        time-threshold condition needs earlier minima. Since the minima are searched on a fully fitted suffix,
+        the selected window is the one of the exhaustive search: search['bound'] (maximum deviation of
+        t_onset, s) is 0. The long pre-movement phase before the onset is only evaluated on the coarse grid.
+        If the coarse curve has no minimum, None is returned and the exhaustive search is used
+        (search['fallback'] is True).
+    :param m: length of one segment (m samples)
+    :param positions: trajectory data, one row per dimension (d, n)
+    :param time: time corresponding to trajectory data (n,)
+    :param t_th: temporal threshold
+    :param stride: distance between the window positions of the coarse grid (e.g. m)
+    :return:
+        - times, errors, onsets, jerks_mean as _fit_windows, NaN at the windows that were not fitted
+            (None on fallback)
+        - index, min_error, converged, adjusted_t (see _select_onset, None on fallback)
+        - search: report {'stride', 'windows' (number of windows evaluated), 'exhaustive' (number of windows),
+            'bound', 'fallback'}
+    """
+    stride = max(int(stride), 1)
+    k = max(time.size - 2 * m + 1, 0)
+    search = {'stride': stride, 'windows': 0, 'exhaustive': k, 'bound': 0.0, 'fallback': False}
+
+    grid = np.unique(np.append(np.arange(0, k, stride), k - 1)) if k > 0 else np.arange(0)
+    with stage('_movement_onset.coarse_windows', grid.size):
+        _, coarse_errors, _, _ = _fit_windows(m, positions, time, grid, solve_onsets=False)
+    coarse_peaks, _ = find_peaks(-coarse_errors)
+    search['windows'] = grid.size
+    if coarse_peaks.size == 0:
+        search['fallback'] = True
+        search['windows'] += k
+        return None, None, search
+
+    times = time[m - 1:m - 1 + k]
+    errors = np.full(k, np.nan)
+    onsets = np.full(k, np.nan)
+    jerks_mean = np.full((k, positions.shape[0]), np.nan)
+
+    q = coarse_peaks.size - 1
+    start, stop = grid[coarse_peaks[q] - 1], k
+    while True:
+        # Full resolution on [start, stop), the suffix is now [start, k)
+        windows = slice(start, stop)
+        with stage('_movement_onset.fit_windows', stop - start):
+            _, errors[windows], onsets[windows], jerks_mean[windows] = _fit_windows(m, positions, time, windows)
+        search['windows'] += stop - start
+
+        # Minima strictly inside the suffix (the first window has no left neighbour yet)
+        peaks = find_peaks(-errors[start:])[0] + start
+        with stage('_movement_onset.select_onset', peaks.size):
+            selection = _select_onset(errors, onsets, t_th, peaks)
+        if onsets[selection[0]] <= t_th or start == 0:
+            break
+        # Every minimum of the suffix is after t_th, extend it to the previous coarse minimum
+        # (directly to the last one before t_th if it is earlier)
+        q = min(q - 1, np.count_nonzero(times[grid[coarse_peaks]] <= t_th) - 1)
+        start, stop = (grid[coarse_peaks[q] - 1] if q >= 0 else 0), start
+
+    return (times, errors, onsets, jerks_mean), selection, search
+
+
+def _select_onset(errors: np.array, onsets: np.array, t_th: float, peaks: np.array = None):
+    """
+    Select the window of the onset: the last minimum of the error, or an earlier minimum
+        if the onset time is higher than t_th
+    :param errors: rms error of the model for each window
+    :param onsets: onset time t_mo for each window
+    :param t_th: temporal threshold
+    :param peaks: minima of the errors (found here if None)
+    :return:
+        - index: selected window
+        - min_error: error of the selected window
+        - converged: False if minimum was not found
+        - adjusted_t: True if the minimum was adjusted based on the time-threshold condition.
+    """
+    adjusted_t = False
 
-    peaks, _ = find_peaks(-errors)
+    if peaks is None:
+        peaks, _ = find_peaks(-errors)
 
     if peaks.size == 0:
         # No minimum was found
@@ -231,25 +395,231 @@ def _movement_onset(m: int, position_x: np.array, position_y: np.array, time: np
         t_onset = onsets[index]
         i += 1
 
-    jerk_mean = jerks_mean
-    x1 = x_s1[index]
-    y1 = y_s1[index]
-    t1 = t_s1[index]
-    x2 = x_s2[index]
-    y2 = y_s2[index]
-    t2 = t_s2[index]
+    return index, min_error, converged, adjusted_t
 
-    dict_results = {
-        'Um': jerk_mean,
-        'min_error': min_error,
-        'errors': errors,
-        'times': times,
-        'x1': x1,
-        'y1': y1,
-        't1': t1,
-        'x2': x2,
-        'y2': y2,
-        't2': t2
-    }
 
-    return t_onset, dict_results, converged, adjusted_t
+def _segment_windows(m: int, series: np.array):
+    """
+    Views (no copies) of the two consecutive segments for every window position.
+        Along the last axis, series[..., i:m+i] is the first segment and series[..., m+i-1:2*m+i-1] the second one.
+    :param m: length of one segment (m samples)
+    :param series: time series, the last axis is time
+    :return:
+        - first segments (..., k, m)
+        - second segments (..., k, m)
+    """
+    k = series.shape[-1] - 2 * m + 1
+    windows = sliding_window_view(series, m, axis=-1)
+    return windows[..., :k, :], windows[..., m - 1:m - 1 + k, :]
+
+
+def _fit_windows(m: int, positions: np.array, time: np.array, windows: np.array = None,
+                 solve_onsets: bool = True):
+    """
+    Fit the static/minimum-jerk model at every window position in one vectorized pass.
+        The jerk amplitudes Um are linear in one parameter and are solved in closed form,
+        only the onset time t_mo requires an iterative (batched) solve, see _solve_onsets.
+    :param m: length of one segment (m samples)
+    :param positions: trajectory data, one row per dimension (d, n)
+    :param time: time corresponding to trajectory data (n,)
+    :param windows: fit only these window positions, indexes or a slice (all if None)
+    :param solve_onsets: if False, only the errors are computed (onsets and jerks_mean are None)
+    :return:
+        - times: end of the first segment for each window (k,)
+        - errors: rms error of the model for each window (k,)
+        - onsets: onset time t_mo for each window (k,)
+        - jerks_mean: jerk amplitudes re-fitted at t_mo (k, d)
+    """
+    t1, t2 = _segment_windows(m, time)
+    p1, p2 = _segment_windows(m, positions)
+    if windows is not None:
+        t1, t2, p1, p2 = t1[windows], t2[windows], p1[:, windows], p2[:, windows]
+
+    hat_t_q = t1[:, -1]
+    u = t2 - hat_t_q[:, None]
+    u3 = u ** 3
+
+    # Static phase
+    hat_p_q = p1.mean(axis=-1)
+    r1 = p1 - hat_p_q[..., None]
+    r2 = p2 - hat_p_q[..., None]
+
+    # Movement phase (closed-form least squares in Um)
+    jerks = (r2 * u3).sum(axis=-1) / (u3 ** 2).sum(axis=-1)
+
+    # ERROR
+    error = (r1 ** 2).sum(axis=(0, -1)) + ((r2 - jerks[..., None] * u3) ** 2).sum(axis=(0, -1))
+    errors = (1 / ((2 * m) - 1)) * error ** 0.5
+    if not solve_onsets:
+        return hat_t_q, errors, None, None
+
+    with stage('_movement_onset.solve_onset', hat_t_q.size):
+        onsets = _solve_onsets(m, t2, r1, r2, jerks)
+
+    # Movement phase re-fitted at the onset time
+    w3 = (t2 - onsets[:, None]) ** 3
+    jerks_mean = (r2 * w3).sum(axis=-1) / (w3 ** 2).sum(axis=-1)
+
+    return hat_t_q, errors, onsets, jerks_mean.T
+
+
+def _lm_parameter(r: np.array, diag: np.array, qtb: np.array, delta: np.array, par: np.array):
+    """
+    Levenberg-Marquardt parameter and step for one residual and one parameter (lmpar of MINPACK), batched
+    :param r: R factor of the Jacobian (k,)
+    :param diag: scaling of the parameter (k,)
+    :param qtb: Q^T times the residual (k,)
+    :param delta: trust region radius (k,)
+    :param par: previous Levenberg-Marquardt parameter (k,)
+    :return:
+        - Levenberg-Marquardt parameter (k,)
+        - step, with the sign convention of lmpar (k,)
+    """
+    # Gauss-Newton step
+    x = qtb / r
+    dxnorm = np.abs(diag * x)
+    fp = dxnorm - delta
+    search = fp > 0.1 * delta
+    par = np.where(search, par, 0.0)
+    if not np.any(search):
+        return par, x
+
+    # Bounds of the parameter
+    temp = np.abs(diag * ((diag * x) / dxnorm) / r)
+    parl = ((fp / delta) / temp) / temp
+    gnorm = np.abs((r * qtb) / diag)
+    paru = gnorm / delta
+    paru = np.where(paru == 0, _DWARF / np.minimum(delta, 0.1), paru)
+    par = np.where(search, np.minimum(np.maximum(par, parl), paru), par)
+    par = np.where(search & (par == 0), gnorm / dxnorm, par)
+
+    for iteration in range(1, 11):
+        par = np.where(search & (par == 0), np.maximum(_DWARF, 0.001 * paru), par)
+        # Solution of (R; sqrt(par) * diag) x = (qtb; 0) with a Givens rotation (qrsolv)
+        d = np.sqrt(par) * diag
+        larger = np.abs(r) >= np.abs(d)
+        tan = d / r
+        cotan = r / d
+        cos = 0.5 / np.sqrt(0.25 + 0.25 * tan ** 2)
+        sin = 0.5 / np.sqrt(0.25 + 0.25 * cotan ** 2)
+        cos, sin = np.where(larger, cos, sin * cotan), np.where(larger, cos * tan, sin)
+        sdiag = cos * r + sin * d
+        x = np.where(search, (cos * qtb) / sdiag, x)
+
+        dxnorm = np.abs(diag * x)
+        previous = fp
+        fp = np.where(search, dxnorm - delta, fp)
+        search &= ~((np.abs(fp) <= 0.1 * delta) | ((parl == 0) & (fp <= previous) & (previous < 0)) |
+                    (iteration == 10))
+        if not np.any(search):
+            break
+
+        # Newton correction
+        temp = np.abs(diag * ((diag * x) / dxnorm) / sdiag)
+        parc = ((fp / delta) / temp) / temp
+        parl = np.where(search & (fp > 0), np.maximum(parl, par), parl)
+        paru = np.where(search & (fp < 0), np.minimum(paru, par), paru)
+        par = np.where(search, np.maximum(parl, par + parc), par)
+
+    return par, x
+
+
+def _solve_onsets(m: int, t2: np.array, r1: np.array, r2: np.array, jerks: np.array):
+    """
+    Batched fit of the onset time t_mo of every window.
+        The rms error is minimized with the iterations of scipy.optimize.leastsq (lmdif of MINPACK with a
+        forward-difference Jacobian and the default settings) for one residual and one parameter, started
+        at t_mo = 0. The error has several local minima, so the iterations are reproduced step by step
+        to end in the same minimum as leastsq.
+    :param m: length of one segment (m samples)
+    :param t2: second segment time (k, m)
+    :param r1: first segment positions relative to the static phase (d, k, m)
+    :param r2: second segment positions relative to the static phase (d, k, m)
+    :param jerks: jerk amplitudes of each dimension (d, k)
+    :return: onset time t_mo of each window (k,)
+    """
+    static = (r1 ** 2).sum(axis=-1)
+
+    def rms_error(t_onset, rows):
+        moving = ((r2[:, rows] - jerks[:, rows, None] * (t2[rows] - t_onset[:, None]) ** 3) ** 2).sum(axis=-1)
+        f = static[0, rows] + moving[0]
+        for j in range(1, static.shape[0]):
+            f = f + (static[j, rows] + moving[j])
+        return (1 / (2 * m - 1)) * f ** 0.5
+
+    k = t2.shape[0]
+    x = np.zeros(k)
+    fvec = rms_error(x, np.arange(k))
+    nfev = np.ones(k, dtype=int)
+    iteration = np.ones(k, dtype=int)
+    par, diag, delta, xnorm, r, gnorm = (np.zeros(k) for _ in range(6))
+    jacobian = np.ones(k, dtype=bool)
+    active = np.ones(k, dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            rows = np.flatnonzero(active & jacobian)
+            if rows.size:
+                # Forward-difference Jacobian
+                h = _EPS_JACOBIAN * np.abs(x[rows])
+                h[h == 0] = _EPS_JACOBIAN
+                J = (rms_error(x[rows] + h, rows) - fvec[rows]) / h
+                nfev[rows] += 1
+                acnorm = np.abs(J)
+                first = iteration[rows] == 1
+                diag[rows] = np.where(first, np.where(acnorm != 0, acnorm, 1.0), diag[rows])
+                xnorm[rows] = np.where(first, np.abs(diag[rows] * x[rows]), xnorm[rows])
+                delta[rows] = np.where(first, np.where(xnorm[rows] != 0, _FACTOR * xnorm[rows], _FACTOR), delta[rows])
+                r[rows] = -J
+                fnorm = np.abs(fvec[rows])
+                gnorm[rows] = np.where((fnorm != 0) & (acnorm != 0), np.abs(J * (fvec[rows] / fnorm) / acnorm), 0.0)
+                diag[rows] = np.maximum(diag[rows], acnorm)
+                jacobian[rows] = False
+                # The gradient vanishes
+                active[rows[gnorm[rows] <= 0]] = False
+
+            rows = np.flatnonzero(active)
+            if not rows.size:
+                break
+
+            # Trial step
+            par[rows], p = _lm_parameter(r[rows], diag[rows], -fvec[rows], delta[rows], par[rows])
+            p = -p
+            pnorm = np.abs(diag[rows] * p)
+            delta[rows] = np.where(iteration[rows] == 1, np.minimum(delta[rows], pnorm), delta[rows])
+            f1 = rms_error(x[rows] + p, rows)
+            nfev[rows] += 1
+            fnorm = np.abs(fvec[rows])
+            fnorm1 = np.abs(f1)
+            actred = np.where(0.1 * fnorm1 < fnorm, 1 - (fnorm1 / fnorm) ** 2, -1.0)
+            temp1 = np.abs(r[rows] * p) / fnorm
+            temp2 = (np.sqrt(par[rows]) * pnorm) / fnorm
+            prered = temp1 ** 2 + temp2 ** 2 / 0.5
+            dirder = -(temp1 ** 2 + temp2 ** 2)
+            ratio = np.where(prered != 0, actred / prered, 0.0)
+
+            # Trust region
+            shrink = ratio <= 0.25
+            temp = np.where(actred >= 0, 0.5, 0.5 * dirder / (dirder + 0.5 * actred))
+            temp = np.where((0.1 * fnorm1 >= fnorm) | (temp < 0.1), 0.1, temp)
+            expand = ~shrink & ((par[rows] == 0) | (ratio >= 0.75))
+            delta[rows] = np.where(shrink, temp * np.minimum(delta[rows], pnorm / 0.1),
+                                   np.where(expand, pnorm / 0.5, delta[rows]))
+            par[rows] = np.where(shrink, par[rows] / temp, np.where(expand, 0.5 * par[rows], par[rows]))
+
+            # Successful step
+            success = ratio >= 1e-4
+            x[rows] = np.where(success, x[rows] + p, x[rows])
+            xnorm[rows] = np.where(success, np.abs(diag[rows] * x[rows]), xnorm[rows])
+            fvec[rows] = np.where(success, f1, fvec[rows])
+            iteration[rows] += success
+            jacobian[rows] = success
+
+            # Convergence (and the tests of MINPACK for too small tolerances)
+            converged = ((np.abs(actred) <= _FTOL) & (prered <= _FTOL) & (0.5 * ratio <= 1) |
+                         (delta[rows] <= _XTOL * xnorm[rows]) | (nfev[rows] >= _MAXFEV) |
+                         (np.abs(actred) <= _EPSMCH) & (prered <= _EPSMCH) & (0.5 * ratio <= 1) |
+                         (delta[rows] <= _EPSMCH * xnorm[rows]) | (gnorm[rows] <= _EPSMCH))
+            active[rows[converged]] = False
+
+    return x
@@ -0,0 +1,148 @@
+'''
+Incremental movement onset detection for live sessions.
+Samples are given one at a time (e.g. as they arrive from the controller tracker). Only the error of the
+window ending at each new sample is evaluated, so the work per sample only depends on m. When the velocity
+threshold is crossed, the onset time t_mo (the iterative part of the fit) is solved for the minima of the
+error only and the onset is emitted, with the same selection as onset_detection.
+
+NOTE: The velocity is calculated with the same differentiator as calculate_velocity,
+    which needs three samples after the current one (latency of 3 samples).
+'''
+
+from collections import deque
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from movement_onset_detection import _fit_windows, _select_onset
+
+
+class OnlineOnsetDetector:
+    '''
+    Streaming version of onset_detection. As the peak velocity is not known while the trial is running,
+        the search is stopped when the speed reaches an absolute threshold (vel_threshold) instead of a
+        percentage of the peak velocity.
+    '''
+
+    def __init__(self, m: int, step: float, vel_threshold: float, t_th=np.inf):
+        '''
+        :param m: length of one segment (m samples)
+        :param step: sampling period (e.g. 1/90)
+        :param vel_threshold: speed (norm of the velocity of all dimensions) that ends the search
+        :param t_th: temporal threshold (e.g. time corresponding to the moment in which the controller left the starting sphere)
+        '''
+        self.m = m
+        self.step = step
+        self.vel_threshold = vel_threshold
+        self.t_th = t_th
+        self.reset()
+
+    def reset(self):
+        '''
+        Start a new trial
+        '''
+        # Samples of the trial (d, capacity), grown as needed, and of the differentiator (7 samples)
+        self._time = np.empty(0)
+        self._positions = None
+        self._kernel = deque(maxlen=7)
+
+        self.n_samples = 0
+        self.errors = []
+        # Onset time of every window once detected (NaN except at the minima of the errors)
+        self.onsets = []
+        self.times = []
+
+        self.t_onset = None
+        self.converged = None
+        self.adjusted_t = None
+        self.crossing = None
+
+    @property
+    def detected(self) -> bool:
+        return self.t_onset is not None
+
+    def update(self, t: float, *position):
+        '''
+        Add one sample
+        :param t: time of the sample
+        :param position: coordinates of the sample (e.g. x, z)
+        :return: onset time once it has been detected, None before
+        '''
+        if self.detected:
+            return self.t_onset
+
+        p = np.asarray(position, dtype=float)
+        n = self.n_samples
+        if n == self._time.size:
+            self._grow(p.size)
+        self._time[n] = t
+        self._positions[:, n] = p
+        self.n_samples += 1
+
+        # Error of the window ending at this sample (t_mo is only solved for the minima, see _detect)
+        if self.n_samples >= 2 * self.m:
+            window = slice(self.n_samples - 2 * self.m, self.n_samples)
+            times, errors, _, _ = _fit_windows(self.m, self._positions[:, window], self._time[window],
+                                               solve_onsets=False)
+            self.times.append(times[0])
+            self.errors.append(errors[0])
+
+        # Velocity of the sample received three samples ago (initial samples padded as in calculate_velocity)
+        if not self._kernel:
+            self._kernel.extend([p] * 3)
+        self._kernel.append(p)
+        if len(self._kernel) == self._kernel.maxlen:
+            x = self._kernel
+            v = (-x[0] - 4 * x[1] - 5 * x[2] + 5 * x[4] + 4 * x[5] + x[6]) / (32 * self.step)
+            if np.linalg.norm(v) > self.vel_threshold:
+                self._detect(self.n_samples - 4)
+
+        return self.t_onset
+
+    def _grow(self, dimensions: int):
+        '''
+        Double the capacity of the buffers of the trial
+        '''
+        capacity = max(2 * self._time.size, 4 * self.m)
+        time = np.empty(capacity)
+        positions = np.empty((dimensions, capacity))
+        time[:self.n_samples] = self._time[:self.n_samples]
+        if self._positions is not None:
+            positions[:, :self.n_samples] = self._positions[:, :self.n_samples]
+        self._time, self._positions = time, positions
+
+    def _onsets(self, windows: np.array, crossing: int) -> np.array:
+        '''
+        Onset time t_mo of some windows (see _fit_windows)
+        '''
+        return _fit_windows(self.m, self._positions[:, :crossing], self._time[:crossing], windows)[2]
+
+    def _detect(self, crossing: int):
+        '''
+        Select the onset among the windows that end before the velocity threshold was crossed
+        :param crossing: index of the first sample above the velocity threshold
+        '''
+        self.crossing = crossing
+        k = crossing - 2 * self.m + 1
+        if k < 1:
+            # The movement started before two segments were received
+            self.t_onset, self.converged, self.adjusted_t = np.nan, False, False
+            return
+
+        # Only the minima (and the lowest error if there is none) can be selected, from the last one backwards
+        # while their onset is after t_th: the minima are solved from the end in blocks of increasing size
+        errors = np.asarray(self.errors[:k])
+        peaks, _ = find_peaks(-errors)
+        self.onsets = np.full(k, np.nan)
+        solved, size = 0, 1
+        while solved < peaks.size:
+            # Window selected for a minimum (the first one with the same error)
+            windows = [np.argwhere(errors == errors[p])[0][0] for p in peaks[::-1][solved:solved + size]]
+            self.onsets[windows] = self._onsets(windows, crossing)
+            solved, size = solved + size, 2 * size
+            if np.any(self.onsets[windows] <= self.t_th):
+                break
+        index, _, self.converged, self.adjusted_t = _select_onset(errors, self.onsets, self.t_th, peaks)
+        if np.isnan(self.onsets[index]):
+            self.onsets[index] = self._onsets([index], crossing)[0]
+        self.t_onset = self.onsets[index]
@@ -0,0 +1,280 @@
+'''
+Content-addressed on-disk cache of the movement onset detection.
+The key is a hash of the input arrays (positions, time, velocities) and of (m, t_th, vel_th), so re-running
+an analysis on the same data and parameters (e.g. after changing only a descriptor) skips onset_detection.
+
+Each result is one .npz file named after its key. Files are written to a temporary file and renamed
+(atomic), so several worker processes can share the same folder. The least recently used files are
+evicted when the folder grows beyond max_bytes (a hit refreshes the modification time of its file).
+The size of the folder is a running total kept in a counter file shared by every process using the folder
+and updated under a file lock, so the bound holds for concurrent workers. The folder is only scanned when
+a new result would take the total beyond max_bytes, and then emptied down to low_water * max_bytes first.
+
+    cache = OnsetCache("onset_cache")
+    t_onset, dict_results, converged, adjusted_t = cache.onset_detection(m, x, z, t, vx, vz, t_th, vel_th)
+'''
+
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from movement_onset_detection import onset_detection, OnsetResult
+from instrumentation import instrumented
+
+_VERSION = 3
+_SUFFIX = ".npz"
+# Running size of the folder, also locked while the folder is modified
+_TOTAL = "total.lock"
+# Prefix of the stored items of the coarse-to-fine search report
+_SEARCH = "search_"
+
+
+def onset_key(m: int, position_x: np.array, position_y: np.array, time: np.array,
+              velocity_x: np.array, velocity_y: np.array, t_th=np.inf, vel_th=0.80, coarse=None) -> str:
+    '''
+    Hash of the inputs of onset_detection
+    :return: hexadecimal key
+    '''
+    h = hashlib.blake2b(digest_size=20)
+    # The coarse search gives the same onset but NaN in the series and a search report (stride as in _coarse_to_fine)
+    coarse = None if coarse is None else max(int(coarse), 1)
+    h.update(repr((_VERSION, int(m), float(t_th), float(vel_th), coarse)).encode())
+    for a in (position_x, position_y, time, velocity_x, velocity_y):
+        a = np.ascontiguousarray(a, dtype=float)
+        h.update(repr(a.shape).encode())
+        h.update(a.data)
+    return h.hexdigest()
+
+
+class OnsetCache:
+    '''
+    Size-bounded LRU cache of onset_detection results in a folder
+    '''
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2 ** 20, low_water: float = 0.8):
+        '''
+        :param path: cache folder (created if needed)
+        :param max_bytes: total size of the cached results before the least recently used are evicted
+        :param low_water: fraction of max_bytes kept after an eviction
+        '''
+        if not 0 <= low_water <= 1:
+            raise ValueError("low_water must be between 0 and 1")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        # Running size of the folder when this object last updated it
+        self._total = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def get(self, key: str):
+        '''
+        :return: stored arrays of the result (see _pack) or None
+        '''
+        file = self._file(key)
+        try:
+            with np.load(file) as data:
+                stored = {k: data[k] for k in data.files}
+            # Most recently used
+            os.utime(file)
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted meanwhile by another process or unreadable
+            return None
+        return stored
+
+    @contextmanager
+    def _lock(self):
+        '''
+        Exclusive access to the folder across processes
+        :return: counter file (running size of the folder, empty until the first scan)
+        '''
+        with open(os.path.join(self.path, _TOTAL), "a+b") as counter:
+            if fcntl is not None:
+                fcntl.flock(counter, fcntl.LOCK_EX)
+            else:
+                counter.seek(0)
+                msvcrt.locking(counter.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield counter
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(counter, fcntl.LOCK_UN)
+                else:
+                    counter.seek(0)
+                    msvcrt.locking(counter.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _read_total(counter):
+        counter.seek(0)
+        try:
+            return int(counter.read())
+        except ValueError:
+            return None
+
+    def _write_total(self, counter, total: int):
+        counter.seek(0)
+        counter.truncate()
+        counter.write(str(total).encode())
+        counter.flush()
+        self._total = total
+
+    def _size(self, key: str) -> int:
+        try:
+            return os.stat(self._file(key)).st_size
+        except OSError:
+            return 0
+
+    def put(self, key: str, stored: dict):
+        '''
+        Store the arrays of a result (see _pack), the least recently used ones are evicted first if needed
+        '''
+        fd, tmp_file = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **stored)
+                size = f.tell()
+            with self._lock() as counter:
+                total = self._read_total(counter)
+                if total is None:
+                    total = self._scan()[1]
+                # Size of the replaced result
+                previous = self._size(key)
+                if total - previous + size > self.max_bytes:
+                    total = self._evict(int(self.low_water * self.max_bytes))
+                    previous = self._size(key)
+                os.replace(tmp_file, self._file(key))
+                self._write_total(counter, total - previous + size)
+        except BaseException:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise
+
+    def _scan(self) -> tuple:
+        '''
+        :return: (modification time, size, path) of every cached result, total size
+        '''
+        files = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return files, sum(f[1] for f in files)
+
+    def _evict(self, max_bytes: int) -> int:
+        '''
+        Remove the least recently used results until the folder holds at most max_bytes (the folder is locked)
+        :return: size of the folder
+        '''
+        files, total = self._scan()
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Still open (Windows) or not removable, it is still counted
+                continue
+            total -= size
+        return total
+
+    def evict(self, max_bytes: int = None):
+        '''
+        Remove the least recently used results until the folder holds at most max_bytes
+        '''
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock() as counter:
+            self._write_total(counter, self._evict(max_bytes))
+
+    def clear(self):
+        self.evict(0)
+
+    @instrumented
+    def onset_detection(self, m: int, position_x: np.array, position_y: np.array,
+                        time: np.array, velocity_x: np.array, velocity_y: np.array,
+                        t_th=np.inf, vel_th=0.80, lean=False, series=False, coarse=None) -> tuple:
+        '''
+        Same as movement_onset_detection.onset_detection, computed only if it is not in the cache
+        '''
+        key = onset_key(m, position_x, position_y, time, velocity_x, velocity_y, t_th, vel_th, coarse)
+        stored = self.get(key)
+        if stored is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            _, result, _, _ = onset_detection(m, position_x, position_y, time, velocity_x, velocity_y,
+                                              t_th=t_th, vel_th=vel_th, lean=True, series=True, coarse=coarse)
+            stored = _pack(result)
+            self.put(key, stored)
+        return _restore(stored, position_x, position_y, time, m, lean, series)
+
+
+def _pack(result: OnsetResult) -> dict:
+    '''
+    Compact arrays of a result, the winning segments are recovered from the inputs (see _restore)
+        The report of the coarse-to-fine search is stored as 'search_<key>' scalars
+    '''
+    stored = {k: np.asarray(getattr(result, k)) for k in ('t_onset', 'converged', 'adjusted_t', 'min_error', 'max_vel',
+                                                          'samples', 'window', 'Um', 'errors', 'times')}
+    if result.search is not None:
+        stored.update({_SEARCH + k: np.asarray(v) for k, v in result.search.items()})
+    return stored
+
+
+def _restore(stored: dict, position_x: np.array, position_y: np.array, time: np.array, m: int,
+             lean: bool = False, series: bool = False) -> tuple:
+    '''
+    Result of onset_detection from the stored arrays and the inputs
+    '''
+    t_onset = stored['t_onset'][()]
+    converged = bool(stored['converged'])
+    adjusted_t = bool(stored['adjusted_t'])
+    samples = tuple(int(i) for i in stored['samples'])
+    index = int(stored['window'])
+    search = {k[len(_SEARCH):]: v[()].item() for k, v in stored.items() if k.startswith(_SEARCH)} or None
+
+    if lean:
+        result = OnsetResult(m, t_onset, converged, adjusted_t, stored['min_error'][()], stored['max_vel'][()],
+                             samples, index, *((stored['Um'], stored['errors'], stored['times']) if series else ()),
+                             search=search)
+        return t_onset, result, converged, adjusted_t
+
+    indexes = np.arange(*samples)
+    s1 = slice(samples[0] + index, samples[0] + m + index)
+    s2 = slice(samples[0] + m + index - 1, samples[0] + 2 * m + index - 1)
+    dict_results = {
+        'Um': list(stored['Um']),
+        'min_error': stored['min_error'][()],
+        'errors': stored['errors'],
+        'times': stored['times'],
+        'x1': position_x[s1],
+        'y1': position_y[s1],
+        't1': time[s1],
+        'x2': position_x[s2],
+        'y2': position_y[s2],
+        't2': time[s2],
+        'max_vel': stored['max_vel'][()],
+        'indexes': indexes
+    }
+    if search is not None:
+        dict_results['search'] = search
+    return t_onset, dict_results, converged, adjusted_t
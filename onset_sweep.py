@@ -0,0 +1,140 @@
+'''
+Parameter sweep of the movement onset detection (segment length delta_T, velocity threshold vel_th and
+cutoff frequency of the filter) sharing the intermediate results between combinations:
+    - the resampled trajectory is computed once per trial
+    - the filtered positions, the velocities and the velocity peaks once per cutoff
+    - the fit of every window position once per (cutoff, delta_T), the different vel_th only select
+      a different range of windows (a window only depends on its own 2m samples)
+Each combination gives the same onset as TrialPipeline / onset_detection with those parameters.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from resample import resample_splines_array
+from filter import butter_lowpass_filter
+from derivative import calculate_velocity
+from movement_onset_detection import _velocity_peaks, _threshold_samples, _fit_windows, _select_onset
+from instrumentation import instrumented, stage
+from session_runner import find_trials, _load_raw
+
+SWEEP_DTYPE = np.dtype([('cutoff', float), ('delta_T', float), ('m', int), ('vel_th', float),
+                        ('t_onset', float), ('converged', bool), ('adjusted_t', bool)])
+
+
+@instrumented
+def sweep_trial(t_raw: np.array, x_raw: np.array, y_raw: np.array, z_raw: np.array,
+                delta_T=(0.1,), vel_th=(0.6,), cutoff=(10,), t_th=np.inf, fs=90, order=2,
+                axes=(0, 2), resample_fs=None) -> np.array:
+    '''
+    Onset of one trial for every combination of the parameters
+    :param t_raw: time (adjusted to zero)
+    :param x_raw: raw data along x
+    :param y_raw: raw data along y
+    :param z_raw: raw data along z
+    :param delta_T: durations of one segment of the onset model (s)
+    :param vel_th: percentages of max velocity (vel_th < 1)
+    :param cutoff: cutoff frequencies of the low-pass filter
+    :param t_th: temporal threshold of the onset detection
+    :param fs: sampling frequency used by the filter
+    :param order: order of the filter
+    :param axes: columns (x: 0, y: 1, z: 2) used by the onset detection
+    :param resample_fs: resample at exactly this frequency. If None, same number of samples as the raw data
+    :return: structured array (see SWEEP_DTYPE), one row per (cutoff, delta_T, vel_th) in this order.
+        t_onset is NaN (converged False) if there are not enough samples before the velocity threshold
+    '''
+    t, xyz = resample_splines_array(t_raw, x_raw, y_raw, z_raw, fs=resample_fs)
+    step = t[1] - t[0]
+    axes = list(axes)
+    vel_th = np.atleast_1d(vel_th)
+
+    results = np.zeros(len(cutoff) * len(delta_T) * vel_th.size, dtype=SWEEP_DTYPE)
+    results['cutoff'], results['delta_T'], results['vel_th'] = np.array(list(product(cutoff, delta_T, vel_th))).T
+    results['t_onset'] = np.nan
+    row = 0
+    for fc in cutoff:
+        with stage('sweep_trial.filter_velocity', t.size):
+            filtered = butter_lowpass_filter(xyz, fc, fs, order, axis=0)
+            velocities = calculate_velocity(step, filtered)
+            vel, peaks, max_v = _velocity_peaks(velocities[:, axes])
+        samples = [_threshold_samples(vel, peaks, max_v, th)[0] for th in vel_th]
+        ranges = [(s[0], s[-1] + 1) if s.size else (0, 0) for s in samples]
+
+        # Fits of the windows of every range at once
+        start = min((a for a, b in ranges if b > a), default=0)
+        stop = max(b for a, b in ranges)
+        positions = np.ascontiguousarray(filtered[start:stop, axes].T)
+
+        for dt in delta_T:
+            m = int(dt / step) - 1
+            # No range has enough samples for one window (t_onset stays NaN)
+            if stop - start >= 2 * m:
+                with stage('sweep_trial.fit_windows', stop - start - 2 * m + 1):
+                    _, errors, onsets, _ = _fit_windows(m, positions, t[start:stop])
+            for a, b in ranges:
+                results['m'][row] = m
+                if b - a >= 2 * m:
+                    # Windows of the samples [a, b)
+                    window = slice(a - start, b - start - 2 * m + 1)
+                    index, _, converged, adjusted_t = _select_onset(errors[window], onsets[window], t_th)
+                    results[row]['t_onset'] = onsets[window][index]
+                    results[row]['converged'] = converged
+                    results[row]['adjusted_t'] = adjusted_t
+                row += 1
+
+    return results
+
+
+def _sweep_task(task: dict, grids: dict) -> pd.DataFrame:
+    '''
+    Runs in a worker process
+    '''
+    try:
+        results = pd.DataFrame(sweep_trial(*_load_raw(task), t_th=task['t_th'], **grids))
+        results['error'] = ''
+    except Exception as error:
+        # A single failing trial should not stop the whole sweep
+        results = pd.DataFrame({'error': [repr(error)]})
+    results.insert(0, 'trial', task['trial'])
+    results.insert(0, 'participant', task['participant'])
+    return results
+
+
+def sweep_session(tasks: list, delta_T=(0.1,), vel_th=(0.6,), cutoff=(10,), fs=90, order=2, axes=(0, 2),
+                  workers: int = None, chunksize: int = 8) -> pd.DataFrame:
+    '''
+    Parameter sweep over several trials (see session_runner.find_trials)
+    :param tasks: trials to process
+    :param workers: number of worker processes (os.cpu_count() if None, 0 runs in this process)
+    :param chunksize: number of trials sent to a worker at once
+    :return: tidy table, one row per (participant, trial, cutoff, delta_T, vel_th)
+    '''
+    grids = {'delta_T': tuple(delta_T), 'vel_th': tuple(vel_th), 'cutoff': tuple(cutoff), 'fs': fs,
+             'order': order, 'axes': tuple(axes)}
+    if workers == 0:
+        tables = [_sweep_task(task, grids) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tables = list(executor.map(_sweep_task, tasks, [grids] * len(tasks), chunksize=chunksize))
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Onset detection for every combination of the parameters")
+    parser.add_argument("root", help="dataset root (e.g. VR-S1)")
+    parser.add_argument("output", help="csv file for the results table")
+    parser.add_argument("--session", default="S001")
+    parser.add_argument("--delta-T", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--vel-th", type=float, nargs="+", default=[0.6])
+    parser.add_argument("--cutoff", type=float, nargs="+", default=[10])
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sweep_session(find_trials(args.root, args.session), args.delta_T, args.vel_th, args.cutoff,
+                  workers=args.workers).to_csv(args.output, index=False)
@@ -0,0 +1,197 @@
+'''
+Many trials stored in one contiguous array plus an offsets index (flat + offsets layout).
+Trial i is positions[offsets[i]:offsets[i + 1]]. The batch descriptor functions process every trial
+at once with segment-wise reductions and follow the 2D/3D conventions of the single-trial functions
+(See the document Geometric Descriptors of Curvature for more details)
+'''
+
+import numpy as np
+
+from instrumentation import instrumented
+
+
+class RaggedTrajectories:
+    '''
+    Ragged store of trajectories: positions (N_total, d) and offsets (n_trials + 1,)
+    '''
+
+    def __init__(self, positions: np.array, offsets: np.array):
+        '''
+        :param positions: samples of all trials, one row per sample (N_total, d)
+        :param offsets: start of each trial followed by N_total (n_trials + 1,)
+        '''
+        self.positions = np.asarray(positions, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        if self.positions.ndim != 2:
+            raise ValueError("positions must be a two-dimensional array (N_total, d)")
+        if self.offsets[0] != 0 or self.offsets[-1] != self.positions.shape[0] or np.any(np.diff(self.offsets) < 0):
+            raise ValueError("offsets must be non-decreasing, start at 0 and end at N_total")
+
+    @classmethod
+    def from_trials(cls, trials):
+        '''
+        Build the store from a sequence of trials
+        :param trials: sequence of (n_i, d) arrays
+        :return: RaggedTrajectories
+        '''
+        trials = [np.asarray(trial, dtype=float) for trial in trials]
+        offsets = np.zeros(len(trials) + 1, dtype=np.int64)
+        np.cumsum([trial.shape[0] for trial in trials], out=offsets[1:])
+        return cls(np.concatenate(trials, axis=0), offsets)
+
+    @property
+    def lengths(self) -> np.array:
+        return np.diff(self.offsets)
+
+    @property
+    def dimensions(self) -> int:
+        return self.positions.shape[1]
+
+    def __len__(self):
+        return self.offsets.size - 1
+
+    def __getitem__(self, i):
+        # View, no copy
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def segment_ids(self) -> np.array:
+        '''
+        :return: trial index of every sample (N_total,)
+        '''
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+
+def _columns(ragged: RaggedTrajectories, columns):
+    if columns is None:
+        return ragged.positions
+    return ragged.positions[:, list(columns)]
+
+
+def _segment_argmax(values: np.array, offsets: np.array, segment_ids: np.array):
+    '''
+    Maximum of each segment and index (global) of its first occurrence (first NaN like np.argmax)
+    '''
+    starts = offsets[:-1]
+    max_values = np.maximum.reduceat(values, starts)
+    # The maximum of a segment is NaN if it has a NaN
+    hits = (values == max_values[segment_ids]) | np.isnan(values)
+    hits = np.where(hits, np.arange(values.size), values.size)
+    return max_values, np.minimum.reduceat(hits, starts)
+
+
+def _deviations(ragged: RaggedTrajectories, columns):
+    '''
+    Signed perpendicular distance of every sample to the line between the first and last sample of its trial
+    :return:
+        - positions (N_total, d)
+        - perpendicular distances, -inf at the first and last sample of every trial (N_total,)
+        - signs (N_total,)
+        - trial index of every sample (N_total,)
+    '''
+    if np.any(ragged.lengths < 3):
+        raise ValueError("Every trial needs at least three samples")
+
+    xy = _columns(ragged, columns)
+    ids = ragged.segment_ids()
+    # Initial and final samples
+    pi = xy[ragged.offsets[:-1]]
+    pf = xy[ragged.offsets[1:] - 1]
+
+    vn = xy - pi[ids]
+    vf = (pf - pi)[ids]
+    norms = np.linalg.norm(vn, axis=1)
+
+    if xy.shape[1] == 2:
+        # Signed angle, with pf[0] < 0 swapping the vectors
+        flip = (pf[:, 0] < 0)[ids]
+        v1 = np.where(flip[:, None], vf, vn)
+        v2 = np.where(flip[:, None], vn, vf)
+        det = v2[:, 0] * v1[:, 1] - v2[:, 1] * v1[:, 0]
+        ang = np.arctan2(det, np.sum(v1 * v2, axis=1))
+        dis = norms * np.sin(np.abs(ang))
+        signs = np.sign(ang)
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            arg = np.sum(vn * vf, axis=1) / (norms * np.linalg.norm(vf, axis=1))
+            dis = norms * np.sin(np.arccos(arg))
+
+        # Plane defined by pi, pf and the normal vector p2 (one per trial)
+        p2 = np.column_stack((pf[:, 0], pf[:, 1], pi[:, 2]))
+        flip = (pf[:, 0] < 0)[:, None]
+        va = np.where(flip, p2 - pi, pf - pi)
+        vb = np.where(flip, pf - pi, p2 - pi)
+        va_n = va / np.linalg.norm(va, axis=1, keepdims=True)
+        vb_n = vb / np.linalg.norm(vb, axis=1, keepdims=True)
+        axb = np.cross(va_n, vb_n)
+        vp_n = axb / np.linalg.norm(axb, axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vt_n = vn / norms[:, None]
+            signs = np.sign(np.arcsin(np.sum(vt_n * vp_n[ids], axis=1)))
+
+    # Only the rest of the samples (neither first nor last) are considered
+    dis[ragged.offsets[:-1]] = -np.inf
+    dis[ragged.offsets[1:] - 1] = -np.inf
+
+    return xy, dis, signs, ids
+
+
+@instrumented
+def batch_maximum_deviation(ragged: RaggedTrajectories, columns=None):
+    '''
+    Maximum deviation of every trial
+    :param ragged: trajectories
+    :param columns: columns of ragged.positions to use (2 for 2D, 3 for 3D). All columns if None
+    :return:
+        - Maximum Perpendicular Deviation (MPD) of every trial (n_trials,)
+        - Coordinates corresponding to MPD (n_trials, d)
+    '''
+    xy, dis, signs, ids = _deviations(ragged, columns)
+    max_dis, idx = _segment_argmax(dis, ragged.offsets, ids)
+    return signs[idx] * max_dis, xy[idx]
+
+
+@instrumented
+def batch_total_curvature(ragged: RaggedTrajectories, columns=None):
+    '''
+    Total curvature of every trial
+    :param ragged: trajectories
+    :param columns: columns of ragged.positions to use (2 for 2D, 3 for 3D). All columns if None
+    :return: total curvature of every trial (n_trials,)
+    '''
+    _, dis, signs, _ = _deviations(ragged, columns)
+    signed = np.multiply(signs, dis, out=np.zeros_like(dis), where=~np.isneginf(dis))
+    return np.add.reduceat(signed, ragged.offsets[:-1]) / (ragged.lengths - 2)
+
+
+@instrumented
+def batch_maximal_log_ratio(ragged: RaggedTrajectories, t1, t2, columns=None):
+    '''
+    Max log ratio of every trial (t2 is always the correct target, t1 is the alternative target)
+    :param ragged: trajectories
+    :param t1: alternative target (d,) or one per trial (n_trials, d)
+    :param t2: correct target (d,) or one per trial (n_trials, d)
+    :param columns: columns of ragged.positions to use (2 for 2D, 3 for 3D). All columns if None
+    :return:
+        - Max log ratio (MLR) of every trial (n_trials,)
+        - Coordinates corresponding to MLR (n_trials, d)
+    '''
+    if np.any(ragged.lengths < 1):
+        raise ValueError("Every trial needs at least one sample")
+
+    xy = _columns(ragged, columns)
+    ids = ragged.segment_ids()
+    t1 = np.asarray(t1, dtype=float)
+    t2 = np.asarray(t2, dtype=float)
+    t1 = t1[ids] if t1.ndim == 2 else t1
+    t2 = t2[ids] if t2.ndim == 2 else t2
+
+    # Distance to alternative target
+    d_1 = np.linalg.norm(xy - t1, axis=1)
+    # Distance to correct target
+    d_2 = np.linalg.norm(xy - t2, axis=1)
+    # Log Ratio
+    log_ratio = np.log(d_2 / d_1)
+
+    max_log_ratio, idx = _segment_argmax(log_ratio, ragged.offsets, ids)
+    return max_log_ratio, xy[idx]
@@ -6,13 +6,91 @@ import numpy as np
 import pandas as pd
 from scipy import interpolate
 
+from ragged_trajectories import RaggedTrajectories
+from instrumentation import instrumented
 
+
+@instrumented
 def resample_splines(t: np.array, x: np.array, y: np.array, z: np.array):
-    n_steps = t.size
+    t_resampled, xyz = resample_splines_array(t, x, y, z)
+    return pd.DataFrame.from_dict({'t': t_resampled, 'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2]})
+
+
+def resampled_time(t: np.array, fs: float = None) -> np.array:
+    '''
+    Uniform time grid between the first and last samples
+    :param t: non-uniform time
+    :param fs: target sampling frequency. If None, the grid has the same number of samples as t
+    :return: resampled time
+    '''
+    if fs is None:
+        return np.linspace(t.min(), t.max(), t.size)
+    # Samples at exactly 1/fs, the last one is not after t.max()
+    n_steps = int(np.floor((t.max() - t.min()) * fs + 1e-9)) + 1
+    return t.min() + np.arange(n_steps) / fs
+
+
+def spline_representation(t: np.array, x: np.array, y: np.array, z: np.array):
+    '''
+    Interpolating cubic splines of the three dimensions parameterized by time (see spline_descriptors)
+    :param t: non-uniform time
+    :param x: trajectory data along a first dimension
+    :param y: trajectory data along a second dimension
+    :param z: trajectory data along a third dimension
+    :return: tck (knots, coefficients of x, y and z, degree) as returned by interpolate.splprep
+    '''
     tck, _ = interpolate.splprep([x, y, z], u=t, s=0)
-    t_resampled = np.linspace(t.min(), t.max(), n_steps)
-    x_resampled, y_resampled, z_resampled = interpolate.splev(t_resampled, tck)
-    return pd.DataFrame.from_dict({'t': t_resampled, 'x': x_resampled, 'y': y_resampled, 'z': z_resampled})
+    return tck
+
+
+@instrumented
+def resample_splines_array(t: np.array, x: np.array, y: np.array, z: np.array, fs: float = None,
+                           out: np.array = None):
+    '''
+    Same as resample_splines but returns arrays instead of a DataFrame
+    :param t: non-uniform time
+    :param x: trajectory data along a first dimension
+    :param y: trajectory data along a second dimension
+    :param z: trajectory data along a third dimension
+    :param fs: target sampling frequency (e.g. 90). If None, same number of samples as t
+    :param out: buffer for the resampled positions (n, 3), n must match the resampled time
+    :return:
+        - resampled time (n,)
+        - resampled positions, one column per dimension (n, 3). Contiguous, out if given
+    '''
+    tck = spline_representation(t, x, y, z)
+    t_resampled = resampled_time(t, fs)
+
+    if out is None:
+        out = np.empty((t_resampled.size, 3))
+    elif out.shape != (t_resampled.size, 3):
+        raise ValueError("out must have shape ({}, 3)".format(t_resampled.size))
+
+    for i, c in enumerate(interpolate.splev(t_resampled, tck)):
+        out[:, i] = c
+    return t_resampled, out
+
+
+@instrumented
+def resample_session(trials, fs: float = None):
+    '''
+    Resample every trial of a session into one contiguous buffer
+    :param trials: sequence of (t, x, y, z) of each trial
+    :param fs: target sampling frequency (e.g. 90). If None, each trial keeps its number of samples
+    :return:
+        - resampled time of all trials (N_total,)
+        - resampled positions of all trials (RaggedTrajectories, trial i is positions[offsets[i]:offsets[i + 1]])
+    '''
+    times = [resampled_time(np.asarray(trial[0]), fs) for trial in trials]
+    offsets = np.zeros(len(times) + 1, dtype=np.int64)
+    np.cumsum([t_resampled.size for t_resampled in times], out=offsets[1:])
+
+    t_all = np.concatenate(times) if times else np.empty(0)
+    positions = np.empty((offsets[-1], 3))
+    for i, (t, x, y, z) in enumerate(trials):
+        resample_splines_array(t, x, y, z, fs, out=positions[offsets[i]:offsets[i + 1]])
+
+    return t_all, RaggedTrajectories(positions, offsets)
 
 
 if __name__ == "__main__":
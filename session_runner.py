@@ -0,0 +1,372 @@
+'''
+Run movement onset detection and the geometric descriptors over every trial of a dataset
+    using a pool of worker processes. The results of all trials are written to one table.
+
+With shared=True the trials are copied once into a shared memory block (see shared_arrays), straight from
+the memory-mapped session caches when they are used, the workers only receive ranges of trial indexes and write
+the numeric results into the same block, so no trajectory or result row is pickled and the memory does not grow
+with the number of workers.
+
+Expected layout (VR-S1):
+    root/P##/S001/trial_results.csv
+    root/P##/S001/trackers/controllertracker_movement_T###.csv
+'''
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from trial_pipeline import TrialPipeline
+import instrumentation
+from tracker_cache import open_session_cache, SessionCache
+from onset_cache import OnsetCache
+from shared_arrays import SharedArrays
+
+_PARTICIPANT = re.compile(r"^P(\d+)$")
+_TRIAL = re.compile(r"^controllertracker_movement_T(\d+)\.csv$")
+
+DEFAULT_PARAMETERS = {
+    'cutoff': 10,  # Hz
+    'fs': 90,  # Hz
+    'order': 2,
+    'delta_T': 0.1,  # 100 ms.
+    'vel_th': 0.6,
+    'onset_cache': None,  # folder of the onset detection cache (see onset_cache)
+    'onset_coarse': None  # stride of the coarse-to-fine window search (None: exhaustive)
+}
+
+# Numeric columns of the results table written by the workers into shared memory (see run)
+SHARED_COLUMNS = ('t_onset', 'converged', 'adjusted_t', 'idx', 'tot_cur_2d', 'tot_cur_3d', 'max_dev_2d', 'max_dev_3d',
+                  'max_log_ratio_2d', 'max_log_ratio_3d') + tuple('time_' + s for s in TrialPipeline.STAGES)
+
+
+# Session caches and pipelines of this process
+_caches = {}
+_pipelines = {}
+# Shared memory block and parameters of this worker process (see _attach_shared)
+_shared = {}
+
+
+def find_trials(root: str, session: str = "S001", use_cache: bool = False) -> list:
+    '''
+    Find every trial of every participant in the dataset
+    :param root: dataset root (e.g. VR-S1)
+    :param session: session folder
+    :param use_cache: read the trials from the binary cache of each session (see tracker_cache)
+    :return: list of tasks (one dictionary per trial) sorted by participant and trial
+    '''
+    tasks = []
+    for participant_folder in sorted(os.listdir(root)):
+        match = _PARTICIPANT.match(participant_folder)
+        path_ = os.path.join(root, participant_folder, session)
+        if match is None or not os.path.isdir(path_):
+            continue
+
+        if use_cache:
+            cache = open_session_cache(path_)
+            results = cache.results
+        else:
+            cache = None
+            results = pd.read_csv(os.path.join(path_, "trial_results.csv"))
+        start_time = np.asarray(results['start_time'])
+        initiation_time = np.asarray(results['initial_time'])
+        t_threshold = initiation_time - start_time
+        fin_pos_x = np.asarray(results['fin_pos_x']) if 'fin_pos_x' in results else None
+
+        path_trackers = os.path.join(path_, "trackers")
+        for file_name in sorted(os.listdir(path_trackers)):
+            match_trial = _TRIAL.match(file_name)
+            if match_trial is None:
+                continue
+            trial_number = int(match_trial.group(1))
+            tasks.append({
+                'participant': int(match.group(1)),
+                'trial': trial_number,
+                'path': os.path.join(path_trackers, file_name),
+                'start_time': start_time[trial_number - 1],
+                't_th': t_threshold[trial_number - 1],
+                'fin_pos_x': None if fin_pos_x is None else fin_pos_x[trial_number - 1],
+                'cache': None if cache is None else cache.cache_path
+            })
+    return tasks
+
+
+def _targets(fin_pos_x):
+    '''
+    NOTE: THIS IS ONLY CORRECT FOR VR-S1
+    :return: alternative target, correct target (None if fin_pos_x is not known)
+    '''
+    if fin_pos_x is None:
+        return None, None
+    if fin_pos_x < 0:
+        return np.array([0.25, 0.65, 1]), np.array([-0.25, 0.65, 1])  # Left is correct
+    return np.array([-0.25, 0.65, 1]), np.array([0.25, 0.65, 1])  # Right is correct
+
+
+def _read_raw(task: dict):
+    '''
+    :return: time (not adjusted), pos_x, pos_y, pos_z of one trial (read-only views of the session cache if any)
+    '''
+    if task.get('cache') is not None:
+        if task['cache'] not in _caches:
+            _caches[task['cache']] = SessionCache(task['cache'])
+        return _caches[task['cache']].trial(task['trial'])
+    raw_data = pd.read_csv(task['path'], usecols=['time', 'pos_x', 'pos_y', 'pos_z'])
+    return tuple(raw_data[c].to_numpy() for c in ('time', 'pos_x', 'pos_y', 'pos_z'))
+
+
+def _load_raw(task: dict):
+    '''
+    :return: time (adjusted to zero), pos_x, pos_y, pos_z of one trial
+    '''
+    time, pos_x, pos_y, pos_z = _read_raw(task)
+    return time - task['start_time'], pos_x, pos_y, pos_z
+
+
+def _pipeline(parameters: dict) -> TrialPipeline:
+    '''
+    Pipeline of this process for the given parameters (buffers are reused across trials)
+    '''
+    key = tuple(sorted(parameters.items()))
+    if key not in _pipelines:
+        onset_cache = parameters.get('onset_cache')
+        _pipelines[key] = TrialPipeline(parameters['cutoff'], parameters['fs'], parameters['order'],
+                                        parameters['delta_T'], parameters['vel_th'],
+                                        onset_cache=None if onset_cache is None else OnsetCache(onset_cache),
+                                        onset_coarse=parameters.get('onset_coarse'))
+    return _pipelines[key]
+
+
+def _process(row: dict, parameters: dict, t_raw, x_raw, y_raw, z_raw, t_th, fin_pos_x):
+    '''
+    Fill one row of the results table from the raw data of a trial (time adjusted to zero)
+    '''
+    results = _pipeline(parameters).process_trial(t_raw, x_raw, y_raw, z_raw, t_th, *_targets(fin_pos_x))
+    for k in ('t_onset', 'converged', 'adjusted_t', 'idx', 'tot_cur_2d', 'tot_cur_3d'):
+        row[k] = results[k]
+    for k in ('max_dev_2d', 'max_dev_3d', 'max_log_ratio_2d', 'max_log_ratio_3d'):
+        if k in results:
+            row[k] = results[k][0]
+    row.update({'time_' + stage: value for stage, value in results['timings'].items()})
+
+
+def process_trial(task: dict, parameters: dict = None) -> dict:
+    '''
+    resample -> filter -> velocity -> onset detection -> descriptors for one trial (see TrialPipeline)
+    :param task: trial description (see find_trials)
+    :param parameters: processing parameters (see DEFAULT_PARAMETERS)
+    :return: one row of the results table
+    '''
+    parameters = {**DEFAULT_PARAMETERS, **(parameters or {})}
+    row = {'participant': task['participant'], 'trial': task['trial'], 'error': ''}
+
+    try:
+        # Load Raw Data (adjusted to zero)
+        t_raw, x_raw, y_raw, z_raw = _load_raw(task)
+        _process(row, parameters, t_raw, x_raw, y_raw, z_raw, task['t_th'], task.get('fin_pos_x'))
+    except Exception as error:
+        # A single failing trial should not stop the whole run
+        row['error'] = repr(error)
+
+    return row
+
+
+def share_tasks(tasks: list) -> tuple:
+    '''
+    Copy every trial into one shared memory block (straight from the memory-mapped session caches if any)
+    :param tasks: trials to process (see find_trials)
+    :return:
+        - SharedArrays (the caller closes it) with 'samples' (4, N_total): time (adjusted to zero), pos_x, pos_y
+          and pos_z of all trials, 'offsets' (n_trials + 1,), 'trials' (n_trials, 3): t_th, fin_pos_x (NaN if
+          unknown) and loaded (0 if the trial could not be loaded), 'results' (n_trials, len(SHARED_COLUMNS))
+        - errors of the trials that could not be loaded {trial index: error}
+    '''
+    raw, errors = [], {}
+    for i, task in enumerate(tasks):
+        try:
+            raw.append(_read_raw(task))
+        except Exception as error:
+            raw.append((np.empty(0),) * 4)
+            errors[i] = repr(error)
+    offsets = np.zeros(len(tasks) + 1, dtype=np.int64)
+    np.cumsum([r[0].size for r in raw], out=offsets[1:])
+
+    shared = SharedArrays.create({
+        'samples': ((4, offsets[-1]), float),
+        'offsets': (offsets.shape, np.int64),
+        'trials': ((len(tasks), 3), float),
+        'results': ((len(tasks), len(SHARED_COLUMNS)), float)
+    })
+    shared['offsets'][:] = offsets
+    for i, (task, columns) in enumerate(zip(tasks, raw)):
+        block = shared['samples'][:, offsets[i]:offsets[i + 1]]
+        for c, values in enumerate(columns):
+            block[c] = values
+        # Adjusted to zero
+        block[0] -= task['start_time']
+        fin_pos_x = task.get('fin_pos_x')
+        shared['trials'][i] = task['t_th'], np.nan if fin_pos_x is None else fin_pos_x, i not in errors
+    shared['results'][:] = np.nan
+    return shared, errors
+
+
+def _attach_shared(handle: tuple, parameters: dict):
+    '''
+    Initializer of the worker processes
+    '''
+    _shared['arrays'] = SharedArrays.attach(handle)
+    _shared['parameters'] = {**DEFAULT_PARAMETERS, **(parameters or {})}
+
+
+def _process_shared_chunk(start: int, stop: int, instrument: bool = False):
+    '''
+    Runs in a worker process: trials [start, stop) of the shared block, the results are written into the block
+    :return: errors {trial index: error}, instrumentation report of the chunk (None if instrument is False)
+    '''
+    if instrument:
+        instrumentation.enable()
+        instrumentation.reset()
+    arrays = _shared['arrays']
+    samples, offsets, trials, results = (arrays[k] for k in ('samples', 'offsets', 'trials', 'results'))
+
+    errors = {}
+    for i in range(start, stop):
+        if not trials[i, 2]:
+            continue
+        row = {}
+        try:
+            t_raw, x_raw, y_raw, z_raw = samples[:, offsets[i]:offsets[i + 1]]
+            fin_pos_x = None if np.isnan(trials[i, 1]) else trials[i, 1]
+            _process(row, _shared['parameters'], t_raw, x_raw, y_raw, z_raw, trials[i, 0], fin_pos_x)
+        except Exception as error:
+            # A single failing trial should not stop the whole run
+            errors[i] = repr(error)
+        results[i] = [row.get(k, np.nan) for k in SHARED_COLUMNS]
+    return errors, instrumentation.report() if instrument else None
+
+
+def _shared_rows(tasks: list, results: np.array, trials: np.array, errors: dict) -> list:
+    '''
+    Rows of the results table from the shared results (same rows as process_trial)
+    '''
+    rows = []
+    for i, task in enumerate(tasks):
+        row = {'participant': task['participant'], 'trial': task['trial'], 'error': errors.get(i, '')}
+        if i not in errors:
+            for k, value in zip(SHARED_COLUMNS, results[i]):
+                if k.startswith('max_log_ratio') and np.isnan(trials[i, 1]):
+                    # No targets
+                    continue
+                row[k] = bool(value) if k in ('converged', 'adjusted_t') else int(value) if k == 'idx' else value
+        rows.append(row)
+    return rows
+
+
+def _process_chunk(tasks, parameters, instrument=False):
+    '''
+    Runs in a worker process
+    :return: rows, instrumentation report of the chunk (None if instrument is False)
+    '''
+    if instrument:
+        instrumentation.enable()
+        instrumentation.reset()
+    rows = [process_trial(task, parameters) for task in tasks]
+    return rows, instrumentation.report() if instrument else None
+
+
+def run(tasks: list, workers: int = None, chunksize: int = 8, parameters: dict = None,
+        instrument: bool = False, shared: bool = False) -> pd.DataFrame:
+    '''
+    Process trials over a pool of worker processes
+    :param tasks: trials to process (see find_trials)
+    :param workers: number of worker processes (os.cpu_count() if None, 0 runs in this process)
+    :param chunksize: number of trials sent to a worker at once
+    :param parameters: processing parameters (see DEFAULT_PARAMETERS)
+    :param instrument: collect the instrumentation of every worker into this process (see instrumentation)
+    :param shared: send the trials to the workers through shared memory (see share_tasks)
+    :return: results table, one row per trial
+    '''
+    if workers == 0:
+        if instrument:
+            instrumentation.enable()
+        rows = [process_trial(task, parameters) for task in tasks]
+        return pd.DataFrame(rows)
+
+    if shared:
+        arrays, errors = share_tasks(tasks)
+        try:
+            starts = list(range(0, len(tasks), chunksize))
+            stops = [min(start + chunksize, len(tasks)) for start in starts]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                     initargs=(arrays.handle, parameters)) as executor:
+                for chunk_errors, report in executor.map(_process_shared_chunk, starts, stops,
+                                                         [instrument] * len(starts)):
+                    errors.update(chunk_errors)
+                    if report is not None:
+                        instrumentation.merge(report)
+            rows = _shared_rows(tasks, arrays['results'], arrays['trials'], errors)
+        finally:
+            arrays.close()
+        return pd.DataFrame(rows)
+
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_rows, report in executor.map(_process_chunk, chunks, [parameters] * len(chunks),
+                                               [instrument] * len(chunks)):
+            rows.extend(chunk_rows)
+            if report is not None:
+                instrumentation.merge(report)
+    return pd.DataFrame(rows)
+
+
+def run_dataset(root: str, output: str = None, session: str = "S001", workers: int = None,
+                chunksize: int = 8, parameters: dict = None, use_cache: bool = False,
+                instrument: bool = False, shared: bool = False) -> pd.DataFrame:
+    '''
+    Process every trial of the dataset and write the consolidated results table
+    :param root: dataset root (e.g. VR-S1)
+    :param output: csv file for the results table (not written if None)
+    :param session: session folder
+    :param workers: number of worker processes (os.cpu_count() if None, 0 runs in this process)
+    :param chunksize: number of trials sent to a worker at once
+    :param parameters: processing parameters (see DEFAULT_PARAMETERS)
+    :param use_cache: read the trials from the binary cache of each session (see tracker_cache)
+    :param instrument: collect the instrumentation of every worker (see instrumentation)
+    :param shared: send the trials to the workers through shared memory (see share_tasks)
+    :return: results table, one row per trial
+    '''
+    results = run(find_trials(root, session, use_cache), workers, chunksize, parameters, instrument, shared)
+    if output is not None:
+        results.to_csv(output, index=False)
+    return results
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Movement onset and geometric descriptors for a whole dataset")
+    parser.add_argument("root", help="dataset root (e.g. VR-S1)")
+    parser.add_argument("output", help="csv file for the results table")
+    parser.add_argument("--session", default="S001")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--vel-th", type=float, default=DEFAULT_PARAMETERS['vel_th'])
+    parser.add_argument("--cutoff", type=float, default=DEFAULT_PARAMETERS['cutoff'])
+    parser.add_argument("--cache", action="store_true", help="use the binary cache of each session")
+    parser.add_argument("--profile", help="json file for the instrumentation report")
+    parser.add_argument("--onset-cache", help="folder of the onset detection cache")
+    parser.add_argument("--coarse", type=int, default=None, help="stride of the coarse-to-fine onset search")
+    parser.add_argument("--shared", action="store_true", help="send the trials to the workers through shared memory")
+    args = parser.parse_args()
+
+    run_dataset(args.root, args.output, args.session, args.workers, args.chunksize,
+                {'vel_th': args.vel_th, 'cutoff': args.cutoff, 'onset_cache': args.onset_cache,
+                 'onset_coarse': args.coarse},
+                args.cache, args.profile is not None, args.shared)
+    if args.profile is not None:
+        instrumentation.to_json(args.profile)
@@ -0,0 +1,92 @@
+'''
+Numpy arrays in one multiprocessing.shared_memory block, to hand a whole session to worker processes
+without pickling it. The process that creates the block owns it (and unlinks it), the workers attach
+to it by name from a small handle and get zero-copy views of every array.
+
+    with SharedArrays.create({'samples': ((n, 4), float), 'offsets': ((k + 1,), np.int64)}) as shared:
+        shared['samples'][:] = ...
+        executor.map(work, ..., [shared.handle] * ...)    # work: SharedArrays.attach(handle)['samples']
+'''
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Alignment of every array in the block (bytes)
+_ALIGNMENT = 64
+
+
+class SharedArrays:
+    '''
+    Named arrays of one shared memory block
+    '''
+
+    def __init__(self, memory: shared_memory.SharedMemory, layout: dict, owner: bool):
+        '''
+        Use SharedArrays.create or SharedArrays.attach
+        :param memory: shared memory block
+        :param layout: name -> (offset in bytes, shape, dtype string)
+        :param owner: the block is unlinked when this object is closed
+        '''
+        self.memory = memory
+        self.layout = layout
+        self.owner = owner
+        self._arrays = {name: np.ndarray(shape, np.dtype(dtype), buffer=memory.buf, offset=offset)
+                        for name, (offset, shape, dtype) in layout.items()}
+
+    @classmethod
+    def create(cls, specs: dict) -> 'SharedArrays':
+        '''
+        Allocate a new block (the arrays are not initialized)
+        :param specs: name -> (shape, dtype)
+        :return: SharedArrays owning the block
+        '''
+        layout = {}
+        size = 0
+        for name, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            shape = tuple(int(s) for s in np.atleast_1d(shape))
+            layout[name] = (size, shape, dtype.str)
+            size += -(-int(np.prod(shape)) * dtype.itemsize // _ALIGNMENT) * _ALIGNMENT
+        return cls(shared_memory.SharedMemory(create=True, size=max(size, 1)), layout, owner=True)
+
+    @classmethod
+    def attach(cls, handle: tuple) -> 'SharedArrays':
+        '''
+        Attach to a block created by another process
+        :param handle: see SharedArrays.handle
+        :return: SharedArrays (not owner)
+        '''
+        name, layout = handle
+        # Child processes share the resource tracker of their parent, the block is only unlinked by its owner
+        return cls(shared_memory.SharedMemory(name=name), layout, owner=False)
+
+    @property
+    def handle(self) -> tuple:
+        '''
+        Picklable reference to the block: name and layout
+        '''
+        return self.memory.name, self.layout
+
+    @property
+    def nbytes(self) -> int:
+        return self.memory.size
+
+    def __getitem__(self, name: str) -> np.array:
+        return self._arrays[name]
+
+    def close(self):
+        '''
+        Release the views and the block (unlinked if this process created it).
+            The arrays must not be used afterwards (copy what is needed first)
+        '''
+        self._arrays = {}
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,242 @@
+'''
+Geometric descriptors evaluated on the continuous spline of a trajectory (see resample.spline_representation)
+instead of its resampled samples. On each spline segment the coordinates are cubic polynomials of time, so:
+    - Maximum deviation: the (squared) distance to the line pi-pf is a polynomial per segment, its maximum
+      is at a root of its derivative or at an end
+    - Maximal log ratio: the stationary points of log(d_2 / d_1) are the roots of
+      (d_2^2)' d_1^2 - (d_1^2)' d_2^2, a polynomial per segment
+    - Total curvature: time average of the signed distance. The 2D signed distance is a polynomial
+      (integrated exactly), the 3D one is integrated by Gauss-Legendre quadrature on every segment
+      (split where the sign changes)
+The results are the limits of maximum_deviation_*, maximal_log_ratio_* and total_curvature_* when the
+spline is resampled at an increasing frequency, so the descriptors do not depend on the resampling rate.
+Same conventions as the discrete functions (See the document Geometric Descriptors of Curvature for more details)
+'''
+
+import numpy as np
+from scipy.interpolate import PPoly
+
+from maximum_deviation import _get_sign_3d
+from instrumentation import instrumented
+
+# Gauss-Legendre nodes and weights on [0, 1]
+_NODES, _WEIGHTS = np.polynomial.legendre.leggauss(8)
+_NODES = (_NODES + 1) / 2
+_WEIGHTS = _WEIGHTS / 2
+
+
+def _multiply(a: np.array, b: np.array) -> np.array:
+    '''
+    Product of piecewise polynomials given by their coefficients (highest power first, one column per segment)
+    '''
+    c = np.zeros((a.shape[0] + b.shape[0] - 1, a.shape[1]))
+    for i in range(a.shape[0]):
+        c[i:i + b.shape[0]] += a[i] * b
+    return c
+
+
+class SplineTrajectory:
+    '''
+    Part [start, stop] of the spline of a trajectory, each coordinate is a cubic polynomial on every segment
+        Two coordinates use the 2D conventions, three coordinates use the 3D conventions
+    '''
+
+    def __init__(self, tck, start: float = None, stop: float = None, axes=(0, 2)):
+        '''
+        :param tck: splines of the trajectory (see resample.spline_representation)
+        :param start: first time (e.g. movement onset). None for the first sample
+        :param stop: last time. None for the last sample
+        :param axes: coordinates of the descriptors (x: 0, y: 1, z: 2), e.g. (0, 2) for 2D or (0, 2, 1) for 3D
+        '''
+        knots, coefficients, degree = tck
+        self.start = knots[degree] if start is None else start
+        self.stop = knots[-degree - 1] if stop is None else stop
+        if not self.start < self.stop:
+            raise ValueError("start must be before stop")
+
+        splines = [PPoly.from_spline((knots, coefficients[a], degree)) for a in axes]
+        # Only the segments of [start, stop]
+        first = max(np.searchsorted(splines[0].x, self.start, side='right') - 1, 0)
+        last = min(np.searchsorted(splines[0].x, self.stop, side='left'), splines[0].x.size - 1)
+        self.breaks = splines[0].x[first:last + 1]
+        # Coefficients of every coordinate (degree + 1, segments)
+        self.c = [s.c[:, first:last] for s in splines]
+        # Initial sample
+        self.pi = self.position(self.start)
+        # Final sample
+        self.pf = self.position(self.stop)
+
+    @property
+    def dimensions(self) -> int:
+        return len(self.c)
+
+    def position(self, u) -> np.array:
+        '''
+        :param u: time (scalar or array)
+        :return: coordinates at u (..., d)
+        '''
+        return np.stack([PPoly(c, self.breaks)(u) for c in self.c], axis=-1)
+
+    def _shifted(self, p) -> list:
+        '''
+        :return: coefficients of every coordinate of the trajectory minus the point p
+        '''
+        shifted = [c.copy() for c in self.c]
+        for c, value in zip(shifted, p):
+            c[-1] -= value
+        return shifted
+
+    def _roots(self, c: np.array) -> np.array:
+        '''
+        :return: roots of the piecewise polynomial c in (start, stop)
+        '''
+        roots = PPoly(c, self.breaks).roots(discontinuity=False, extrapolate=False)
+        return roots[np.isfinite(roots) & (roots > self.start) & (roots < self.stop)]
+
+    def _extrema(self, c: np.array) -> np.array:
+        '''
+        :return: times where the piecewise polynomial c can be maximal in [start, stop]
+        '''
+        derivative = PPoly(c, self.breaks).derivative().c
+        return np.concatenate(([self.start, self.stop], self._roots(derivative)))
+
+    def _signed_distance_2d(self) -> np.array:
+        '''
+        :return: coefficients of the signed distance to the line pi-pf (same orientation as _get_angle_2d)
+        '''
+        chord = self.pf - self.pi
+        vx, vy = self._shifted(self.pi)
+        det = chord[0] * vy - chord[1] * vx
+        if self.pf[0] < 0:
+            det = -det
+        return det / np.linalg.norm(chord)
+
+    def _squared_distance_3d(self) -> np.array:
+        '''
+        :return: coefficients of the squared distance to the line pi-pf
+        '''
+        chord = self.pf - self.pi
+        chord = chord / np.linalg.norm(chord)
+        v = self._shifted(self.pi)
+        projection = sum(u * c for u, c in zip(chord, v))
+        return sum(_multiply(c, c) for c in v) - _multiply(projection, projection)
+
+    def _normal_3d(self) -> np.array:
+        '''
+        :return: coefficients of the projection on the normal of the plane of _get_sign_3d
+        '''
+        # Normal Vector
+        p2 = np.array([self.pf[0], self.pf[1], self.pi[2]])
+        if self.pf[0] < 0:
+            va, vb = p2 - self.pi, self.pf - self.pi
+        else:
+            va, vb = self.pf - self.pi, p2 - self.pi
+        normal = np.cross(va / np.linalg.norm(va), vb / np.linalg.norm(vb))
+        normal = normal / np.linalg.norm(normal)
+        return sum(u * c for u, c in zip(normal, self._shifted(self.pi)))
+
+    def maximum_deviation(self):
+        '''
+        Maximum perpendicular deviation
+        :return:
+            - Maximum Perpendicular Deviation (MPD)
+            - Coordinates corresponding to MPD (one per dimension)
+        '''
+        if self.dimensions == 2:
+            distance = self._signed_distance_2d()
+            u = self._extrema(distance)
+            values = PPoly(distance, self.breaks)(u)
+            idx = np.argmax(np.abs(values))
+            return (values[idx], *self.position(u[idx]))
+
+        distance = self._squared_distance_3d()
+        u = self._extrema(distance)
+        idx = np.argmax(PPoly(distance, self.breaks)(u))
+        p = self.position(u[idx])
+        # Normal Vector
+        p2 = np.array([self.pf[0], self.pf[1], self.pi[2]])
+        sign = _get_sign_3d(self.pi, p2, self.pf, p)
+        return (sign * np.linalg.norm(np.cross(p - self.pi, self.pf - self.pi)) / np.linalg.norm(self.pf - self.pi),
+                *p)
+
+    def total_curvature(self):
+        '''
+        Total curvature (time average of the signed perpendicular distance)
+        :return: total curvature
+        '''
+        duration = self.stop - self.start
+        if self.dimensions == 2:
+            return PPoly(self._signed_distance_2d(), self.breaks).integrate(self.start, self.stop) / duration
+
+        normal = self._normal_3d()
+        if not np.all(np.isfinite(normal)):
+            # No plane for the sign (same last coordinate at pi and pf), NaN like total_curvature_3d
+            return np.nan
+        # Segments of the spline split where the sign changes
+        bounds = np.unique(np.concatenate((
+            [self.start, self.stop], self.breaks[(self.breaks > self.start) & (self.breaks < self.stop)],
+            self._roots(normal))))
+        lengths = np.diff(bounds)
+        u = bounds[:-1, None] + lengths[:, None] * _NODES
+        sign = np.sign(PPoly(normal, self.breaks)(u))
+        distance = np.sqrt(np.maximum(PPoly(self._squared_distance_3d(), self.breaks)(u), 0))
+        return np.sum(lengths * np.sum(_WEIGHTS * sign * distance, axis=1)) / duration
+
+    def maximal_log_ratio(self, t1, t2):
+        '''
+        Max log ratio (t2 is always the correct target, t1 is the alternative target)
+        :param t1: alternative target
+        :param t2: correct target
+        :return:
+            - Max log ratio (MLR)
+            - Coordinates corresponding to MLR (one per dimension)
+        '''
+        t1 = np.asarray(t1)[:self.dimensions]
+        t2 = np.asarray(t2)[:self.dimensions]
+        # Squared distances to the alternative and correct targets
+        d_1 = sum(_multiply(c, c) for c in self._shifted(t1))
+        d_2 = sum(_multiply(c, c) for c in self._shifted(t2))
+        d_1_prime = PPoly(d_1, self.breaks).derivative().c
+        d_2_prime = PPoly(d_2, self.breaks).derivative().c
+        stationary = _multiply(d_2_prime, d_1) - _multiply(d_1_prime, d_2)
+
+        u = np.concatenate(([self.start, self.stop], self._roots(stationary)))
+        p = self.position(u)
+        log_ratio = np.log(np.linalg.norm(p - t2, axis=1) / np.linalg.norm(p - t1, axis=1))
+        idx = np.argmax(log_ratio)
+        return (log_ratio[idx], *p[idx])
+
+    def descriptors(self, t1=None, t2=None) -> dict:
+        '''
+        All descriptors of the trajectory (see TrajectoryGeometry.descriptors)
+        :param t1: alternative target (optional)
+        :param t2: correct target (optional)
+        :return: dictionary with 'max_dev', 'tot_cur' and, if targets are given, 'max_log_ratio'
+        '''
+        results = {
+            'max_dev': self.maximum_deviation(),
+            'tot_cur': self.total_curvature()
+        }
+        if t1 is not None and t2 is not None:
+            results['max_log_ratio'] = self.maximal_log_ratio(t1, t2)
+        return results
+
+
+@instrumented
+def spline_descriptors(tck, start: float = None, stop: float = None, t1=None, t2=None) -> dict:
+    '''
+    2D and 3D descriptors from the spline of a trajectory, same keys as TrialPipeline
+        (2D: x and z, 3D: x, z and y)
+    :param tck: splines of the trajectory (see resample.spline_representation)
+    :param start: first time (e.g. movement onset). None for the first sample
+    :param stop: last time. None for the last sample
+    :param t1: alternative target (x, z, y), optional
+    :param t2: correct target (x, z, y), optional
+    :return: dictionary with 'max_dev_2d', 'max_dev_3d', 'tot_cur_2d', 'tot_cur_3d' and,
+        if targets are given, 'max_log_ratio_2d', 'max_log_ratio_3d'
+    '''
+    results = {}
+    for suffix, axes in (('_2d', (0, 2)), ('_3d', (0, 2, 1))):
+        for k, value in SplineTrajectory(tck, start, stop, axes).descriptors(t1, t2).items():
+            results[k + suffix] = value
+    return results
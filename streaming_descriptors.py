@@ -0,0 +1,175 @@
+'''
+Streaming versions of maximal log ratio and maximum deviation for live feedback.
+Samples are added one at a time and the running descriptor is available after every sample.
+Once the trial is complete, the results are the same as maximal_log_ratio_* and maximum_deviation_*
+'''
+
+import numpy as np
+
+from maximum_deviation import _get_angle_2d, _get_angle_3d, _get_sign_3d
+
+
+class _SampleBuffer:
+    '''
+    Growable (n, d) array of samples (amortized O(1) append)
+    '''
+
+    def __init__(self, dimensions: int, capacity: int = 256):
+        self._data = np.empty((capacity, dimensions))
+        self.size = 0
+
+    def append(self, p):
+        if self.size == self._data.shape[0]:
+            data = np.empty((2 * self._data.shape[0], self._data.shape[1]))
+            data[:self.size] = self._data
+            self._data = data
+        self._data[self.size] = p
+        self.size += 1
+
+    @property
+    def data(self) -> np.array:
+        return self._data[:self.size]
+
+
+class StreamingMaximalLogRatio:
+    '''
+    Running maximal log ratio, O(1) per sample (t2 is always the correct target, t1 is the alternative target)
+    '''
+
+    def __init__(self, t1, t2):
+        '''
+        :param t1: alternative target (2 or 3 coordinates)
+        :param t2: correct target (2 or 3 coordinates)
+        '''
+        self.t1 = np.asarray(t1, dtype=float)
+        self.t2 = np.asarray(t2, dtype=float)
+        self.max_log_ratio = -np.inf
+        self.position = None
+        self.n_samples = 0
+
+    def update(self, *position):
+        '''
+        Add one sample
+        :param position: coordinates of the sample (as many as the targets)
+        :return: running max log ratio (MLR)
+        '''
+        p = np.asarray(position, dtype=float)
+        # Distance to alternative target
+        d_1 = np.sqrt(np.sum((p - self.t1) ** 2))
+        # Distance to correct target
+        d_2 = np.sqrt(np.sum((p - self.t2) ** 2))
+        log_ratio = np.log(d_2 / d_1)
+        # First sample with the maximum is kept
+        if log_ratio > self.max_log_ratio or self.position is None:
+            self.max_log_ratio = log_ratio
+            self.position = p
+        self.n_samples += 1
+        return self.max_log_ratio
+
+    def result(self):
+        '''
+        :return:
+            - Max log ratio (MLR)
+            - Coordinates corresponding to MLR (one per dimension)
+        '''
+        return (self.max_log_ratio, *self.position)
+
+
+class StreamingMaximumDeviation:
+    '''
+    Running maximum perpendicular deviation with respect to the line between the first sample and an endpoint
+        If the endpoint is known (e.g. the target), every sample is evaluated once, O(1) per sample.
+        The endpoint can be moved at any time (set_endpoint), which re-evaluates the stored samples in one
+        vectorized pass. Without endpoint, result() uses the last sample as in maximum_deviation_*
+    '''
+
+    def __init__(self, dimensions: int = 2, endpoint=None):
+        '''
+        :param dimensions: 2 or 3 (same conventions as maximum_deviation_2d and maximum_deviation_3d)
+        :param endpoint: known or provisional final sample (optional)
+        '''
+        if dimensions not in (2, 3):
+            raise ValueError("dimensions must be 2 or 3")
+        self.dimensions = dimensions
+        self._samples = _SampleBuffer(dimensions)
+        self.endpoint = None if endpoint is None else np.asarray(endpoint, dtype=float)
+        self._reset_max()
+
+    def _reset_max(self):
+        self.max_dis = -np.inf
+        self.idx = None
+
+    @property
+    def n_samples(self) -> int:
+        return self._samples.size
+
+    def _distances(self, pn, pf):
+        '''
+        Perpendicular distance of pn (one sample or one per row) to the line pi -> pf
+        '''
+        pi = self._samples.data[0]
+        norms = np.linalg.norm(pn - pi, axis=-1)
+        if self.dimensions == 2:
+            return norms * np.sin(np.abs(_get_angle_2d(pi, pn, pf)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return norms * np.sin(_get_angle_3d(pi, pn, pf))
+
+    def _sign(self, pn, pf):
+        pi = self._samples.data[0]
+        if self.dimensions == 2:
+            return np.sign(_get_angle_2d(pi, pn, pf))
+        # Normal Vector
+        p2 = np.array([pf[0], pf[1], pi[2]])
+        return _get_sign_3d(pi, p2, pf, pn)
+
+    def update(self, *position):
+        '''
+        Add one sample
+        :param position: coordinates of the sample
+        :return: running Maximum Perpendicular Deviation (MPD) if the endpoint is known, None otherwise
+        '''
+        self._samples.append(position)
+        if self.endpoint is None or self.n_samples == 1:
+            return None
+
+        d = self._distances(self._samples.data[-1], self.endpoint)
+        if d > self.max_dis:
+            self.max_dis = d
+            self.idx = self.n_samples - 1
+        return self._signed()
+
+    def set_endpoint(self, endpoint):
+        '''
+        Move the endpoint and re-evaluate every stored sample
+        :param endpoint: new final sample
+        :return: Maximum Perpendicular Deviation (MPD) with respect to the new endpoint
+        '''
+        self.endpoint = np.asarray(endpoint, dtype=float)
+        self._reset_max()
+        if self.n_samples < 2:
+            return None
+        dis = self._distances(self._samples.data[1:], self.endpoint)
+        self.idx = np.argmax(np.where(np.isnan(dis), -np.inf, dis)) + 1
+        self.max_dis = dis[self.idx - 1]
+        return self._signed()
+
+    def _signed(self):
+        if self.idx is None:
+            return None
+        return self._sign(self._samples.data[self.idx], self.endpoint) * self.max_dis
+
+    def result(self):
+        '''
+        Maximum deviation of the samples received so far. Without endpoint, the last sample is the endpoint
+            and the result is the same as maximum_deviation_* on the whole trial
+        :return:
+            - Maximum Perpendicular Deviation (MPD)
+            - Coordinates corresponding to MPD (one per dimension)
+        '''
+        if self.endpoint is None:
+            data = self._samples.data
+            pf = data[-1]
+            dis = self._distances(data[1:-1], pf)
+            idx = np.argmax(dis) + 1
+            return (self._sign(data[idx], pf) * dis[idx - 1], *data[idx])
+        return (self._signed(), *self._samples.data[self.idx])
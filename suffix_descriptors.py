@@ -0,0 +1,159 @@
+'''
+Descriptors of every suffix x_tr[i:] of a trajectory as a function of the start index i
+(e.g. to report how sensitive the descriptors are to the detected onset).
+Recomputing each descriptor for every candidate start is O(n^2); here every start shares the same passes:
+    - Maximal log ratio: the log ratio of a sample does not depend on the start, the maximum of every
+      suffix is a reverse cumulative maximum
+    - Total curvature 2D: the signed distance to the line pi-pf is linear in the sample, so the sum over
+      the samples of a suffix only needs the suffix sums of the coordinates (with pf as origin)
+    - Maximum deviation and total curvature 3D: the distance is not linear in the sample, the distances
+      of every (start, sample) pair are calculated once on blocks of starts (vectorized, O(n) per start)
+      and shared by both descriptors
+
+NOTE: Results are the same as maximum_deviation_*, total_curvature_* and maximal_log_ratio_* on
+x_tr[i:], up to rounding errors for the total curvature (different summation order)
+'''
+
+import numpy as np
+
+from instrumentation import instrumented, stage
+
+# Number of (start, sample) pairs evaluated at once
+_BLOCK = 2 ** 18
+
+
+def _suffix_max_log_ratio(xy: np.array, t1, t2) -> tuple:
+    '''
+    :return: max log ratio of every suffix xy[i:], index of the corresponding sample
+    '''
+    dimensions = xy.shape[1]
+    # Distance to alternative target
+    d_1 = np.linalg.norm(xy - np.asarray(t1)[:dimensions], axis=1)
+    # Distance to correct target
+    d_2 = np.linalg.norm(xy - np.asarray(t2)[:dimensions], axis=1)
+    log_ratio = np.log(d_2 / d_1)
+
+    # Maximum of every suffix (NaN propagates like in np.argmax)
+    suffix_max = np.maximum.accumulate(log_ratio[::-1])[::-1]
+    # The first maximum of a suffix is its first sample equal to the maximum of the rest
+    record = (log_ratio == suffix_max) | np.isnan(log_ratio)
+    index = np.where(record, np.arange(xy.shape[0]), xy.shape[0])
+    index = np.minimum.accumulate(index[::-1])[::-1]
+    return log_ratio[index], index
+
+
+def _suffix_total_curvature_2d(xy: np.array, starts: np.array) -> np.array:
+    '''
+    Total curvature of xy[i:] for i in starts, same conventions as total_curvature_2d
+    '''
+    n = xy.shape[0]
+    pf = xy[-1]
+    # pf as origin: the signed distance of pn to the line pi-pf is cross(pf - pi, pn - pi) / |pf - pi|
+    #   = -cross(pi, pn) / |pi|
+    p = xy - pf
+    # suffix[j] = sum of p[j:n - 1] (the last sample is not part of the samples in between)
+    suffix = np.zeros((n, 2))
+    suffix[:n - 1] = np.cumsum(p[n - 2::-1], axis=0)[::-1]
+
+    pi = p[starts]
+    s = suffix[starts + 1]
+    det = pi[:, 1] * s[:, 0] - pi[:, 0] * s[:, 1]
+    # Same orientation as _get_angle_2d
+    if pf[0] < 0:
+        det = -det
+    return det / (np.linalg.norm(pi, axis=1) * (n - 2 - starts))
+
+
+def _suffix_distances(xy: np.array, block: np.array) -> tuple:
+    '''
+    Signed perpendicular distances of the samples in between of xy[i:] for every i in block,
+        same operations as maximum_deviation_2d/3d written per coordinate (one row per start)
+    :return: samples (k,), signs (starts, samples), distances (starts, samples), valid (starts, samples)
+    '''
+    n, d = xy.shape
+    pf = xy[-1]
+    samples = np.arange(block[0] + 1, n - 1)
+    pi = xy[block]
+    # Coordinates of pn - pi and pf - pi
+    v1 = [xy[samples, j] - pi[:, j, None] for j in range(d)]
+    v2 = [pf[j] - pi[:, j, None] for j in range(d)]
+    valid = samples > block[:, None]
+    v1_norm = np.sqrt(sum(v * v for v in v1))
+
+    if d == 2:
+        # _get_angle_2d
+        a, b = (v2, v1) if pf[0] < 0 else (v1, v2)
+        det = b[0] * a[1] - b[1] * a[0]
+        ang = np.arctan2(det, a[0] * b[0] + a[1] * b[1])
+        return samples, np.sign(ang), v1_norm * np.sin(np.abs(ang)), valid
+
+    # _get_angle_3d (the norm of a single vector is not calculated like the norms along an axis)
+    v2_norm = np.array([np.linalg.norm(pf - p) for p in pi])[:, None]
+    theta = np.arccos((v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]) / (v1_norm * v2_norm))
+
+    # _get_sign_3d, normal vector p2 = (pf[0], pf[1], pi[2])
+    p2 = np.column_stack((np.full(block.size, pf[0]), np.full(block.size, pf[1]), pi[:, 2]))
+    va, vb = (p2 - pi, pf - pi) if pf[0] < 0 else (pf - pi, p2 - pi)
+    axb = np.cross(va / np.linalg.norm(va, axis=1, keepdims=True), vb / np.linalg.norm(vb, axis=1, keepdims=True))
+    vp_n = axb / np.linalg.norm(axb, axis=1, keepdims=True)
+    sign = np.sign(np.arcsin((v1[0] * vp_n[:, 0, None] + v1[1] * vp_n[:, 1, None] + v1[2] * vp_n[:, 2, None]) /
+                             v1_norm))
+    return samples, sign, v1_norm * np.sin(theta), valid
+
+
+@instrumented
+def suffix_descriptors(x_tr, y_tr, z_tr=None, first: int = 0, last: int = None, t1=None, t2=None) -> dict:
+    '''
+    Descriptors of x_tr[i:] for every start index first <= i < last
+    :param x_tr: trajectory data along a first dimension (e.g. x)
+    :param y_tr: trajectory data along a second dimension (e.g. z)
+    :param z_tr: trajectory data along a third dimension (e.g. y). None for 2D
+    :param first: first start index (e.g. some samples before the onset index)
+    :param last: end of the start indexes (None: every suffix with at least 3 samples)
+    :param t1: alternative target (optional)
+    :param t2: correct target (optional)
+    :return: dictionary with
+        - 'start': start indexes (k,)
+        - 'max_dev': one row (MPD, coordinates) per start (k, 1 + d), see maximum_deviation_*
+        - 'tot_cur': total curvature per start (k,)
+        - 'max_log_ratio': if targets are given, one row (MLR, coordinates) per start (k, 1 + d)
+    '''
+    if z_tr is None:
+        xy = np.column_stack((x_tr, y_tr))
+    else:
+        xy = np.column_stack((x_tr, y_tr, z_tr))
+    n = xy.shape[0]
+    first, last, _ = slice(first, n - 2 if last is None else min(last, n - 2)).indices(n)
+    starts = np.arange(first, max(first, last))
+
+    d = xy.shape[1]
+    max_dev = np.empty((starts.size, 1 + d))
+    tot_cur = np.empty(starts.size)
+    with stage('suffix_descriptors.distances', starts.size):
+        rows = max(1, _BLOCK // n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for b in range(0, starts.size, rows):
+                block = starts[b:b + rows]
+                samples, signs, distances, valid = _suffix_distances(xy, block)
+                # Maximum deviation: first maximum (or NaN) of the valid samples, like np.argmax
+                idx = np.argmax(np.where(valid, distances, -np.inf), axis=1)
+                k = np.arange(block.size)
+                max_dev[b:b + rows, 0] = signs[k, idx] * distances[k, idx]
+                max_dev[b:b + rows, 1:] = xy[samples[idx]]
+                if d == 3:
+                    tot_cur[b:b + rows] = np.sum(np.where(valid, signs * distances, 0), axis=1) / (n - 2 - block)
+
+    if d == 2:
+        with stage('suffix_descriptors.tot_cur', starts.size):
+            tot_cur = _suffix_total_curvature_2d(xy, starts)
+
+    results = {
+        'start': starts,
+        'max_dev': max_dev,
+        'tot_cur': tot_cur
+    }
+    if t1 is not None and t2 is not None:
+        log_ratio, idx = _suffix_max_log_ratio(xy[first:], t1, t2)
+        idx = idx[:starts.size] + first
+        results['max_log_ratio'] = np.column_stack((log_ratio[:starts.size], xy[idx]))
+    return results
@@ -0,0 +1,52 @@
+'''
+Differentiator of arrays and sessions against the original differentiator of one coordinate
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_session
+from derivative import calculate_velocity, calculate_derivatives, calculate_velocity_session
+from ragged_trajectories import RaggedTrajectories
+
+STEP = 1 / 90
+
+
+def _velocity(step, x):
+    '''
+    Original differentiator (one coordinate, three samples repeated at both ends)
+    '''
+    x = np.append(x[0] * np.ones(3), np.append(x, x[-1] * np.ones(3)))
+    return (-x[:-6] - 4 * x[1:-5] - 5 * x[2:-4] + 5 * x[4:-2] + 4 * x[5:-1] + x[6:]) / (32 * step)
+
+
+def _session():
+    trials = reaching_session(16, 100, seed=5)
+    return RaggedTrajectories.from_trials([np.column_stack((x, y, z)) for _, x, y, z, _ in trials])
+
+
+def test_velocity_matches_the_original_differentiator():
+    ragged = _session()
+    for i in range(len(ragged)):
+        xyz = ragged[i]
+        expected = np.column_stack([_velocity(STEP, c) for c in xyz.T])
+        np.testing.assert_allclose(calculate_velocity(STEP, xyz), expected, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(calculate_velocity(STEP, xyz.T, axis=1), expected.T, rtol=1e-12, atol=1e-12)
+        out = np.empty_like(xyz)
+        assert np.shares_memory(calculate_velocity(STEP, xyz, out=out), out)
+        np.testing.assert_array_equal(out, calculate_velocity(STEP, xyz))
+
+    velocity, = calculate_velocity_session(ragged, STEP)
+    for i in range(len(ragged)):
+        np.testing.assert_allclose(velocity[i], np.column_stack([_velocity(STEP, c) for c in ragged[i].T]),
+                                   rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('n', [5, 7, 9, 11])
+def test_derivatives_of_a_quadratic(n):
+    t = np.arange(40) * STEP
+    x = 0.3 + 0.5 * t - 2.0 * t ** 2
+    velocity, acceleration = calculate_derivatives(STEP, x, n=n, order=2)
+    # Exact away from the repeated samples at both ends
+    inner = slice(n - 1, -(n - 1))
+    np.testing.assert_allclose(velocity[inner], 0.5 - 4.0 * t[inner], rtol=1e-9)
+    np.testing.assert_allclose(acceleration[inner], -4.0, rtol=1e-6)
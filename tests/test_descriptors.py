@@ -0,0 +1,121 @@
+'''
+Vectorized descriptors against the original loops
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_session
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+from total_curvature import total_curvature_2d, total_curvature_3d
+from maximal_log_ratio import maximal_log_ratio_2d, maximal_log_ratio_3d
+from trajectory_geometry import TrajectoryGeometry
+from ragged_trajectories import RaggedTrajectories, batch_maximum_deviation, batch_total_curvature, \
+    batch_maximal_log_ratio
+
+T1 = np.array([-0.2, 0.4, 0.05])
+T2 = np.array([0.25, 0.4, 0.0])
+
+
+def _loop_deviations(xy):
+    '''
+    Original loop of maximum_deviation_* and total_curvature_* (one sample at a time)
+    :return: signs, perpendicular distances of the samples in between
+    '''
+    pi, pf, p_tr = xy[0], xy[-1], xy[1:-1]
+    signs, dis = [], []
+    for pn in p_tr:
+        if xy.shape[1] == 2:
+            v1, v2 = (pf - pi, pn - pi) if pf[0] < 0 else (pn - pi, pf - pi)
+            theta = np.arctan2(np.linalg.det(np.vstack((v2, v1))), np.dot(v1, v2))
+            signs.append(np.sign(theta))
+            dis.append(np.linalg.norm(pn - pi) * np.sin(np.abs(theta)))
+            continue
+        v1, v2 = pn - pi, pf - pi
+        theta = np.arccos(np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2)))
+        # Normal Vector
+        p2 = np.array([pf[0], pf[1], pi[2]])
+        va, vb = (p2 - pi, pf - pi) if pf[0] < 0 else (pf - pi, p2 - pi)
+        axb = np.cross(va / np.linalg.norm(va), vb / np.linalg.norm(vb))
+        signs.append(np.sign(np.arcsin(np.dot(axb / np.linalg.norm(axb), v1 / np.linalg.norm(v1)))))
+        dis.append(np.linalg.norm(v1) * np.sin(theta))
+    return np.array(signs), np.array(dis)
+
+
+def _loop_descriptors(xy):
+    '''
+    :return: (MPD, coordinates), total curvature of the original loops
+    '''
+    signs, dis = _loop_deviations(xy)
+    max_dis = np.max(dis)
+    idx = np.argwhere(max_dis == dis)[0][0]
+    return (signs[idx] * max_dis, *xy[1 + idx]), np.mean(signs * dis)
+
+
+def _trials():
+    # (x, z, y) like the test scripts, both curvature sides
+    return [np.column_stack((x, z, y)) for _, x, y, z, _ in reaching_session(12, 120, seed=3)]
+
+
+@pytest.mark.parametrize('d', [2, 3])
+def test_maximum_deviation_matches_the_loop(d):
+    maximum_deviation = maximum_deviation_2d if d == 2 else maximum_deviation_3d
+    for xyz in _trials():
+        xy = xyz[:, :d]
+        max_dev, _ = _loop_descriptors(xy)
+        np.testing.assert_allclose(maximum_deviation(*xy.T), max_dev, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('d', [2, 3])
+def test_total_curvature_matches_the_loop(d):
+    total_curvature = total_curvature_2d if d == 2 else total_curvature_3d
+    for xyz in _trials():
+        xy = xyz[:, :d]
+        _, tot_cur = _loop_descriptors(xy)
+        np.testing.assert_allclose(total_curvature(*xy.T), tot_cur, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('d', [2, 3])
+def test_trajectory_geometry_matches_the_loops(d):
+    for xyz in _trials():
+        xy = xyz[:, :d]
+        max_dev, tot_cur = _loop_descriptors(xy)
+
+        geometry = TrajectoryGeometry(*xy.T).descriptors(T1, T2)
+        np.testing.assert_allclose(geometry['max_dev'], max_dev, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(geometry['tot_cur'], tot_cur, rtol=1e-12, atol=1e-15)
+        log_ratio = maximal_log_ratio_2d(*xy.T, T1, T2) if d == 2 else maximal_log_ratio_3d(*xy.T, T1, T2)
+        np.testing.assert_allclose(geometry['max_log_ratio'], log_ratio, rtol=1e-12)
+
+
+@pytest.mark.parametrize('d', [2, 3])
+def test_batch_descriptors_match_the_loops(d):
+    trials = _trials()
+    ragged = RaggedTrajectories.from_trials(trials)
+    columns = list(range(d))
+
+    max_dev, coordinates = batch_maximum_deviation(ragged, columns)
+    tot_cur = batch_total_curvature(ragged, columns)
+    log_ratio, log_ratio_coordinates = batch_maximal_log_ratio(ragged, T1[:d], T2[:d], columns)
+    for i, xyz in enumerate(trials):
+        xy = xyz[:, :d]
+        expected_max_dev, expected_tot_cur = _loop_descriptors(xy)
+        np.testing.assert_allclose((max_dev[i], *coordinates[i]), expected_max_dev, rtol=1e-12, atol=1e-15)
+        # Segment sums (different summation order)
+        np.testing.assert_allclose(tot_cur[i], expected_tot_cur, rtol=1e-10, atol=1e-15)
+        expected = maximal_log_ratio_2d(*xy.T, T1, T2) if d == 2 else maximal_log_ratio_3d(*xy.T, T1, T2)
+        np.testing.assert_allclose((log_ratio[i], *log_ratio_coordinates[i]), expected, rtol=1e-12)
+
+
+def test_batch_maximum_deviation_with_nan():
+    trials = _trials()[:3]
+    # A sample equal to the first one has no angle (NaN deviation in 3D)
+    trials[1][4] = trials[1][0]
+    ragged = RaggedTrajectories.from_trials(trials)
+
+    max_dev, coordinates = batch_maximum_deviation(ragged)
+    for i, xyz in enumerate(trials):
+        with np.errstate(invalid='ignore'):
+            expected = maximum_deviation_3d(*xyz.T)
+        np.testing.assert_allclose((max_dev[i], *coordinates[i]), expected, rtol=1e-12)
+    assert np.isnan(max_dev[1])
+    np.testing.assert_array_equal(coordinates[1], trials[1][4])
@@ -0,0 +1,59 @@
+'''
+Maximum deviation of trajectory slices from the hull index, against maximum_deviation_2d/3d
+'''
+import numpy as np
+import pytest
+
+from deviation_index import DeviationIndex
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+
+
+def _plateau(n=200, seed=0):
+    '''
+    Samples between y = 0 and y = 1, many of them exactly at y = 1 (ties of the maximum deviation)
+    '''
+    rng = np.random.default_rng(seed)
+    x = np.arange(n) * 0.5
+    y = np.minimum(rng.uniform(0, 1.2, n), 1.0)
+    y[0] = y[-1] = 0
+    # Repeated samples
+    x[60:63] = x[60]
+    z = np.where(y == 1, 0, rng.uniform(-0.5, 0.5, n) * (1 - y))
+    z[0] = z[-1] = 0
+    return x, y, z
+
+
+def _assert_same(result, expected):
+    np.testing.assert_array_equal(np.array(result, dtype=float), np.array(expected, dtype=float))
+
+
+@pytest.mark.parametrize('leaf_size', (4, 8, 32))
+def test_ties_return_the_first_maximum(leaf_size):
+    x, y, z = _plateau()
+    index_2d = DeviationIndex(x, y, leaf_size=leaf_size)
+    index_3d = DeviationIndex(x, y, z, leaf_size=leaf_size)
+
+    _assert_same(index_2d.maximum_deviation(), maximum_deviation_2d(x, y))
+    rng = np.random.default_rng(1)
+    with np.errstate(invalid='ignore'):
+        for _ in range(200):
+            start = rng.integers(0, x.size - 3)
+            stop = rng.integers(start + 3, x.size + 1)
+            _assert_same(index_2d.maximum_deviation(start, stop), maximum_deviation_2d(x[start:stop], y[start:stop]))
+            _assert_same(index_3d.maximum_deviation(start, stop),
+                         maximum_deviation_3d(x[start:stop], y[start:stop], z[start:stop]))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_quantized_random_walk(seed):
+    # Coordinates on a grid: repeated samples and collinear hull samples are common
+    rng = np.random.default_rng(seed)
+    n = 2000
+    x = np.cumsum(rng.integers(0, 3, n)) * 0.1
+    y = np.cumsum(rng.integers(-2, 3, n)) * 0.1
+    index = DeviationIndex(x, y, leaf_size=16)
+
+    for _ in range(100):
+        start = rng.integers(0, n - 3)
+        stop = rng.integers(start + 3, n + 1)
+        _assert_same(index.maximum_deviation(start, stop), maximum_deviation_2d(x[start:stop], y[start:stop]))
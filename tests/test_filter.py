@@ -0,0 +1,50 @@
+'''
+Low-pass filter of whole arrays and sessions against the original filter of one coordinate
+'''
+import numpy as np
+import pytest
+from scipy.signal import butter, filtfilt, sosfiltfilt
+
+from benchmarks.synthetic import reaching_session
+from filter import butter_lowpass_filter, butter_lowpass_filter_sos, filter_session
+from ragged_trajectories import RaggedTrajectories
+
+FS, CUTOFF, ORDER = 90, 10, 2
+
+
+def _filter(x, sos=False):
+    '''
+    Original filter (filtfilt of one coordinate)
+    '''
+    if sos:
+        return sosfiltfilt(butter(ORDER, CUTOFF / (0.5 * FS), btype="low", output="sos"), x)
+    b, a = butter(ORDER, CUTOFF / (0.5 * FS), btype="low")
+    return filtfilt(b, a, x)
+
+
+def _session():
+    trials = reaching_session(16, 100, seed=5)
+    return RaggedTrajectories.from_trials([np.column_stack((x, y, z)) for _, x, y, z, _ in trials])
+
+
+def test_whole_arrays_match_the_original_filter():
+    ragged = _session()
+    for i in range(len(ragged)):
+        xyz = ragged[i]
+        expected = np.column_stack([_filter(c) for c in xyz.T])
+        np.testing.assert_allclose(butter_lowpass_filter(xyz, CUTOFF, FS, ORDER, axis=0), expected,
+                                   rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(butter_lowpass_filter(xyz.T, CUTOFF, FS, ORDER), expected.T,
+                                   rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(butter_lowpass_filter_sos(xyz, CUTOFF, FS, ORDER, axis=0),
+                                   np.column_stack([_filter(c, sos=True) for c in xyz.T]), rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('sos', [False, True])
+def test_session_matches_the_original_filter(sos):
+    ragged = _session()
+    filtered = filter_session(ragged, CUTOFF, FS, ORDER, sos=sos)
+    np.testing.assert_array_equal(filtered.offsets, ragged.offsets)
+    for i in range(len(ragged)):
+        np.testing.assert_allclose(filtered[i], np.column_stack([_filter(c, sos) for c in ragged[i].T]),
+                                   rtol=1e-12, atol=1e-14)
@@ -0,0 +1,50 @@
+'''
+Session kernels on padded length buckets against the original per-trial filter and differentiator
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_session
+from filter import filter_session
+from derivative import calculate_velocity_session
+from length_buckets import LengthBuckets
+from ragged_trajectories import RaggedTrajectories
+from test_filter import FS, CUTOFF, ORDER, _filter
+from test_derivative import _velocity
+
+
+def _session():
+    trials = reaching_session(16, 100, seed=5)
+    return RaggedTrajectories.from_trials([np.column_stack((x, y, z)) for _, x, y, z, _ in trials])
+
+
+@pytest.mark.parametrize('max_waste', [0, 0.1, 1.0])
+def test_buckets_cover_every_trial(max_waste):
+    lengths = np.array([0, 90, 120, 95, 120, 100, 0, 80])
+    buckets = LengthBuckets(lengths, max_waste=max_waste)
+
+    scheduled = np.sort(np.concatenate(buckets.buckets))
+    np.testing.assert_array_equal(scheduled, np.flatnonzero(lengths))
+    assert buckets.samples == lengths.sum()
+    assert buckets.overhead <= max_waste
+    if max_waste == 0:
+        assert len(buckets) == np.unique(lengths[lengths > 0]).size
+
+
+@pytest.mark.parametrize('max_waste', [0, 0.1, 1.0])
+@pytest.mark.parametrize('sos', [False, True])
+def test_padded_kernels_match_the_originals(max_waste, sos):
+    ragged = _session()
+    step = 1 / FS
+    buckets = LengthBuckets(ragged.lengths, max_waste=max_waste)
+    if max_waste:
+        # Some trials are padded
+        assert buckets.padded_samples > buckets.samples
+
+    filtered = filter_session(ragged, CUTOFF, FS, ORDER, sos=sos, buckets=buckets)
+    velocity, = calculate_velocity_session(filtered, step, buckets=buckets)
+    for i in range(len(ragged)):
+        expected = np.column_stack([_filter(c, sos) for c in ragged[i].T])
+        np.testing.assert_allclose(filtered[i], expected, rtol=1e-12, atol=1e-14)
+        np.testing.assert_allclose(velocity[i], np.column_stack([_velocity(step, c) for c in expected.T]),
+                                   rtol=1e-10, atol=1e-11)
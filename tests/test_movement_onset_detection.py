@@ -0,0 +1,153 @@
+'''
+Window fits of movement_onset_detection against the original loop of leastsq fits
+'''
+import numpy as np
+import pytest
+from scipy.optimize import leastsq
+from scipy.signal import find_peaks
+
+from benchmarks.synthetic import reaching_trajectory
+from derivative import calculate_velocity
+from movement_onset_detection import _fit_windows, _movement_onset, onset_detection, onset_detection_nd, OnsetResult
+
+
+def _leastsq_movement_onset(m, position_x, position_y, time, t_th):
+    '''
+    Original implementation of _movement_onset (one leastsq fit per window and parameter)
+    :return: t_onset, onsets, errors, jerks_mean (k, 2), converged, adjusted_t
+    '''
+    adjusted_t = False
+    errors, onsets, jerks_mean = [], [], []
+    for i in range(time.size - 2 * m + 1):
+        xl_1, yl_1, tl_1 = position_x[i:m + i], position_y[i:m + i], time[i:m + i]
+        xl_2, yl_2, tl_2 = position_x[m + i - 1:2 * m + i - 1], position_y[m + i - 1:2 * m + i - 1], \
+            time[m + i - 1:2 * m + i - 1]
+        hat_t_q = tl_1[-1]
+        hat_x_q = np.mean(xl_1)
+        hat_y_q = np.mean(yl_1)
+
+        def minimum_jerk(Um, p2, t2, hat_p_q, t_0):
+            return (1 / m ** 0.5) * (p2 - (hat_p_q + Um * (t2 - t_0) ** 3))
+
+        Um_x = leastsq(minimum_jerk, np.asarray([0]), (xl_2, tl_2, hat_x_q, hat_t_q))[0][0]
+        Um_y = leastsq(minimum_jerk, np.asarray([0]), (yl_2, tl_2, hat_y_q, hat_t_q))[0][0]
+
+        def rms_error(t_onset):
+            f_x = np.power(xl_1 - hat_x_q, 2).sum() + np.power(xl_2 - hat_x_q - Um_x * (tl_2 - t_onset) ** 3, 2).sum()
+            f_y = np.power(yl_1 - hat_y_q, 2).sum() + np.power(yl_2 - hat_y_q - Um_y * (tl_2 - t_onset) ** 3, 2).sum()
+            return (1 / (2 * m - 1)) * (f_x + f_y) ** 0.5
+
+        errors.append(rms_error(hat_t_q))
+        t_mo = leastsq(rms_error, np.asarray([0]))[0][0]
+        onsets.append(t_mo)
+        jerks_mean.append([leastsq(minimum_jerk, np.asarray([0]), (xl_2, tl_2, hat_x_q, t_mo))[0][0],
+                           leastsq(minimum_jerk, np.asarray([0]), (yl_2, tl_2, hat_y_q, t_mo))[0][0]])
+    errors = np.array(errors)
+
+    peaks, _ = find_peaks(-errors)
+    if peaks.size == 0:
+        converged = False
+        min_error = np.min(errors[np.nonzero(errors)])
+    else:
+        converged = True
+        min_error = errors[peaks][-1]
+    index = np.argwhere(errors == min_error)[0][0]
+    i = 1
+    while onsets[index] > t_th and errors[peaks].size - i > 0:
+        adjusted_t = True
+        index = np.argwhere(errors == errors[peaks][-1 - i])[0][0]
+        i += 1
+    return onsets[index], np.array(onsets), errors, np.array(jerks_mean), converged, adjusted_t
+
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('m', (5, 8, 17))
+def test_fit_windows_matches_leastsq(seed, m):
+    t, x, y, z, _ = reaching_trajectory(110 + 13 * seed, curvature=0.05 * (-1) ** seed, jitter=0.2 * (seed % 2),
+                                        seed=seed)
+    _, onsets, errors, jerks_mean, _, _ = _leastsq_movement_onset(m, x, z, t, np.inf)
+
+    _, new_errors, new_onsets, new_jerks_mean = _fit_windows(m, np.vstack((x, z)), t)
+
+    np.testing.assert_allclose(new_errors, errors, rtol=1e-9)
+    # Same local minimum as leastsq, up to its tolerance
+    np.testing.assert_allclose(new_onsets, onsets, rtol=0, atol=1e-4)
+    np.testing.assert_allclose(new_jerks_mean, jerks_mean, rtol=0, atol=1e-5 * np.abs(jerks_mean).max())
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_movement_onset_matches_leastsq(seed):
+    t, x, y, z, _ = reaching_trajectory(150, curvature=-0.08, noise=1e-3, seed=seed)
+    m = 8
+    for t_th in (np.inf, t[t.size // 2]):
+        t_onset, _, _, _, converged, adjusted_t = _leastsq_movement_onset(m, x, z, t, t_th)
+
+        new_t_onset, results, new_converged, new_adjusted_t = _movement_onset(m, np.column_stack((x, z)), t, t_th)
+
+        assert new_t_onset == pytest.approx(t_onset, abs=1e-4)
+        assert (new_converged, new_adjusted_t) == (converged, adjusted_t)
+
+
+def _onset_inputs(seed, noise=2e-4):
+    t, x, y, z, _ = reaching_trajectory(200, curvature=0.08, noise=noise, seed=seed)
+    v = calculate_velocity(t[1] - t[0], np.column_stack((x, z)))
+    return x, z, t, v[:, 0], v[:, 1]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('m, t_th, noise, converged, adjusted_t', [
+    (8, np.inf, 2e-4, True, False),
+    # An earlier minimum before t_th
+    (8, 0.9, 2e-4, True, True),
+    # No minimum of the error without noise
+    (25, np.inf, 0, False, False)])
+def test_lean_result_matches_dict_results(seed, m, t_th, noise, converged, adjusted_t):
+    inputs = _onset_inputs(seed, noise)
+    x, z, t = inputs[:3]
+    t_onset, results, *flags = onset_detection(m, *inputs, t_th=t_th, vel_th=0.6)
+    assert flags == [converged, adjusted_t]
+
+    for series in (False, True):
+        lean_t_onset, lean, *lean_flags = onset_detection(m, *inputs, t_th=t_th, vel_th=0.6, lean=True,
+                                                          series=series)
+        assert isinstance(lean, OnsetResult)
+        assert lean_t_onset == lean.t_onset == t_onset
+        assert lean_flags == [lean.converged, lean.adjusted_t] == flags
+        assert lean.min_error == results['min_error']
+        assert lean.max_vel == results['max_vel']
+        np.testing.assert_array_equal(np.arange(*lean.samples), results['indexes'])
+
+        # Winning segments
+        for (start, stop), (p, q, r) in ((lean.segment_1, ('x1', 'y1', 't1')), (lean.segment_2, ('x2', 'y2', 't2'))):
+            np.testing.assert_array_equal(x[start:stop], results[p])
+            np.testing.assert_array_equal(z[start:stop], results[q])
+            np.testing.assert_array_equal(t[start:stop], results[r])
+        assert results['errors'][lean.window] == lean.min_error
+
+        if series:
+            np.testing.assert_array_equal(lean.Um, np.array(results['Um']))
+            np.testing.assert_array_equal(lean.errors, results['errors'])
+            np.testing.assert_array_equal(lean.times, results['times'])
+        else:
+            assert lean.Um is None and lean.errors is None and lean.times is None
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('t_th', [np.inf, 0.9])
+def test_nd_matches_onset_detection_for_two_axes(seed, t_th):
+    x, z, t, vx, vz = _onset_inputs(seed)
+    t_onset, results, converged, adjusted_t = onset_detection(8, x, z, t, vx, vz, t_th=t_th, vel_th=0.6)
+
+    nd = onset_detection_nd(8, np.column_stack((x, z)), t, np.column_stack((vx, vz)), t_th=t_th, vel_th=0.6)
+    assert nd[0] == t_onset and nd[2:] == (converged, adjusted_t)
+    for k in ('min_error', 'errors', 'times', 't1', 't2', 'max_vel', 'indexes'):
+        np.testing.assert_array_equal(nd[1][k], results[k])
+    np.testing.assert_array_equal(nd[1]['Um'], results['Um'])
+    np.testing.assert_array_equal(nd[1]['p1'], np.column_stack((results['x1'], results['y1'])))
+    np.testing.assert_array_equal(nd[1]['p2'], np.column_stack((results['x2'], results['y2'])))
+
+    lean = onset_detection_nd(8, np.column_stack((x, z)), t, np.column_stack((vx, vz)), t_th=t_th, vel_th=0.6,
+                              lean=True)[1]
+    assert lean.t_onset == t_onset and lean.min_error == results['min_error']
+    assert lean.samples == (results['indexes'][0], results['indexes'][-1] + 1)
+    np.testing.assert_array_equal(t[slice(*lean.segment_2)], results['t2'])
@@ -0,0 +1,35 @@
+'''
+Streaming onset detection against onset_detection on a replayed trial
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_trajectory
+from derivative import calculate_velocity
+from movement_onset_detection import onset_detection
+from online_onset_detection import OnlineOnsetDetector
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('t_th', [np.inf, 0.9])
+def test_replayed_trial_matches_onset_detection(seed, t_th):
+    t, x, y, z, _ = reaching_trajectory(200, curvature=0.08, seed=seed)
+    step = t[1] - t[0]
+    m = int(0.1 / step) - 1
+    v = calculate_velocity(step, np.column_stack((x, z)))
+    t_onset, results, converged, adjusted_t = onset_detection(m, x, z, t, v[:, 0], v[:, 1], t_th=t_th, vel_th=0.6)
+
+    # Absolute threshold crossed at the first sample after the search samples of onset_detection
+    crossing = results['indexes'][-1] + 1
+    speed = np.linalg.norm(v, axis=1)
+    assert speed[crossing] > np.max(speed[:crossing])
+    detector = OnlineOnsetDetector(m, step, (np.max(speed[:crossing]) + speed[crossing]) / 2, t_th)
+    for sample in zip(t, x, z):
+        if detector.update(*sample) is not None:
+            break
+
+    assert detector.crossing == crossing
+    assert detector.t_onset == pytest.approx(t_onset, abs=1e-12)
+    assert detector.converged == converged
+    assert detector.adjusted_t == adjusted_t
+    np.testing.assert_allclose(detector.errors[:crossing - 2 * m + 1], results['errors'], rtol=1e-14)
@@ -0,0 +1,95 @@
+'''
+On-disk cache of the movement onset detection
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_trajectory
+from derivative import calculate_velocity
+from movement_onset_detection import onset_detection
+from onset_cache import OnsetCache
+
+
+def _folder_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith('.npz'))
+
+
+def test_eviction_keeps_a_running_total(tmp_path):
+    cache = OnsetCache(str(tmp_path), max_bytes=64 * 2 ** 10, low_water=0.5)
+    scans = []
+    scan = cache._scan
+    cache._scan = lambda: scans.append(1) or scan()
+    stored = {'errors': np.zeros(200), 'window': np.asarray(3)}
+
+    for i in range(400):
+        cache.put('%040x' % i, stored)
+        # Replacing a result does not change the size
+        cache.put('%040x' % i, stored)
+        assert cache._total == _folder_size(tmp_path) <= cache.max_bytes
+
+    # Only the first put and the evictions scan the folder, an eviction frees max_bytes - low_water * max_bytes
+    size = os.stat(os.path.join(tmp_path, '%040x.npz' % 399)).st_size
+    assert len(scans) <= 1 + 400 * size // (cache.max_bytes // 2)
+    assert cache.get('%040x' % 399) is not None
+    assert cache.get('%040x' % 0) is None
+    cache.clear()
+    assert cache._total == _folder_size(tmp_path) == 0
+
+
+def _writer(path, worker, puts):
+    '''
+    Runs in a worker process
+    :return: largest size of the folder seen after a put
+    '''
+    cache = OnsetCache(path, max_bytes=64 * 2 ** 10, low_water=0.5)
+    stored = {'errors': np.zeros(200), 'window': np.asarray(3)}
+    peak = 0
+    for i in range(puts):
+        cache.put('%08x%032x' % (worker, i), stored)
+        # Every change of the folder is made under the lock
+        with cache._lock():
+            peak = max(peak, _folder_size(path))
+    return peak
+
+
+def test_concurrent_writers_share_the_bound(tmp_path):
+    workers = 8
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        peaks = list(executor.map(_writer, [str(tmp_path)] * workers, range(workers), [60] * workers))
+
+    cache = OnsetCache(str(tmp_path), max_bytes=64 * 2 ** 10)
+    assert max(peaks) <= cache.max_bytes
+    # Each writer alone would have filled the folder
+    size = max(entry.stat().st_size for entry in os.scandir(tmp_path) if entry.name.endswith('.npz'))
+    assert 60 * size > cache.max_bytes
+    with cache._lock() as counter:
+        assert cache._read_total(counter) == _folder_size(tmp_path)
+
+
+def _trial():
+    t, x, y, z, _ = reaching_trajectory(300, curvature=0.08, seed=4)
+    step = t[1] - t[0]
+    return 8, x, z, t, calculate_velocity(step, x), calculate_velocity(step, z)
+
+
+@pytest.mark.parametrize('coarse', (None, 8))
+def test_hit_restores_the_result(tmp_path, coarse):
+    cache = OnsetCache(str(tmp_path))
+    inputs = _trial()
+    t_onset, results, converged, adjusted_t = onset_detection(*inputs, vel_th=0.6, coarse=coarse)
+    _, lean_result, _, _ = onset_detection(*inputs, vel_th=0.6, lean=True, coarse=coarse)
+
+    for _ in range(2):
+        cached = cache.onset_detection(*inputs, vel_th=0.6, coarse=coarse)
+        cached_lean = cache.onset_detection(*inputs, vel_th=0.6, lean=True, coarse=coarse)
+
+        assert cached[0] == t_onset and cached[2:] == (converged, adjusted_t)
+        assert cached[1].keys() == results.keys()
+        for k, v in results.items():
+            np.testing.assert_array_equal(cached[1][k], v)
+        assert cached_lean[1].search == lean_result.search
+        assert (cached_lean[1].window, cached_lean[1].samples) == (lean_result.window, lean_result.samples)
+    assert (cache.misses, cache.hits) == (1, 3)
@@ -0,0 +1,39 @@
+'''
+Parameter sweep of the onset detection
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_trajectory
+from onset_sweep import sweep_trial
+from trial_pipeline import TrialPipeline
+
+
+def test_sweep_segments_longer_than_the_search_range():
+    t, x, y, z, _ = reaching_trajectory(171, seed=1)
+
+    results = sweep_trial(t, x, y, z, delta_T=(0.1, 0.3, 0.6), vel_th=(0.2, 0.6))
+
+    # 2 * m samples of 0.6 s segments do not fit before the velocity threshold
+    short = results['delta_T'] == 0.6
+    assert np.all(np.isnan(results['t_onset'][short]))
+    assert not np.any(results['converged'][short])
+    assert np.all(results['m'] == np.repeat([8, 25, 52], 2))
+    # The other combinations are not affected
+    np.testing.assert_array_equal(results[~short], sweep_trial(t, x, y, z, delta_T=(0.1, 0.3), vel_th=(0.2, 0.6)))
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('t_th', [np.inf, 0.9])
+def test_sweep_matches_the_pipeline(seed, t_th):
+    t, x, y, z, _ = reaching_trajectory(200, curvature=0.08, seed=seed)
+    grids = {'delta_T': (0.1, 0.2), 'vel_th': (0.3, 0.6), 'cutoff': (6, 10)}
+
+    results = sweep_trial(t, x, y, z, t_th=t_th, **grids)
+
+    for row in results:
+        onset = TrialPipeline(cutoff=row['cutoff'], delta_T=row['delta_T'],
+                              vel_th=row['vel_th']).process_trial(t, x, y, z, t_th=t_th)
+        assert row['t_onset'] == onset['t_onset']
+        assert row['converged'] == onset['converged']
+        assert row['adjusted_t'] == onset['adjusted_t']
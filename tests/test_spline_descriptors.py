@@ -0,0 +1,97 @@
+'''
+Descriptors on the spline of a trajectory against the sampled descriptors of a dense resampling
+'''
+import numpy as np
+import pytest
+from scipy.interpolate import splev
+
+from benchmarks.synthetic import reaching_trajectory
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+from total_curvature import total_curvature_2d, total_curvature_3d
+from maximal_log_ratio import maximal_log_ratio_2d, maximal_log_ratio_3d
+from resample import spline_representation
+from spline_descriptors import SplineTrajectory, spline_descriptors
+
+T1 = np.array([-0.2, 0.4, 0.05])
+T2 = np.array([0.25, 0.4, 0.0])
+
+
+def _sampled(tck, start, stop, n=4001):
+    '''
+    Descriptors of the spline resampled at n samples (x, z for 2D and x, z, y for 3D)
+    '''
+    x, y, z = splev(np.linspace(start, stop, n), tck)
+    return {
+        'max_dev_2d': maximum_deviation_2d(x, z),
+        'max_dev_3d': maximum_deviation_3d(x, z, y),
+        'tot_cur_2d': total_curvature_2d(x, z),
+        'tot_cur_3d': total_curvature_3d(x, z, y),
+        'max_log_ratio_2d': maximal_log_ratio_2d(x, z, T1, T2),
+        'max_log_ratio_3d': maximal_log_ratio_3d(x, z, y, T1, T2)
+    }
+
+
+def _check(results, expected, scale, suffixes=('_2d', '_3d')):
+    for suffix in suffixes:
+        for k in ('max_dev', 'max_log_ratio'):
+            value, expected_value = results[k + suffix], expected[k + suffix]
+            np.testing.assert_allclose(value[0], expected_value[0], rtol=1e-6, atol=1e-9 * scale)
+            # Coordinates of the maximum, up to the resampling step
+            np.testing.assert_allclose(value[1:], expected_value[1:], rtol=0, atol=1e-3 * scale)
+        np.testing.assert_allclose(results['tot_cur' + suffix], expected['tot_cur' + suffix], rtol=1e-3,
+                                   atol=1e-9 * scale)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('jitter', [0, 0.3])
+def test_smooth_trial_matches_a_dense_resampling(seed, jitter):
+    t, x, y, z, t_onset = reaching_trajectory(120, curvature=0.08 if seed % 2 else -0.08, noise=0, jitter=jitter,
+                                              seed=seed)
+    tck = spline_representation(t, x, y, z)
+    # Inside the reach: the static samples have no angle in 3D (NaN deviation of the sampled descriptors)
+    duration = min(1.0, 0.5 * t[-1])
+    for start, stop in ((0.1, 0.9), (0.25, 0.6), (0.4, 0.75)):
+        start, stop = t_onset + start * duration, t_onset + stop * duration
+        _check(spline_descriptors(tck, start, stop, t1=T1, t2=T2), _sampled(tck, start, stop), 0.5)
+    # Whole trial (ends at T2, log of 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results, expected = spline_descriptors(tck, t1=T1, t2=T2), _sampled(tck, t[0], t[-1])
+    _check(results, expected, 0.5, suffixes=('_2d',))
+
+
+def test_short_trajectory():
+    # Four samples: a single cubic piece
+    t = np.array([0.0, 0.1, 0.25, 0.3])
+    x, y, z = np.array([0.0, 0.05, 0.12, 0.2]), np.array([0.0, 0.01, 0.015, 0.0]), np.array([0.0, 0.1, 0.3, 0.4])
+    tck = spline_representation(t, x, y, z)
+    results = spline_descriptors(tck, t1=T1, t2=T2)
+    _check(results, _sampled(tck, t[0], t[-1]), 0.5)
+
+
+def test_straight_trajectory():
+    t, x, y, z, _ = reaching_trajectory(90, reach=(0.25, 0.1, 0.4), curvature=0, noise=0, seed=1)
+    results = spline_descriptors(spline_representation(t, x, y, z))
+    for suffix in ('_2d', '_3d'):
+        assert results['max_dev' + suffix][0] == pytest.approx(0, abs=1e-12)
+        assert results['tot_cur' + suffix] == pytest.approx(0, abs=1e-9)
+
+
+def test_trajectory_without_sign_plane():
+    # Same y at pi and pf: no plane for the 3D sign, NaN like the sampled descriptors
+    t, x, y, z, _ = reaching_trajectory(90, curvature=0, noise=0, seed=1)
+    with np.errstate(invalid='ignore'):
+        results = spline_descriptors(spline_representation(t, x, y, z))
+        assert np.isnan(total_curvature_3d(x, z, y))
+    assert np.isnan(results['max_dev_3d'][0])
+    assert np.isnan(results['tot_cur_3d'])
+    assert results['max_dev_2d'][0] == pytest.approx(0, abs=1e-12)
+    assert results['tot_cur_2d'] == pytest.approx(0, abs=1e-12)
+
+
+def test_empty_range():
+    t, x, y, z, _ = reaching_trajectory(60, seed=1)
+    tck = spline_representation(t, x, y, z)
+    with pytest.raises(ValueError):
+        SplineTrajectory(tck, t[20], t[20])
+    with pytest.raises(ValueError):
+        SplineTrajectory(tck, t[30], t[20])
@@ -0,0 +1,64 @@
+'''
+Streaming descriptors fed sample by sample against the functions on the samples received so far
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_trajectory
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+from maximal_log_ratio import maximal_log_ratio_2d, maximal_log_ratio_3d
+from streaming_descriptors import StreamingMaximalLogRatio, StreamingMaximumDeviation
+
+T1 = np.array([-0.2, 0.4, 0.05])
+T2 = np.array([0.25, 0.4, 0.0])
+PREFIXES = (3, 10, 57, 120, 200)
+
+
+def _trial(d, seed):
+    _, x, y, z, _ = reaching_trajectory(200, curvature=0.08 if seed % 2 else -0.08, seed=seed)
+    return np.column_stack((x, z, y))[:, :d]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('d', [2, 3])
+def test_maximum_deviation_of_every_prefix(d, seed):
+    xy = _trial(d, seed)
+    maximum_deviation = maximum_deviation_2d if d == 2 else maximum_deviation_3d
+
+    # Last sample as endpoint
+    streaming = StreamingMaximumDeviation(d)
+    for k, p in enumerate(xy, 1):
+        streaming.update(*p)
+        if k in PREFIXES:
+            np.testing.assert_allclose(streaming.result(), maximum_deviation(*xy[:k].T), rtol=1e-12)
+
+    for k in PREFIXES:
+        expected = maximum_deviation(*xy[:k].T)
+        # Known endpoint
+        streaming = StreamingMaximumDeviation(d, endpoint=xy[k - 1])
+        for p in xy[:k]:
+            mpd = streaming.update(*p)
+        assert mpd == pytest.approx(expected[0], rel=1e-12)
+        np.testing.assert_allclose(streaming.result(), expected, rtol=1e-12)
+
+        # Endpoint moved after the samples
+        streaming = StreamingMaximumDeviation(d, endpoint=T2[:d])
+        for p in xy[:k]:
+            streaming.update(*p)
+        assert streaming.set_endpoint(xy[k - 1]) == pytest.approx(expected[0], rel=1e-12)
+        np.testing.assert_allclose(streaming.result(), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('d', [2, 3])
+def test_maximal_log_ratio_of_every_prefix(d, seed):
+    xy = _trial(d, seed)
+    maximal_log_ratio = maximal_log_ratio_2d if d == 2 else maximal_log_ratio_3d
+
+    streaming = StreamingMaximalLogRatio(T1[:d], T2[:d])
+    for k, p in enumerate(xy, 1):
+        mlr = streaming.update(*p)
+        if k in PREFIXES:
+            expected = maximal_log_ratio(*xy[:k].T, T1, T2)
+            assert mlr == pytest.approx(expected[0], rel=1e-12)
+            np.testing.assert_allclose(streaming.result(), expected, rtol=1e-12)
@@ -0,0 +1,59 @@
+'''
+Descriptors of every suffix against the single-trial functions on x_tr[i:]
+'''
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import reaching_trajectory
+from maximum_deviation import maximum_deviation_2d, maximum_deviation_3d
+from total_curvature import total_curvature_2d, total_curvature_3d
+from maximal_log_ratio import maximal_log_ratio_2d, maximal_log_ratio_3d
+from suffix_descriptors import suffix_descriptors
+
+T1 = np.array([-0.2, 0.4, 0.05])
+T2 = np.array([0.25, 0.4, 0.0])
+
+
+def _expected(xy, i):
+    if xy.shape[1] == 2:
+        return (maximum_deviation_2d(*xy[i:].T), total_curvature_2d(*xy[i:].T),
+                maximal_log_ratio_2d(*xy[i:].T, T1, T2))
+    return (maximum_deviation_3d(*xy[i:].T), total_curvature_3d(*xy[i:].T),
+            maximal_log_ratio_3d(*xy[i:].T, T1, T2))
+
+
+def _check(xy, results):
+    for k, i in enumerate(results['start']):
+        max_dev, tot_cur, max_log_ratio = _expected(xy, i)
+        np.testing.assert_allclose(results['max_dev'][k], max_dev, rtol=1e-12, atol=1e-15)
+        # Different summation order
+        np.testing.assert_allclose(results['tot_cur'][k], tot_cur, rtol=1e-9, atol=1e-15)
+        np.testing.assert_allclose(results['max_log_ratio'][k], max_log_ratio, rtol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('d', [2, 3])
+def test_every_suffix_matches_the_functions(d, seed):
+    _, x, y, z, _ = reaching_trajectory(120, curvature=0.08 if seed % 2 else -0.08, seed=seed)
+    xy = np.column_stack((x, z, y))[:, :d]
+
+    results = suffix_descriptors(*xy.T, t1=T1, t2=T2)
+    np.testing.assert_array_equal(results['start'], np.arange(xy.shape[0] - 2))
+    _check(xy, results)
+
+    results = suffix_descriptors(*xy.T, first=40, last=90, t1=T1, t2=T2)
+    np.testing.assert_array_equal(results['start'], np.arange(40, 90))
+    _check(xy, results)
+
+
+def test_nan_deviation_of_a_repeated_sample():
+    _, x, y, z, _ = reaching_trajectory(60, curvature=0.08, seed=2)
+    xy = np.column_stack((x, z, y))
+    # The sample 30 is the start of the suffix 25: no angle (NaN deviation in 3D)
+    xy[30] = xy[25]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results = suffix_descriptors(*xy.T, first=20, last=35, t1=T1, t2=T2)
+        _check(xy, results)
+    assert np.isnan(results['max_dev'][5, 0])
+    assert np.isnan(results['tot_cur'][5])
@@ -0,0 +1,58 @@
+'''
+Binary cache of the tracker csv files
+'''
+import os
+
+import numpy as np
+import pandas as pd
+
+from tracker_cache import open_session_cache
+
+
+def _write_trial(session, trial, n=20, reverse=False):
+    k = np.arange(n, dtype=float)
+    data = pd.DataFrame({'time': k / 90, 'pos_x': k[::-1] if reverse else k, 'pos_y': 2 * k, 'pos_z': 3 * k})
+    path = os.path.join(session, "trackers", "controllertracker_movement_T{:03d}.csv".format(trial))
+    data.to_csv(path, index=False)
+    return path
+
+
+def _session(tmp_path):
+    session = str(tmp_path / "S001")
+    os.makedirs(os.path.join(session, "trackers"))
+    for trial in (1, 2):
+        _write_trial(session, trial)
+    pd.DataFrame({'trial_num': [1, 2], 't_th': [1.0, 1.5]}).to_csv(os.path.join(session, "trial_results.csv"),
+                                                                 index=False)
+    return session
+
+
+def test_modified_csv_invalidates_the_cache(tmp_path):
+    session = _session(tmp_path)
+    cache = open_session_cache(session)
+    np.testing.assert_array_equal(cache.trial(2)[1], np.arange(20))
+
+    # Same size, only the modification time tells the change
+    path = os.path.join(session, "trackers", "controllertracker_movement_T002.csv")
+    stat = os.stat(path)
+    _write_trial(session, 2, reverse=True)
+    assert os.path.getsize(path) == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cache = open_session_cache(session)
+    np.testing.assert_array_equal(cache.trial(2)[1], np.arange(20)[::-1])
+    np.testing.assert_array_equal(cache.trial(1)[1], np.arange(20))
+
+
+def test_new_csv_invalidates_the_cache(tmp_path):
+    session = _session(tmp_path)
+    assert 3 not in open_session_cache(session)
+
+    _write_trial(session, 3, n=30)
+    cache = open_session_cache(session)
+    assert 3 in cache
+    assert cache.trial(3)[0].size == 30
+
+    os.remove(os.path.join(session, "trackers", "controllertracker_movement_T001.csv"))
+    cache = open_session_cache(session)
+    assert 1 not in cache
+    assert len(cache) == 2
@@ -0,0 +1,15 @@
+'''
+Processing of one trial
+'''
+import pytest
+
+from onset_cache import OnsetCache
+from trial_pipeline import TrialPipeline
+
+
+def test_onset_cache_needs_two_axes(tmp_path):
+    cache = OnsetCache(str(tmp_path))
+    TrialPipeline(onset_cache=cache, onset_axes=(0, 2))
+    TrialPipeline(onset_axes=(0, 1, 2))
+    with pytest.raises(ValueError):
+        TrialPipeline(onset_cache=cache, onset_axes=(0, 1, 2))
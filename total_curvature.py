@@ -1,14 +1,16 @@
 import numpy as np
 
+from instrumentation import instrumented
+
 
 def _get_angle_2d(pi, pn, pf):
     '''
     Calculate the signed angle between two-dimensional vectors
         according to the maximum perpendicular deviation convention
     :param pi: first sample
-    :param pn: n-th sample
+    :param pn: n-th sample, or an array of samples (one per row)
     :param pf: last sample
-    :return: angle
+    :return: angle (one per sample)
     '''
     if pf[0] < 0:
         v2 = pn - pi
@@ -17,11 +19,13 @@ def _get_angle_2d(pi, pn, pf):
         v1 = pn - pi
         v2 = pf - pi
 
-    theta = np.arctan2(np.linalg.det(np.row_stack((v2, v1))), np.dot(v1, v2))
+    det = v2[..., 0] * v1[..., 1] - v2[..., 1] * v1[..., 0]
+    theta = np.arctan2(det, np.sum(v1 * v2, axis=-1))
 
     return theta
 
 
+@instrumented
 def total_curvature_2d(x_tr, y_tr):
     '''
     Calculate Total curvature in 2D (See the document Geometric Descriptors of Curvature for more details)
@@ -37,15 +41,10 @@ def total_curvature_2d(x_tr, y_tr):
     # Rest of the samples
     p_tr = xy[1:-1, :]
 
-    dis = []
-    ang = []
-    for pn in p_tr:
-        # Find Angle
-        theta = _get_angle_2d(pi, pn, pf)
-        # Perpendicular distance to each sample in p_tr
-        d = np.linalg.norm(pn - pi) * np.sin(np.abs(theta))
-        dis = np.append(dis, d)
-        ang = np.append(ang, theta)
+    # Find Angles
+    ang = _get_angle_2d(pi, p_tr, pf)
+    # Perpendicular distance to each sample in p_tr
+    dis = np.linalg.norm(p_tr - pi, axis=1) * np.sin(np.abs(ang))
 
     # Total curvature
     tot_cur = np.mean(np.multiply(np.sign(ang), dis))
@@ -58,14 +57,14 @@ def _get_angle_3d(pi, pn, pf):
     Calculate the non-signed angle between two-dimensional vectors
         according to the maximum perpendicular deviation convention
     :param pi: first sample
-    :param pn: n-th sample
+    :param pn: n-th sample, or an array of samples (one per row)
     :param pf: final sample
-    :return: angle
+    :return: angle (one per sample)
     '''
     v1 = pn - pi
     v2 = pf - pi
 
-    v1_norm = np.linalg.norm(v1)
+    v1_norm = np.linalg.norm(v1, axis=-1)
     v2_norm = np.linalg.norm(v2)
 
     arg = np.dot(v1, v2) / (v1_norm * v2_norm)
@@ -81,8 +80,8 @@ def _get_sign_3d(p1, p2, p3, pn):
     :param p1: vector to first sample
     :param p2: normal vector
     :param p3: vector to final sample
-    :param pn: vector to n-th sample
-    :return: sign
+    :param pn: vector to n-th sample, or an array of vectors (one per row)
+    :return: sign (one per sample)
     '''
     if p3[0] < 0:
         vb = p3 - p1
@@ -98,13 +97,14 @@ def _get_sign_3d(p1, p2, p3, pn):
     vp_n = axb / np.linalg.norm(axb)
 
     vt = pn - p1
-    vt_n = vt / np.linalg.norm(vt)
+    vt_n = vt / np.linalg.norm(vt, axis=-1, keepdims=True)
 
-    theta = np.arcsin(np.dot(vp_n, vt_n))
+    theta = np.arcsin(np.dot(vt_n, vp_n))
 
     return np.sign(theta)
 
 
+@instrumented
 def total_curvature_3d(x_tr, y_tr, z_tr):
     '''
     Calculate total curvature in 3D (See the document Geometric Descriptors of Curvature for more details)
@@ -124,17 +124,12 @@ def total_curvature_3d(x_tr, y_tr, z_tr):
     # Normal Vector
     p2 = np.array([pf[0], pf[1], pi[2]])
 
-    dis = []
-    sign = []
-    for pn in p_tr:
-        # Find Angle
-        theta = _get_angle_3d(pi, pn, pf)
-        # Find Sign
-        s = _get_sign_3d(pi, p2, pf, pn)
-        # Perpendicular distance to each sample in p_tr
-        d = np.linalg.norm(pn - pi) * np.sin(theta)
-        dis = np.append(dis, d)
-        sign = np.append(sign, s)
+    # Find Angles
+    theta = _get_angle_3d(pi, p_tr, pf)
+    # Find Signs (the plane is the same for every sample)
+    sign = _get_sign_3d(pi, p2, pf, p_tr)
+    # Perpendicular distance to each sample in p_tr
+    dis = np.linalg.norm(p_tr - pi, axis=1) * np.sin(theta)
 
     # Total Curvature
     tot_cur = np.mean(np.multiply(sign, dis))
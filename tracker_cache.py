@@ -0,0 +1,149 @@
+'''
+Binary columnar cache of a session's tracker csv files.
+The csv files of a session are parsed once and stored as .npy arrays (time, pos_x, pos_y, pos_z of every trial
+concatenated plus an offsets index, and the numeric columns of trial_results.csv). Later runs open the arrays
+with np.load(mmap_mode='r') so a trial is a zero-copy slice.
+
+The cache is rebuilt when a source csv is added, removed, or its modification time or size changes.
+'''
+
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+_TRIAL = re.compile(r"^controllertracker_movement_T(\d+)\.csv$")
+_COLUMNS = ('time', 'pos_x', 'pos_y', 'pos_z')
+_MANIFEST = "manifest.json"
+_VERSION = 1
+
+CACHE_FOLDER = ".tracker_cache"
+
+
+def _sources(session_path: str) -> dict:
+    '''
+    Source csv files of a session and their (mtime_ns, size)
+    '''
+    path_trackers = os.path.join(session_path, "trackers")
+    files = [os.path.join("trackers", f) for f in sorted(os.listdir(path_trackers)) if _TRIAL.match(f)]
+    files.append("trial_results.csv")
+    sources = {}
+    for f in files:
+        stat = os.stat(os.path.join(session_path, f))
+        sources[f] = [stat.st_mtime_ns, stat.st_size]
+    return sources
+
+
+def _is_valid(cache_path: str, sources: dict) -> bool:
+    try:
+        with open(os.path.join(cache_path, _MANIFEST)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return manifest.get('version') == _VERSION and manifest.get('sources') == sources
+
+
+def build_session_cache(session_path: str, cache_path: str = None) -> str:
+    '''
+    Parse the csv files of a session and write the binary cache
+    :param session_path: session folder (e.g. VR-S1/P01/S001)
+    :param cache_path: cache folder (session_path/.tracker_cache if None)
+    :return: cache folder
+    '''
+    cache_path = cache_path or os.path.join(session_path, CACHE_FOLDER)
+    sources = _sources(session_path)
+
+    # Write into a temporary folder and swap it in, the manifest is the last file written
+    tmp_path = cache_path + ".tmp" + str(os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    trials, lengths, columns = [], [], {c: [] for c in _COLUMNS}
+    for f in sources:
+        match = _TRIAL.match(os.path.basename(f))
+        if match is None:
+            continue
+        raw_data = pd.read_csv(os.path.join(session_path, f), usecols=list(_COLUMNS))
+        trials.append(int(match.group(1)))
+        lengths.append(len(raw_data))
+        for c in _COLUMNS:
+            columns[c].append(raw_data[c].to_numpy(dtype=float))
+
+    offsets = np.zeros(len(trials) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(tmp_path, "trials.npy"), np.asarray(trials, dtype=np.int64))
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+    for c in _COLUMNS:
+        data = np.concatenate(columns[c]) if columns[c] else np.empty(0)
+        np.save(os.path.join(tmp_path, c + ".npy"), data)
+
+    results = pd.read_csv(os.path.join(session_path, "trial_results.csv"))
+    results_columns = [c for c in results.columns if pd.api.types.is_numeric_dtype(results[c])]
+    for c in results_columns:
+        np.save(os.path.join(tmp_path, "results_" + c + ".npy"), results[c].to_numpy())
+
+    with open(os.path.join(tmp_path, _MANIFEST), "w") as file:
+        json.dump({'version': _VERSION, 'sources': sources, 'results_columns': results_columns}, file)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Another process has just written the cache
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not _is_valid(cache_path, sources):
+            raise
+    return cache_path
+
+
+class SessionCache:
+    '''
+    Memory-mapped view of a session cache (see build_session_cache)
+    '''
+
+    def __init__(self, cache_path: str):
+        '''
+        :param cache_path: cache folder
+        '''
+        self.cache_path = cache_path
+        with open(os.path.join(cache_path, _MANIFEST)) as file:
+            manifest = json.load(file)
+
+        self.trials = np.load(os.path.join(cache_path, "trials.npy"))
+        self.offsets = np.load(os.path.join(cache_path, "offsets.npy"))
+        self.columns = {c: np.load(os.path.join(cache_path, c + ".npy"), mmap_mode='r') for c in _COLUMNS}
+        self.results = {c: np.load(os.path.join(cache_path, "results_" + c + ".npy"))
+                        for c in manifest['results_columns']}
+        self._index = {trial: i for i, trial in enumerate(self.trials)}
+
+    def __len__(self):
+        return self.trials.size
+
+    def __contains__(self, trial_number):
+        return trial_number in self._index
+
+    def trial(self, trial_number: int):
+        '''
+        Raw data of one trial (read-only, zero-copy)
+        :param trial_number: trial number (as in controllertracker_movement_T###.csv)
+        :return: time, pos_x, pos_y, pos_z
+        '''
+        i = self._index[trial_number]
+        s = slice(self.offsets[i], self.offsets[i + 1])
+        return tuple(self.columns[c][s] for c in _COLUMNS)
+
+
+def open_session_cache(session_path: str, cache_path: str = None) -> SessionCache:
+    '''
+    Open the cache of a session, building it first if it does not exist or is out of date
+    :param session_path: session folder (e.g. VR-S1/P01/S001)
+    :param cache_path: cache folder (session_path/.tracker_cache if None)
+    :return: SessionCache
+    '''
+    cache_path = cache_path or os.path.join(session_path, CACHE_FOLDER)
+    if not _is_valid(cache_path, _sources(session_path)):
+        build_session_cache(session_path, cache_path)
+    return SessionCache(cache_path)
@@ -0,0 +1,106 @@
+'''
+Geometric descriptors of one trajectory computed from a single projection onto the start-end frame.
+Maximum deviation, total curvature and maximal log ratio share the same stacked coordinates,
+angles and perpendicular distances, so they are calculated once and reused by every descriptor.
+
+NOTE: Results are the same as maximum_deviation_*, total_curvature_* and maximal_log_ratio_*
+'''
+
+import numpy as np
+
+from maximum_deviation import _get_angle_2d, _get_angle_3d, _get_sign_3d
+
+
+class TrajectoryGeometry:
+    '''
+    Trajectory projected onto the frame defined by its first (pi) and last (pf) samples
+        Two coordinates use the 2D conventions, three coordinates use the 3D conventions
+        (See the document Geometric Descriptors of Curvature for more details)
+    '''
+
+    def __init__(self, x_tr, y_tr, z_tr=None):
+        '''
+        :param x_tr: trajectory data along a first dimension (e.g. x)
+        :param y_tr: trajectory data along a second dimension (e.g. z)
+        :param z_tr: trajectory data along a third dimension (e.g. y). None for 2D
+        '''
+        if z_tr is None:
+            self.xy = np.column_stack((x_tr, y_tr))
+        else:
+            self.xy = np.column_stack((x_tr, y_tr, z_tr))
+        # Initial sample
+        self.pi = self.xy[0, :]
+        # Final sample
+        self.pf = self.xy[-1, :]
+        # Rest of the samples
+        self.p_tr = self.xy[1:-1, :]
+
+        norms = np.linalg.norm(self.p_tr - self.pi, axis=1)
+        if z_tr is None:
+            ang = _get_angle_2d(self.pi, self.p_tr, self.pf)
+            # Perpendicular distance to each sample in p_tr
+            self.distances = norms * np.sin(np.abs(ang))
+            self.signs = np.sign(ang)
+        else:
+            # Normal Vector
+            p2 = np.array([self.pf[0], self.pf[1], self.pi[2]])
+            theta = _get_angle_3d(self.pi, self.p_tr, self.pf)
+            # Perpendicular distance to each sample in p_tr
+            self.distances = norms * np.sin(theta)
+            self.signs = _get_sign_3d(self.pi, p2, self.pf, self.p_tr)
+
+    @property
+    def dimensions(self) -> int:
+        return self.xy.shape[1]
+
+    def maximum_deviation(self):
+        '''
+        Maximum perpendicular deviation
+        :return:
+            - Maximum Perpendicular Deviation (MPD)
+            - Coordinates corresponding to MPD (one per dimension)
+        '''
+        idx = np.argmax(self.distances)
+        return (self.signs[idx] * self.distances[idx], *self.p_tr[idx, :])
+
+    def total_curvature(self):
+        '''
+        Total curvature
+        :return: total curvature
+        '''
+        return np.mean(np.multiply(self.signs, self.distances))
+
+    def maximal_log_ratio(self, t1, t2):
+        '''
+        Max log ratio (t2 is always the correct target, t1 is the alternative target)
+        :param t1: alternative target
+        :param t2: correct target
+        :return:
+            - Max log ratio (MLR)
+            - Coordinates corresponding to MLR (one per dimension)
+        '''
+        # Distance to alternative target
+        d_1 = np.linalg.norm(self.xy - np.asarray(t1)[:self.dimensions], axis=1)
+        # Distance to correct target
+        d_2 = np.linalg.norm(self.xy - np.asarray(t2)[:self.dimensions], axis=1)
+        # Log Ratio
+        log_ratio = np.log(d_2 / d_1)
+        # Index corresponding to max log ratio
+        idx = np.argmax(log_ratio)
+        return (log_ratio[idx], *self.xy[idx, :])
+
+    def descriptors(self, t1=None, t2=None) -> dict:
+        '''
+        All descriptors of the trajectory
+        :param t1: alternative target (optional)
+        :param t2: correct target (optional)
+        :return: dictionary with 'max_dev', 'tot_cur' and, if targets are given, 'max_log_ratio'
+            using the same return values as the individual functions
+        '''
+        results = {
+            'max_dev': self.maximum_deviation(),
+            'tot_cur': self.total_curvature()
+        }
+        if t1 is not None and t2 is not None:
+            results['max_log_ratio'] = self.maximal_log_ratio(t1, t2)
+        return results
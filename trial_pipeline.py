@@ -0,0 +1,142 @@
+'''
+Whole processing of one trial: resample -> filter -> velocity -> onset detection -> descriptors.
+The positions stay in one preallocated (n, 3) buffer (columns x, y, z) through all stages, the buffers
+are reused from one trial to the next and the wall time of every stage is reported.
+'''
+
+import time
+
+import numpy as np
+
+from resample import resample_splines_array, resampled_time
+from filter import butter_lowpass_filter
+from derivative import calculate_velocity
+from movement_onset_detection import onset_detection, onset_detection_nd
+from trajectory_geometry import TrajectoryGeometry
+from instrumentation import instrumented
+
+
+def nearest_index(t: np.array, to: float) -> int:
+    '''
+    Index of the sample closest in time to to (t sorted)
+    '''
+    idx_ub = min(np.searchsorted(t, to, side='right'), t.size - 1)
+    idx_lb = max(np.searchsorted(t, to, side='left') - 1, 0)
+    if abs(t[idx_lb] - to) < abs(t[idx_ub] - to):
+        return idx_lb
+    return idx_ub
+
+
+class TrialPipeline:
+    '''
+    Processing of one trial at a time reusing the same buffers
+    '''
+
+    STAGES = ('resample', 'filter', 'velocity', 'onset', 'index', 'descriptors')
+
+    def __init__(self, cutoff=10, fs=90, order=2, delta_T=0.1, vel_th=0.6, resample_fs=None, onset_cache=None,
+                 onset_axes=(0, 2), onset_coarse=None):
+        '''
+        :param cutoff: cutoff frequency of the low-pass filter
+        :param fs: sampling frequency used by the filter
+        :param order: order of the filter
+        :param delta_T: duration of one segment of the onset model (e.g. 0.1 s)
+        :param vel_th: percentage of max velocity (vel_th < 1)
+        :param resample_fs: resample at exactly this frequency. If None, same number of samples as the raw data
+        :param onset_cache: OnsetCache that stores the onset detection results (optional, 2 onset_axes only)
+        :param onset_axes: columns (x: 0, y: 1, z: 2) used by the onset detection, (0, 1, 2) for the 3D motion
+        :param onset_coarse: stride of the coarse-to-fine window search of the onset detection (None: exhaustive)
+        '''
+        if onset_cache is not None and len(onset_axes) != 2:
+            raise ValueError("onset_cache only stores the onset detection of 2 axes")
+        self.cutoff = cutoff
+        self.fs = fs
+        self.order = order
+        self.delta_T = delta_T
+        self.vel_th = vel_th
+        self.resample_fs = resample_fs
+        self.onset_cache = onset_cache
+        self.onset_axes = tuple(onset_axes)
+        self.onset_coarse = onset_coarse
+        self._positions = np.empty((0, 3))
+        self._velocity = np.empty((0, 3))
+
+    def _buffers(self, n: int):
+        if self._positions.shape[0] < n:
+            self._positions = np.empty((n, 3))
+            self._velocity = np.empty((n, 3))
+        return self._positions[:n], self._velocity[:n]
+
+    @instrumented
+    def process_trial(self, t_raw, x_raw, y_raw, z_raw, t_th=np.inf, t1=None, t2=None) -> dict:
+        '''
+        :param t_raw: time (adjusted to zero)
+        :param x_raw: raw data along x
+        :param y_raw: raw data along y
+        :param z_raw: raw data along z
+        :param t_th: temporal threshold of the onset detection
+        :param t1: alternative target (x, z, y), optional
+        :param t2: correct target (x, z, y), optional
+        :return: dictionary with the onset ('t_onset', 'converged', 'adjusted_t', 'idx'), the descriptors
+            ('max_dev_2d', 'max_dev_3d', 'tot_cur_2d', 'tot_cur_3d' and, if targets are given,
+            'max_log_ratio_2d', 'max_log_ratio_3d') and the wall time of every stage ('timings')
+        '''
+        timings = {}
+        clock = time.perf_counter()
+
+        def lap(stage):
+            nonlocal clock
+            now = time.perf_counter()
+            timings[stage] = now - clock
+            clock = now
+
+        # Resampling
+        xyz, v_xyz = self._buffers(resampled_time(np.asarray(t_raw), self.resample_fs).size)
+        t, _ = resample_splines_array(t_raw, x_raw, y_raw, z_raw, fs=self.resample_fs, out=xyz)
+        lap('resample')
+
+        # Filtering
+        xyz[:] = butter_lowpass_filter(xyz, self.cutoff, self.fs, self.order, axis=0)
+        x, y, z = xyz.T
+        lap('filter')
+
+        step = t[1] - t[0]
+        calculate_velocity(step, xyz, out=v_xyz)
+        lap('velocity')
+
+        # Movement Onset Time Detection
+        m = int(self.delta_T / step) - 1
+        axes = self.onset_axes
+        if len(axes) == 2:
+            detect = onset_detection if self.onset_cache is None else self.onset_cache.onset_detection
+            to, _, converged, adjusted_t = detect(m, xyz[:, axes[0]], xyz[:, axes[1]], t, v_xyz[:, axes[0]],
+                                                  v_xyz[:, axes[1]], t_th=t_th, vel_th=self.vel_th, lean=True,
+                                                  coarse=self.onset_coarse)
+        else:
+            to, _, converged, adjusted_t = onset_detection_nd(m, xyz[:, axes], t, v_xyz[:, axes], t_th=t_th,
+                                                              vel_th=self.vel_th, lean=True, coarse=self.onset_coarse)
+        lap('onset')
+
+        idx = nearest_index(t, to)
+        lap('index')
+
+        geometry_2d = TrajectoryGeometry(x[idx:], z[idx:])
+        geometry_3d = TrajectoryGeometry(x[idx:], z[idx:], y[idx:])
+        results = {
+            't_onset': to,
+            'converged': converged,
+            'adjusted_t': adjusted_t,
+            'idx': idx,
+            'max_dev_2d': geometry_2d.maximum_deviation(),
+            'max_dev_3d': geometry_3d.maximum_deviation(),
+            'tot_cur_2d': geometry_2d.total_curvature(),
+            'tot_cur_3d': geometry_3d.total_curvature()
+        }
+        if t1 is not None and t2 is not None:
+            t1, t2 = np.asarray(t1), np.asarray(t2)
+            results['max_log_ratio_2d'] = geometry_2d.maximal_log_ratio(t1[[0, 1]], t2[[0, 1]])
+            results['max_log_ratio_3d'] = geometry_3d.maximal_log_ratio(t1, t2)
+        lap('descriptors')
+
+        results['timings'] = timings
+        return results